@@ -1,11 +1,32 @@
 import os
 import re
+import time
+import sqlite3
+import io
+import sys
+import json
+import random
+import codecs
+import hashlib
+import zlib
+import queue
+import socket
 import asyncio
+import functools
+import threading
+import multiprocessing
+import numpy as np
 import ollama
 import psycopg2
-from psycopg2.extras import execute_values
+from psycopg2.extras import execute_values, Json
+from psycopg2.pool import ThreadedConnectionPool
 from pgvector.psycopg2 import register_vector
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List
+from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
 import google.generativeai as genai
 from google.adk.agents import Agent
 from google.adk.tools import FunctionTool
@@ -13,7 +34,13 @@ from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
 from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
 from google_auth_oauthlib.flow import InstalledAppFlow
+try:
+    import fcntl
+except ImportError:  # Windows: the cache is then only safe within one process
+    fcntl = None
 
 # ============================================
 # CONFIGURATION
@@ -23,10 +50,16 @@ os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY", "YOUR_API_KEY")
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
 
-genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+# Optional Gemini endpoint override, e.g. http://localhost:8080 for a local stub server
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"], transport="rest",
+                    client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
 
 
-PG_CONNECTION = None
+DB_POOL = None
 DB_CONFIG = {
     "dbname": os.getenv("PG_DATABASE", "dam_agent"),
     "user": os.getenv("PG_USER", "postgres"),
@@ -34,125 +67,2039 @@ DB_CONFIG = {
     "host": os.getenv("PG_HOST", "localhost"),
     "port": os.getenv("PG_PORT", "5432")
 }
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_PING_SECONDS = int(os.getenv("DB_POOL_PING_SECONDS", "30"))
+
+# Vector indexes: "hnsw" or "ivfflat"; search-time defaults for the "balanced" recall level
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "0"))
+VECTOR_INDEX_BUILD_MEM = os.getenv("VECTOR_INDEX_BUILD_MEM", "512MB")
+# Seconds a process trusts its cached view of the indexes, which other processes may rebuild
+VECTOR_INDEX_INFO_TTL_SECONDS = float(os.getenv("VECTOR_INDEX_INFO_TTL_SECONDS", "60"))
+
+# What the vector indexes hold: "full" (float32), "halfvec" (float16) or "binary"
+# (1 bit per dimension); quantized candidates are re-ranked at full precision
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "10"))
+
+# Hybrid search: full-text config, RRF constant and ANN/lexical candidates per result
+FULLTEXT_CONFIG = os.getenv("FULLTEXT_CONFIG", "english")
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "5"))
+
+# Result preview lengths (baked into generated columns at first init)
+CHUNK_PREVIEW_CHARS = int(os.getenv("CHUNK_PREVIEW_CHARS", "300"))
+DOCUMENT_PREVIEW_CHARS = int(os.getenv("DOCUMENT_PREVIEW_CHARS", "200"))
+
+# Filtered search: ANN candidates fetched per result, and the most tried before an exact scan
+FILTER_OVERFETCH = int(os.getenv("FILTER_OVERFETCH", "10"))
+FILTER_MAX_CANDIDATES = int(os.getenv("FILTER_MAX_CANDIDATES", "1000"))
+
+# Search result cache entries (0 disables); entries die when the corpus changes
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+# How long the corpus version read from Postgres is trusted (0 reads it on every search)
+SEARCH_CACHE_VERSION_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_VERSION_TTL_SECONDS", "1"))
 
 DETECTED_ISSUES = []
 PENDING_APPROVALS = []
 DRIVE_SERVICE = None
-CHUNK_CACHE = {}  
+
+# In-process ROM cache of processed chunks (bounded by bytes and age)
+CHUNK_CACHE_MAX_BYTES = int(os.getenv("CHUNK_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CHUNK_CACHE_TTL_SECONDS = int(os.getenv("CHUNK_CACHE_TTL_SECONDS", "86400"))
+
+# PII/quality scanning process pool (0 = scan in the calling thread)
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", str(os.cpu_count() or 1)))
+SCAN_POOL_MIN_CHARS = int(os.getenv("SCAN_POOL_MIN_CHARS", "262144"))
+SCAN_START_METHOD = os.getenv("SCAN_START_METHOD", "spawn")
+SCAN_POOL = None
+
+# Concurrent ingestion: worker pool size per pipeline stage
+INGEST_WORKERS = {
+    "download": int(os.getenv("INGEST_DOWNLOAD_WORKERS", "4")),
+    "summarize": int(os.getenv("INGEST_SUMMARIZE_WORKERS", "4")),
+    "embed": int(os.getenv("INGEST_EMBED_WORKERS", "2")),
+    "scan": int(os.getenv("INGEST_SCAN_WORKERS", str(max(1, SCAN_WORKERS)))),
+    "write": int(os.getenv("INGEST_WRITE_WORKERS", "1"))
+}
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+
+# Resumable batch runs: a Postgres queue of file x stage jobs shared by every ingest
+# worker. A running job whose worker stops heartbeating for JOB_LEASE_SECONDS is
+# retried, up to JOB_MAX_ATTEMPTS times in all.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+
+# Embeddings: texts per Ollama request and requests in flight
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_DIM = 768
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "2"))
+DB_WRITE_PAGE_SIZE = int(os.getenv("DB_WRITE_PAGE_SIZE", "500"))
+
+# Corpus-wide dedupe: documents per side of each similarity tile
+DEDUPE_BLOCK_ROWS = int(os.getenv("DEDUPE_BLOCK_ROWS", "2048"))
+
+# Chunking: "fixed" (1000-character windows, 200 overlap), or "sentence", "paragraph"
+# or "heading"-aware chunks of CHUNK_TOKENS estimated tokens repeating up to
+# CHUNK_OVERLAP_TOKENS of whole sentences. Chunks never exceed EMBED_CONTEXT_TOKENS,
+# Ollama's default context for nomic-embed-text
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "fixed")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+EMBED_CONTEXT_TOKENS = int(os.getenv("EMBED_CONTEXT_TOKENS", "2048"))
+
+# Streaming: files above the threshold are chunked as bytes arrive
+STREAM_THRESHOLD_BYTES = int(os.getenv("STREAM_THRESHOLD_BYTES", str(20 * 1024 * 1024)))
+DOWNLOAD_CHUNK_BYTES = int(os.getenv("DOWNLOAD_CHUNK_BYTES", str(4 * 1024 * 1024)))
+STREAM_WINDOW_CHUNKS = int(os.getenv("STREAM_WINDOW_CHUNKS", "64"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gemini-2.0-flash-exp")
+
+# Summaries: chunks packed per Gemini request, requests in flight, the API's
+# requests/tokens per minute limits, and retries (exponential backoff from the base delay)
+# "eager" summarizes every chunk at ingest; "lazy" embeds the raw chunk text and
+# summarizes a chunk the first time search_chunks returns it
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "eager")
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_RPM = int(os.getenv("SUMMARY_RPM", "300"))
+SUMMARY_TPM = int(os.getenv("SUMMARY_TPM", "1000000"))
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", "5"))
+SUMMARY_BACKOFF_SECONDS = float(os.getenv("SUMMARY_BACKOFF_SECONDS", "1"))
+
+# Persistent embedding/summary cache (empty EMBEDDING_CACHE_DIR disables it)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".dam_cache")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "100000"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "100000"))
+PERSISTENT_CACHE = None
+
+# Near-duplicate index: MinHash over word shingles, split into LSH bands
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "32"))
+MINHASH_SHINGLE_WORDS = int(os.getenv("MINHASH_SHINGLE_WORDS", "5"))
+MINHASH_THRESHOLD = float(os.getenv("MINHASH_THRESHOLD", "0.5"))
+
+# ============================================
+# POSTGRESQL + PGVECTOR SETUP
+# ============================================
+
+class _VectorConnectionPool(ThreadedConnectionPool):
+    """Thread-safe pool whose connections all have pgvector types registered
+    
+    Checkout blocks once DB_POOL_MAX connections are in use instead of
+    raising PoolError, so worker pools larger than the DB pool just queue.
+    """
+    
+    def __init__(self, minconn: int, maxconn: int, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        super().__init__(minconn, maxconn, **kwargs)
+    
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        register_vector(conn)
+        conn.commit()
+        return conn
+    
+    def checkout(self):
+        """Get a live connection, replacing any that died while idle"""
+        self._slots.acquire()
+        try:
+            for _ in range(self.maxconn + 1):
+                conn = self.getconn()
+                idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+                if not conn.closed and (idle < DB_POOL_PING_SECONDS or self._ping(conn)):
+                    return conn
+                self.putconn(conn, close=True)
+            raise psycopg2.OperationalError("No live database connection available")
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def checkin(self, conn, broken: bool = False):
+        close = broken or bool(conn.closed)
+        if close:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+    
+    @staticmethod
+    def _ping(conn) -> bool:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+
+@contextmanager
+def _db_cursor(name: str = None):
+    """Check out a pooled connection for one unit of work
+    
+    Commits on success and rolls back on error, so one failed call never
+    poisons later ones. Connections that dropped are discarded rather than
+    returned, and the pool opens a fresh one on the next checkout. A name
+    opens a server-side cursor that streams rows instead of buffering them.
+    """
+    conn = DB_POOL.checkout()
+    broken = False
+    try:
+        with conn.cursor(name=name) as cursor:
+            yield cursor
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        DB_POOL.checkin(conn, broken)
+
+
+def _offload(func):
+    """Async variant of a blocking tool for the ADK Runner event loop
+    
+    The call runs in a worker thread with its own pooled connection, so
+    concurrent tool calls neither block the loop nor share a socket.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return wrapper
+
+
+def initialize_database(vector_storage: str = ""):
+    """Initialize PostgreSQL with pgvector extension
+    
+    Args:
+        vector_storage: "full", "halfvec" (2x smaller indexes) or "binary"
+            (32x smaller, needs more re-ranking); rebuilds the vector indexes
+            when they differ. Default: keep existing indexes (VECTOR_STORAGE
+            for new ones).
+    """
+    global DB_POOL
+    
+    try:
+        # The vector type must exist before pooled connections can register it
+        bootstrap = psycopg2.connect(**DB_CONFIG)
+        try:
+            with bootstrap.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+            bootstrap.commit()
+        finally:
+            bootstrap.close()
+        
+        if DB_POOL is None:
+            DB_POOL = _VectorConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+        
+        with _db_cursor() as cursor:
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id SERIAL PRIMARY KEY,
+                    file_id VARCHAR(255) UNIQUE NOT NULL,
+                    filename VARCHAR(500) NOT NULL,
+                    content TEXT,
+                    content_hash VARCHAR(64),
+                    embedding vector(768),
+                    metadata JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            
+            # Tables created before content hashing lack the column
+            cursor.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);")
+            
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS documents_content_hash_idx 
+                ON documents (content_hash);
+            """)
+            
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS document_chunks (
+                    id SERIAL PRIMARY KEY,
+                    file_id VARCHAR(255) NOT NULL,
+                    chunk_id INTEGER NOT NULL,
+                    chunk_text TEXT,
+                    summary TEXT,
+                    embedding vector(768),
+                    metadata JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(file_id, chunk_id)
+                );
+            """)
+            
+            # Identical chunks in other files reuse the stored summary and embedding
+            cursor.execute("ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS chunk_hash VARCHAR(32);")
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS chunks_hash_idx 
+                ON document_chunks (chunk_hash);
+            """)
+            
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS drive_sync_state (
+                    name VARCHAR(100) PRIMARY KEY,
+                    value TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS file_fingerprints (
+                    file_id VARCHAR(255) PRIMARY KEY,
+                    md5_checksum VARCHAR(64),
+                    modified_time VARCHAR(64),
+                    size BIGINT,
+                    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS file_fingerprints_md5_idx 
+                ON file_fingerprints (md5_checksum);
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS document_minhash (
+                    file_id VARCHAR(255) PRIMARY KEY,
+                    signature BYTEA NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS document_lsh_bands (
+                    band SMALLINT NOT NULL,
+                    bucket BIGINT NOT NULL,
+                    file_id VARCHAR(255) NOT NULL,
+                    PRIMARY KEY (band, bucket, file_id)
+                );
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS lsh_bands_file_idx 
+                ON document_lsh_bands (file_id);
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_runs (
+                    run_id VARCHAR(64) PRIMARY KEY,
+                    listing JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                );
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    run_id VARCHAR(64) NOT NULL,
+                    file_id VARCHAR(255) NOT NULL,
+                    step SMALLINT NOT NULL,
+                    stage VARCHAR(32) NOT NULL,
+                    position INTEGER NOT NULL,
+                    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker VARCHAR(255),
+                    heartbeat TIMESTAMP,
+                    file_info JSONB NOT NULL,
+                    duplicate_of JSONB,
+                    result JSONB,
+                    error TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (run_id, file_id, step)
+                );
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS ingest_jobs_claim_idx 
+                ON ingest_jobs (run_id, status, position, step);
+            """)
+            
+            
+            _ensure_fulltext_columns(cursor)
+            _ensure_preview_columns(cursor)
+            
+            # Metadata filters: @> containment (mime_type, owner) and modified date ranges
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS documents_metadata_idx 
+                ON documents USING gin (metadata jsonb_path_ops);
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS documents_modified_idx 
+                ON documents ((metadata->>'modified'));
+            """)
+            _ensure_corpus_version(cursor)
+            
+            # IVFFlat indexes wait for data; build_vector_indexes sizes them after a bulk load
+            for table in VECTOR_INDEXES:
+                _build_vector_index(cursor, table, VECTOR_INDEX_TYPE, only_missing=not vector_storage,
+                                    storage=vector_storage)
+            storage = _vector_index(cursor, "document_chunks").get("storage") or vector_storage or VECTOR_STORAGE
+        SEARCH_CACHE.clear()
+        
+        return {"status": "success", "message": f"PostgreSQL + pgvector initialized with chunking support (pool of up to {DB_POOL_MAX} connections, {storage} vector storage)"}
+    except Exception as e:
+        return {"status": "error", "message": f"Database init failed: {str(e)}"}
+
+
+def _bulk_upsert_chunks(cursor, file_id: str, filename: str, chunks: List[Dict], prune: bool = True) -> int:
+    """Upsert chunks of one file with multi-row INSERTs
+    
+    With prune, chunks past the last one given (left over from a longer
+    previous version of the file) are removed. A chunk written without a
+    summary (lazy mode) keeps the one already stored if its text is
+    unchanged, and one without an embedding (a queued run's summarize
+    checkpoint) is stored with NULL. The caller owns the transaction.
+    """
+    execute_values(cursor, """
+        INSERT INTO document_chunks 
+        (file_id, chunk_id, chunk_text, chunk_hash, summary, embedding, metadata)
+        VALUES %s
+        ON CONFLICT (file_id, chunk_id) DO UPDATE
+        SET chunk_text = EXCLUDED.chunk_text,
+            chunk_hash = EXCLUDED.chunk_hash,
+            summary = coalesce(EXCLUDED.summary, CASE WHEN document_chunks.chunk_text = EXCLUDED.chunk_text
+                                                      THEN document_chunks.summary END),
+            embedding = EXCLUDED.embedding,
+            metadata = EXCLUDED.metadata;
+    """, [
+        (
+            file_id,
+            chunk["chunk_id"],
+            chunk["text"],
+            chunk.get("hash"),
+            chunk["summary"],
+            chunk.get("embedding"),
+            Json({"start_pos": chunk["start_pos"], "end_pos": chunk["end_pos"], "filename": filename})
+        )
+        for chunk in chunks
+    ], page_size=DB_WRITE_PAGE_SIZE)
+    
+    if prune:
+        _prune_chunks(cursor, file_id, chunks[-1]["chunk_id"] + 1 if chunks else 0)
+    return len(chunks)
+
+
+def _prune_chunks(cursor, file_id: str, chunk_count: int):
+    """Remove chunks left over from a longer previous version of the file"""
+    cursor.execute(
+        "DELETE FROM document_chunks WHERE file_id = %s AND chunk_id >= %s;",
+        (file_id, chunk_count)
+    )
+
+
+def _drop_chunks(file_id: str):
+    """Remove every stored chunk of a file that has become too small to chunk"""
+    if DB_POOL:
+        with _db_cursor() as cursor:
+            _prune_chunks(cursor, file_id, 0)
+
+
+def _bulk_upsert_documents(cursor, documents: List[Dict]) -> int:
+    """Upsert many documents rows with multi-row INSERTs
+    
+    Each dict carries file_id, filename, content, embedding and metadata,
+    plus an optional content_hash. Metadata is merged into the stored keys
+    rather than replacing them. The caller owns the transaction.
+    """
+    execute_values(cursor, """
+        INSERT INTO documents (file_id, filename, content, content_hash, embedding, metadata)
+        VALUES %s
+        ON CONFLICT (file_id) DO UPDATE 
+        SET filename = EXCLUDED.filename,
+            content = EXCLUDED.content,
+            content_hash = EXCLUDED.content_hash,
+            embedding = EXCLUDED.embedding,
+            metadata = documents.metadata || EXCLUDED.metadata;
+    """, [
+        (doc["file_id"], doc["filename"], doc["content"], doc.get("content_hash"), doc["embedding"],
+         Json(doc.get("metadata") or {}))
+        for doc in documents
+    ], page_size=DB_WRITE_PAGE_SIZE)
+    return len(documents)
+
+
+# ============================================
+# VECTOR INDEX MANAGEMENT
+# ============================================
+
+VECTOR_INDEXES = {
+    "documents": "documents_embedding_idx",
+    "document_chunks": "chunks_embedding_idx"
+}
+SEARCH_RECALL_LEVELS = ("fast", "balanced", "high", "exact")
+# storage: (indexed expression, operator class, distance operator, query vector)
+VECTOR_STORAGE_MODES = {
+    "full": ("{column}", "vector_cosine_ops", "<=>", "%(embedding)s::vector"),
+    "halfvec": (f"({{column}}::halfvec({EMBEDDING_DIM}))", "halfvec_cosine_ops", "<=>",
+                f"%(embedding)s::vector::halfvec({EMBEDDING_DIM})"),
+    "binary": (f"(binary_quantize({{column}})::bit({EMBEDDING_DIM}))", "bit_hamming_ops", "<~>",
+               f"binary_quantize(%(embedding)s::vector)::bit({EMBEDDING_DIM})")
+}
+# table: (monotonic read time, index info)
+_VECTOR_INDEX_INFO = {}
+
+
+def _ivfflat_lists(rows: int) -> int:
+    """pgvector's guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond"""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(rows ** 0.5)
+
+
+def _read_vector_index(cursor, table: str) -> Dict:
+    """Type and build parameters of a table's embedding index, from pg_indexes"""
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname = %s;",
+        (table, VECTOR_INDEXES[table])
+    )
+    row = cursor.fetchone()
+    if not row:
+        info = {"type": None}
+    else:
+        match = re.search(r"USING (\w+)", row[0])
+        info = {
+            "type": match.group(1) if match else None,
+            "storage": "binary" if "binary_quantize" in row[0] else "halfvec" if "halfvec" in row[0] else "full"
+        }
+        info.update({name: int(value) for name, value in re.findall(r"(\w+)='?(\d+)'?", row[0])})
+    _VECTOR_INDEX_INFO[table] = (time.monotonic(), info)
+    return info
+
+
+def _vector_index(cursor, table: str) -> Dict:
+    """Cached _read_vector_index, re-read after VECTOR_INDEX_INFO_TTL_SECONDS
+    
+    Indexes rebuilt here refresh the cache at once; the TTL bounds how long
+    a rebuild by another process (a different type or storage mode) goes
+    unnoticed.
+    """
+    cached = _VECTOR_INDEX_INFO.get(table)
+    if cached and time.monotonic() - cached[0] < VECTOR_INDEX_INFO_TTL_SECONDS:
+        return cached[1]
+    return _read_vector_index(cursor, table)
+
+
+def _ann_distance(storage: str, column: str = "embedding") -> str:
+    """Distance expression to the %(embedding)s query that the storage mode's index can order by"""
+    expression, _, operator, query = VECTOR_STORAGE_MODES[storage]
+    return f"{expression.format(column=column)} {operator} {query}"
+
+
+def _ann_storage(cursor, table: str, recall: str) -> str:
+    """Storage mode a search at this recall level scans; "exact" always uses full precision"""
+    index = _vector_index(cursor, table)
+    if recall == "exact" or not index["type"]:
+        return "full"
+    return index.get("storage", "full")
+
+
+def _build_vector_index(cursor, table: str, index_type: str, rebuild: bool = False,
+                        only_missing: bool = False, params: Dict = None, storage: str = "") -> Dict:
+    """Create or rebuild one embedding index. The caller owns the transaction.
+    
+    HNSW is built with HNSW_M / HNSW_EF_CONSTRUCTION and works on an empty
+    table. IVFFlat learns its lists from existing rows, so it is sized from
+    the row count and skipped while the table is empty. An index is rebuilt
+    when its type, storage or parameters differ from the target, or when an
+    IVFFlat index is off its target lists by more than 2x. params overrides
+    the build parameters (m, ef_construction or lists). storage defaults to
+    the current index's, then VECTOR_STORAGE; halfvec and binary index an
+    expression over the full-precision column, which stays for re-ranking.
+    """
+    index_name = VECTOR_INDEXES[table]
+    current = _read_vector_index(cursor, table)
+    storage = storage or (current["storage"] if current["type"] else VECTOR_STORAGE)
+    if storage not in VECTOR_STORAGE_MODES:
+        raise ValueError(f"vector storage must be one of {', '.join(VECTOR_STORAGE_MODES)}")
+    if storage != "full" and _pgvector_version(cursor) < (0, 7):
+        raise ValueError(f"{storage} vector storage needs pgvector 0.7 or later")
+    cursor.execute(f"SELECT count(*) FROM {table} WHERE embedding IS NOT NULL;")
+    rows = cursor.fetchone()[0]
+    
+    if index_type == "hnsw":
+        target = {"type": "hnsw", "storage": storage, "m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, **(params or {})}
+        stale = any(current.get(key) != value for key, value in target.items())
+    elif index_type == "ivfflat":
+        if not rows:
+            return {"table": table, "rows": 0, "index": current, "action": "skipped (no rows for IVFFlat to learn lists from)"}
+        target = {"type": "ivfflat", "storage": storage, "lists": _ivfflat_lists(rows), **(params or {})}
+        lists = current.get("lists") or 0
+        stale = (current["type"] != "ivfflat" or current.get("storage") != storage
+                 or not (target["lists"] / 2 <= lists <= target["lists"] * 2))
+    else:
+        raise ValueError(f"Unknown vector index type: {index_type}")
+    
+    if current["type"] and (only_missing or not (stale or rebuild)):
+        return {"table": table, "rows": rows, "index": current, "action": "kept"}
+    
+    started = time.perf_counter()
+    cursor.execute("SELECT set_config('maintenance_work_mem', %s, true);", (VECTOR_INDEX_BUILD_MEM,))
+    cursor.execute(f"DROP INDEX IF EXISTS {index_name};")
+    params = ", ".join(f"{key} = {value}" for key, value in target.items() if key not in ("type", "storage"))
+    expression, operator_class, _, _ = VECTOR_STORAGE_MODES[storage]
+    cursor.execute(f"""
+        CREATE INDEX {index_name} 
+        ON {table} USING {index_type} ({expression.format(column="embedding")} {operator_class})
+        WITH ({params});
+    """)
+    return {
+        "table": table,
+        "rows": rows,
+        "index": _read_vector_index(cursor, table),
+        "action": "rebuilt" if current["type"] else "created",
+        "build_seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+def build_vector_indexes(index_type: str = "", rebuild: bool = False, storage: str = "") -> Dict:
+    """Build or retune the embedding indexes, e.g. after a bulk load
+    
+    Args:
+        index_type: "hnsw" or "ivfflat" (default: VECTOR_INDEX_TYPE)
+        rebuild: Rebuild even if the current index already matches
+        storage: "full", "halfvec" or "binary" (default: keep the current one)
+    """
+    if not DB_POOL:
+        return {"status": "error", "message": "Database not initialized"}
+    
+    index_type = index_type or VECTOR_INDEX_TYPE
+    try:
+        indexes = []
+        for table in VECTOR_INDEXES:
+            with _db_cursor() as cursor:
+                indexes.append(_build_vector_index(cursor, table, index_type, rebuild, storage=storage))
+        # A different index can change approximate results without touching the corpus
+        SEARCH_CACHE.clear()
+        return {"status": "success", "index_type": index_type, "indexes": indexes}
+    except Exception as e:
+        return {"status": "error", "message": f"Index build failed: {str(e)}"}
+
+
+def _tune_vector_search(cursor, table: str, recall: str, limit: int, widen: int = 1) -> str:
+    """Apply the recall/latency level to this transaction's ANN scan
+    
+    "exact" disables index scans so the query is a brute-force scan; the other
+    levels scale hnsw.ef_search (never below limit, at most pgvector's 1000)
+    or ivfflat.probes, which widen multiplies. Returns a description of the
+    setting used.
+    """
+    if recall not in SEARCH_RECALL_LEVELS:
+        raise ValueError(f"recall must be one of {', '.join(SEARCH_RECALL_LEVELS)}")
+    
+    index = _vector_index(cursor, table)
+    if recall == "exact" or not index["type"]:
+        cursor.execute("SELECT set_config('enable_indexscan', 'off', true);")
+        return "exact (sequential scan)"
+    
+    scale = {"fast": 0.5, "balanced": 1, "high": 4}[recall]
+    if index["type"] == "hnsw":
+        ef_search = min(1000, max(int(HNSW_EF_SEARCH * scale), limit))
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true);", (str(ef_search),))
+        return f"hnsw (ef_search={ef_search})"
+    
+    lists = index.get("lists") or 1
+    probes = min(lists, max(1, int((IVFFLAT_PROBES or round(lists ** 0.5)) * scale * widen)))
+    cursor.execute("SELECT set_config('ivfflat.probes', %s, true);", (str(probes),))
+    return f"ivfflat (probes={probes} of {lists} lists)"
+
+
+# ============================================
+# HYBRID (FULL-TEXT + VECTOR) SEARCH
+# ============================================
+
+SEARCH_MODES = ("vector", "hybrid")
+FULLTEXT_COLUMNS = {
+    "documents": ("content", "content_tsv", "documents_content_tsv_idx"),
+    "document_chunks": ("chunk_text", "chunk_tsv", "chunks_text_tsv_idx")
+}
+
+
+def _ensure_fulltext_columns(cursor):
+    """Generated tsvector columns with GIN indexes. The caller owns the transaction."""
+    for table, (source, column, index_name) in FULLTEXT_COLUMNS.items():
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} tsvector
+            GENERATED ALWAYS AS (to_tsvector('{FULLTEXT_CONFIG}', coalesce({source}, ''))) STORED;
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {index_name} 
+            ON {table} USING gin ({column});
+        """)
+
+
+def _hybrid_fused_sql(table: str, condition: str = "", storage: str = "full") -> str:
+    """CTE ranking table rows by reciprocal rank fusion of ANN and full-text ranks
+    
+    The fused CTE yields (id, score) with score = w / (k + lexical rank) +
+    (1 - w) / (k + vector rank). Parameters: embedding, query, candidates,
+    lexical_weight and rrf_k. Without a metadata condition both candidate
+    lists are computed inside the one statement; with quantized storage the
+    ANN candidates come from the quantized index and are ranked at full
+    precision. With a condition (see _metadata_filter) the ANN ids arrive
+    ranked in an ann_ids parameter, from _hybrid_search, and the condition
+    is applied to the full-text retrieval.
+    """
+    _, column, _ = FULLTEXT_COLUMNS[table]
+    source = _filtered_source(table, condition)
+    if condition:
+        ann = "SELECT id, rank FROM unnest(%(ann_ids)s::int[]) WITH ORDINALITY AS ranked (id, rank)"
+    else:
+        ann = f"""
+            SELECT id, row_number() OVER (ORDER BY distance) AS rank
+            FROM (
+                SELECT t.id, t.embedding <=> %(embedding)s::vector AS distance
+                FROM {source}
+                ORDER BY {_ann_distance(storage, "t.embedding")}
+                LIMIT %(candidates)s
+            ) nearest"""
+    return f"""
+        WITH ann AS ({ann}
+        ),
+        lexical AS (
+            SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+            FROM (
+                SELECT t.id, ts_rank_cd(t.{column}, terms) AS score
+                FROM {source}, websearch_to_tsquery('{FULLTEXT_CONFIG}', %(query)s) terms
+                WHERE t.{column} @@ terms {"AND " + condition if condition else ""}
+                ORDER BY score DESC
+                LIMIT %(candidates)s
+            ) matches
+        ),
+        fused AS (
+            SELECT id, sum(score) AS score
+            FROM (
+                SELECT id, (1 - %(lexical_weight)s::float8) / (%(rrf_k)s + rank) AS score FROM ann
+                UNION ALL
+                SELECT id, %(lexical_weight)s::float8 / (%(rrf_k)s + rank) FROM lexical
+            ) ranks
+            GROUP BY id
+        )
+    """
+
+
+def _hybrid_search(cursor, table: str, condition: str, params: Dict, recall: str, select_sql: str) -> tuple:
+    """Run select_sql over the fused CTE of _hybrid_fused_sql; returns (rows, index strategy)
+    
+    With a metadata condition the ANN candidates come from _vector_search,
+    so the iterative scan, over-fetch and exact fallback there fill the
+    candidate list despite the filter, just as for plain vector search.
+    """
+    storage = _ann_storage(cursor, table, recall)
+    if condition:
+        join = "JOIN documents d ON d.file_id = t.file_id" if table == "document_chunks" else ""
+        ann, index_used = _vector_search(cursor, table, lambda source: f"""
+            SELECT t.id, 1 - (t.embedding <=> %(embedding)s::vector) AS similarity
+            FROM {source} t
+            {join}
+            WHERE {condition}
+            ORDER BY t.embedding <=> %(embedding)s::vector
+            LIMIT %(candidates)s;
+        """, params, params["candidates"], recall, filtered=True)
+        params = {**params, "ann_ids": [row[0] for row in ann]}
+        # An exact fallback disables index scans, which the full-text side still wants
+        cursor.execute("SELECT set_config('enable_indexscan', 'on', true);")
+    else:
+        index_used = _tune_vector_search(cursor, table, recall, params["candidates"])
+        if storage != "full":
+            index_used += f", {storage} candidates re-ranked at full precision"
+    cursor.execute(_hybrid_fused_sql(table, condition, storage) + select_sql, params)
+    return cursor.fetchall(), index_used
+
+
+def _hybrid_params(query: str, embedding: np.ndarray, limit: int, lexical_weight: float) -> Dict:
+    if not 0 <= lexical_weight <= 1:
+        raise ValueError("lexical_weight must be between 0 and 1")
+    return {
+        "embedding": embedding,
+        "query": query,
+        "limit": limit,
+        "candidates": max(limit * HYBRID_CANDIDATE_FACTOR, 20),
+        "lexical_weight": float(lexical_weight),
+        "rrf_k": RRF_K
+    }
+
+
+# ============================================
+# RESULT PREVIEWS AND FULL-TEXT FETCH
+# ============================================
+
+PREVIEW_COLUMNS = {
+    "documents": ("content", DOCUMENT_PREVIEW_CHARS),
+    "document_chunks": ("chunk_text", CHUNK_PREVIEW_CHARS)
+}
+
+
+def _ensure_preview_columns(cursor):
+    """Generated preview columns so searches never read the full (TOASTed) text
+    
+    The preview is short enough to stay inline in the heap tuple; full text
+    is fetched on demand with get_full_text. The caller owns the transaction.
+    """
+    for table, (source, length) in PREVIEW_COLUMNS.items():
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS preview TEXT
+            GENERATED ALWAYS AS (
+                CASE WHEN length({source}) > {length} THEN left({source}, {length}) || '...' ELSE {source} END
+            ) STORED;
+        """)
+
+
+def get_full_text(file_id: str, chunk_id: int = -1) -> Dict:
+    """Fetch the full text behind a search result (searches only return previews)
+    
+    Args:
+        file_id: file_id from a search result
+        chunk_id: chunk_id from a search_chunks result, or -1 for the
+            document text (the first 10,000 characters of the file)
+    """
+    if not DB_POOL:
+        return {"status": "error", "message": "Database not initialized"}
+    
+    try:
+        with _db_cursor() as cursor:
+            if chunk_id >= 0:
+                cursor.execute("""
+                    SELECT metadata->>'filename', chunk_text,
+                           (metadata->>'start_pos')::int, (metadata->>'end_pos')::int
+                    FROM document_chunks
+                    WHERE file_id = %s AND chunk_id = %s;
+                """, (file_id, chunk_id))
+            else:
+                cursor.execute("""
+                    SELECT filename, content, NULL, NULL
+                    FROM documents
+                    WHERE file_id = %s;
+                """, (file_id,))
+            row = cursor.fetchone()
+        
+        if not row:
+            return {"status": "error", "message": f"No indexed text for {file_id}" +
+                    (f" chunk {chunk_id}" if chunk_id >= 0 else "")}
+        
+        result = {
+            "status": "success",
+            "file_id": file_id,
+            "filename": row[0],
+            "text": row[1],
+            "length": len(row[1] or "")
+        }
+        if chunk_id >= 0:
+            result.update({"chunk_id": chunk_id, "start_pos": row[2], "end_pos": row[3]})
+        return result
+    except Exception as e:
+        return {"status": "error", "message": f"Fetch failed: {str(e)}"}
+
+
+# ============================================
+# METADATA-FILTERED SEARCH
+# ============================================
+
+METADATA_FILTERS = ("filename", "mime_type", "owner", "modified_after", "modified_before")
+_PGVECTOR_VERSION = None
+
+
+def _pgvector_version(cursor) -> tuple:
+    global _PGVECTOR_VERSION
+    if _PGVECTOR_VERSION is None:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+        row = cursor.fetchone()
+        _PGVECTOR_VERSION = tuple(int(part) for part in re.findall(r"\d+", row[0])) if row else ()
+    return _PGVECTOR_VERSION
+
+
+def _iso_date(value: str) -> str:
+    """Validate an ISO 8601 date; Drive's modifiedTime strings compare correctly against it as text"""
+    datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    return value.strip()
+
+
+def _metadata_filter(filters: Dict, alias: str) -> tuple:
+    """SQL condition and params for file metadata filters on a documents alias
+    
+    mime_type and owner use the GIN index on metadata through @>, the date
+    bounds use the expression index on metadata->>'modified', and filename
+    is a case-insensitive substring match.
+    """
+    clauses, params = [], {}
+    if filters.get("filename"):
+        clauses.append(f"{alias}.filename ILIKE %(filename)s")
+        params["filename"] = "%" + re.sub(r"([%_\\])", r"\\\1", filters["filename"]) + "%"
+    contains = {key: filters[key] for key in ("mime_type", "owner") if filters.get(key)}
+    if contains:
+        clauses.append(f"{alias}.metadata @> %(contains)s")
+        params["contains"] = Json(contains)
+    for key, operator in (("modified_after", ">="), ("modified_before", "<")):
+        if filters.get(key):
+            clauses.append(f"{alias}.metadata->>'modified' {operator} %({key})s")
+            params[key] = _iso_date(filters[key])
+    return " AND ".join(clauses), params
+
+
+def _filtered_source(table: str, condition: str) -> str:
+    """FROM item for table (aliased t) that exposes the documents row as d when filtering"""
+    if table == "documents":
+        return "documents t"
+    if condition:
+        return "document_chunks t JOIN documents d ON d.file_id = t.file_id"
+    return "document_chunks t"
+
+
+def _ann_source(table: str, storage: str, candidates: int) -> str:
+    """FROM item with the table's nearest candidates by its vector index"""
+    return f"""(
+                    SELECT * FROM {table}
+                    ORDER BY {_ann_distance(storage)}
+                    LIMIT {candidates}
+                )"""
+
+
+def _vector_search(cursor, table: str, build_sql, params: Dict, limit: int, recall: str,
+                   filtered: bool = False) -> tuple:
+    """Run an ANN query at the recall level, re-ranking quantized candidates
+    
+    build_sql(source) must return the query with source as the FROM item for
+    the searched table, aliased t, ordered by full-precision distance and
+    selecting that as a similarity column. With
+    full storage an unfiltered query scans the index directly. Quantized
+    storage (halfvec, binary) takes RERANK_FACTOR x limit candidates from the
+    index and build_sql re-ranks them at full precision.
+    
+    For filtered queries a full page has to survive the filters. With pgvector
+    0.8+ and full storage the index scan itself keeps going until enough rows
+    pass (iterative scan; IVFFlat only supports relaxed order, so its rows
+    are re-sorted by similarity). Otherwise ANN candidates are over-fetched and
+    filtered, widening the pool (and ef_search or probes) 4x per round up to
+    FILTER_MAX_CANDIDATES. Whatever is still short falls back to an exact
+    scan, which the metadata indexes keep cheap for selective filters.
+    Returns (rows, strategy).
+    """
+    if recall not in SEARCH_RECALL_LEVELS:
+        raise ValueError(f"recall must be one of {', '.join(SEARCH_RECALL_LEVELS)}")
+    
+    index = _vector_index(cursor, table)
+    storage = _ann_storage(cursor, table, recall)
+    if recall != "exact" and index["type"]:
+        if storage == "full" and (not filtered or _pgvector_version(cursor) >= (0, 8)):
+            setting = _tune_vector_search(cursor, table, recall, limit)
+            sql = build_sql(table)
+            if filtered:
+                order = "strict_order" if index["type"] == "hnsw" else "relaxed_order"
+                cursor.execute("SELECT set_config(%s, %s, true);", (f"{index['type']}.iterative_scan", order))
+                setting += f", iterative scan ({order})"
+                if order == "relaxed_order":
+                    sql = f"""
+                        WITH relaxed AS MATERIALIZED ({sql.strip().rstrip(";")})
+                        SELECT * FROM relaxed ORDER BY similarity DESC;
+                    """
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            if len(rows) >= limit or not filtered:
+                return rows, setting
+        else:
+            candidates = limit * max(FILTER_OVERFETCH if filtered else 1, RERANK_FACTOR if storage != "full" else 1)
+            widen = 1
+            while not filtered or candidates <= FILTER_MAX_CANDIDATES:
+                setting = _tune_vector_search(cursor, table, recall, candidates, widen)
+                cursor.execute(build_sql(_ann_source(table, storage, candidates)), params)
+                rows = cursor.fetchall()
+                if len(rows) >= limit or not filtered:
+                    strategy = f"over-fetch of {candidates}" if filtered else f"top {candidates}"
+                    if storage != "full":
+                        strategy += f" {storage} candidates re-ranked at full precision"
+                    else:
+                        strategy += " candidates"
+                    return rows, f"{setting}, {strategy}"
+                candidates, widen = candidates * 4, widen * 4
+    
+    cursor.execute("SELECT set_config('enable_indexscan', 'off', true);")
+    cursor.execute(build_sql(table), params)
+    return cursor.fetchall(), "exact (filtered scan)" if filtered else "exact (sequential scan)"
+
+
+# ============================================
+# SEARCH RESULT CACHE
+# ============================================
+
+def _ensure_corpus_version(cursor):
+    """Trigger-maintained corpus version, bumped by any change to documents or chunks
+    
+    The bump is a deferred constraint trigger that runs once per transaction
+    at commit, so the new version becomes visible atomically with the data
+    and concurrent writers hold the counter row only for their commit.
+    The caller owns the transaction.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS corpus_version (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version BIGINT NOT NULL DEFAULT 0
+        );
+        INSERT INTO corpus_version (id, version) VALUES (TRUE, 0) ON CONFLICT DO NOTHING;
+        
+        CREATE OR REPLACE FUNCTION bump_corpus_version() RETURNS trigger AS $$
+        BEGIN
+            IF coalesce(current_setting('dam.corpus_bumped', true), '') <> txid_current()::text THEN
+                PERFORM set_config('dam.corpus_bumped', txid_current()::text, true);
+                UPDATE corpus_version SET version = version + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cursor.execute("SELECT tgname FROM pg_trigger WHERE tgname LIKE '%_corpus_version';")
+    existing = {row[0] for row in cursor.fetchall()}
+    for table in ("documents", "document_chunks"):
+        if f"{table}_corpus_version" not in existing:
+            cursor.execute(f"""
+                CREATE CONSTRAINT TRIGGER {table}_corpus_version
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW EXECUTE FUNCTION bump_corpus_version();
+            """)
+        if f"{table}_truncate_corpus_version" not in existing:
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_truncate_corpus_version
+                AFTER TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+            """)
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class _SearchCache:
+    """LRU cache of search results tagged with the corpus version they were computed at
+    
+    A lookup only hits when the stored version equals the current one, so
+    any ingest, update or delete makes every older entry miss. The current
+    version itself is kept for version_ttl seconds, so hits within that
+    window make no database call and changes show up at most that late.
+    """
+    
+    def __init__(self, max_entries: int, version_ttl: float = 0.0):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.version_reads = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._version_read_at = 0.0
+        self._lock = threading.Lock()
+    
+    def version(self, read) -> int:
+        """The corpus version, calling read() for it at most once every version_ttl seconds"""
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._version_read_at < self.version_ttl:
+                return self._version
+        version = read()
+        with self._lock:
+            self._version, self._version_read_at = version, now
+            self.version_reads += 1
+        return version
+    
+    def get(self, key: tuple, version: int) -> Dict:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["version"] != version:
+                del self._entries[key]
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["result"]
+    
+    def put(self, key: tuple, version: int, result: Dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = {"version": version, "result": result}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "version_reads": self.version_reads
+            }
+
+
+SEARCH_CACHE = _SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_VERSION_TTL_SECONDS)
+
+
+def _read_corpus_version() -> int:
+    with _db_cursor() as cursor:
+        cursor.execute("SELECT version FROM corpus_version;")
+        return cursor.fetchone()[0]
+
+
+def _cached_search(search_type: str, search, query: str, limit: int, **options) -> Dict:
+    """Serve a search from SEARCH_CACHE, running it only on a miss
+    
+    The corpus version is taken before searching, so a result is never stored
+    under a version newer than the data it saw; it comes from SEARCH_CACHE
+    when read within the last SEARCH_CACHE_VERSION_TTL_SECONDS.
+    """
+    if not DB_POOL or SEARCH_CACHE.max_entries <= 0:
+        return search(query, limit, **options)
+    
+    try:
+        version = SEARCH_CACHE.version(_read_corpus_version)
+    except Exception:
+        return search(query, limit, **options)
+    
+    key = (search_type, _normalize_query(query), limit, tuple(sorted(options.items())))
+    cached = SEARCH_CACHE.get(key, version)
+    if cached is not None:
+        return {**cached, "query": query, "cached": True}
+    
+    result = search(query, limit, **options)
+    if result.get("status") == "success":
+        SEARCH_CACHE.put(key, version, result)
+    return {**result, "cached": False}
+
+
+# ============================================
+# PERSISTENT EMBEDDING CACHE
+# ============================================
+
+def _content_key(model: str, text: str) -> str:
+    """Content address for (model, normalized text)"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class _PersistentCache:
+    """On-disk LRU cache of embeddings and chunk summaries
+    
+    Vectors live in a memory-mapped float32 file of fixed capacity; a SQLite
+    index maps content keys to row slots and tracks recency. When the file is
+    full the least recently used slots are overwritten. Summaries are kept in
+    the SQLite file itself with the same LRU policy.
+    
+    Several processes may share the directory: writers take an exclusive
+    lock on the vector file (readers a shared one), so slots are allocated
+    against the committed index and a slot is never read while another
+    process rewrites it. Any cache error is reported and treated as a miss.
+    """
+    
+    def __init__(self, directory: str, capacity: int, dim: int, summary_capacity: int):
+        os.makedirs(directory, exist_ok=True)
+        self.capacity = capacity
+        self.summary_capacity = summary_capacity
+        self._lock = threading.Lock()
+        path = os.path.join(directory, "vectors.f32")
+        self._lock_file = open(path + ".lock", "a")
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+        
+        with self._locked(exclusive=True):
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL);
+                CREATE INDEX IF NOT EXISTS vectors_lru_idx ON vectors (last_used);
+                CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT, last_used REAL);
+                CREATE INDEX IF NOT EXISTS summaries_lru_idx ON summaries (last_used);
+            """)
+            layout = f"{capacity}x{dim}"
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'layout'").fetchone()
+            if row is None or row[0] != layout or not os.path.exists(path):
+                # Slot numbers are meaningless against a differently shaped file
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.execute("DELETE FROM vectors")
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('layout', ?)", (layout,))
+                self._vectors = np.memmap(path, dtype=np.float32, mode="w+", shape=(capacity, dim))
+                self._db.execute("COMMIT")
+            else:
+                self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+    
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """Hold the thread lock and a shared or exclusive lock on the vector file"""
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+    
+    def get_vectors(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the keys that are present"""
+        found = {}
+        try:
+            with self._locked():
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, slot FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    for key, slot in rows:
+                        found[key] = np.array(self._vectors[slot])
+                if found:
+                    now = time.time()
+                    self._db.executemany("UPDATE vectors SET last_used = ? WHERE key = ?",
+                                         [(now, key) for key in found])
+        except Exception as e:
+            print(f"Embedding cache read failed: {e}")
+        return found
+    
+    def put_vectors(self, items: Dict[str, np.ndarray]):
+        """Store vectors, evicting least recently used slots when full
+        
+        Slots are allocated inside an IMMEDIATE transaction and the vectors
+        are written before the keys pointing at them are committed.
+        """
+        try:
+            with self._locked(exclusive=True):
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._put_vectors(items)
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            print(f"Embedding cache write failed: {e}")
+    
+    def _put_vectors(self, items: Dict[str, np.ndarray]):
+        items = {
+            key: vector for key, vector in items.items()
+            if self._db.execute("SELECT 1 FROM vectors WHERE key = ?", (key,)).fetchone() is None
+        }
+        pending = list(items.items())[-self.capacity:]
+        if not pending:
+            return
+        
+        used = self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        slots = list(range(used, min(self.capacity, used + len(pending))))
+        shortfall = len(pending) - len(slots)
+        if shortfall > 0:
+            evicted = self._db.execute(
+                "SELECT key, slot FROM vectors ORDER BY last_used LIMIT ?", (shortfall,)
+            ).fetchall()
+            self._db.executemany("DELETE FROM vectors WHERE key = ?", [(key,) for key, _ in evicted])
+            slots.extend(slot for _, slot in evicted)
+        
+        now = time.time()
+        for (key, vector), slot in zip(pending, slots):
+            self._vectors[slot] = vector
+        self._vectors.flush()
+        self._db.executemany(
+            "INSERT INTO vectors (key, slot, last_used) VALUES (?, ?, ?)",
+            [(key, slot, now) for (key, _), slot in zip(pending, slots)]
+        )
+    
+    def get_summary(self, key: str) -> str:
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self._db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+                return row[0]
+        except Exception as e:
+            print(f"Summary cache read failed: {e}")
+            return None
+    
+    def put_summary(self, key: str, summary: str):
+        try:
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)",
+                                     (key, summary, time.time()))
+                    self._db.execute("""
+                        DELETE FROM summaries WHERE key IN (
+                            SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (self.summary_capacity,))
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            print(f"Summary cache write failed: {e}")
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "vectors": self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0],
+                "vector_capacity": self.capacity,
+                "summaries": self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0],
+                "summary_capacity": self.summary_capacity
+            }
+
+
+def _get_persistent_cache():
+    """Open the persistent cache on first use; None when disabled or unavailable"""
+    global PERSISTENT_CACHE
+    
+    if PERSISTENT_CACHE is None and EMBEDDING_CACHE_DIR:
+        try:
+            PERSISTENT_CACHE = _PersistentCache(
+                EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_SIZE, EMBEDDING_DIM, SUMMARY_CACHE_SIZE
+            )
+        except Exception as e:
+            print(f"Embedding cache unavailable: {e}")
+            return None
+    return PERSISTENT_CACHE
+
 
 # ============================================
-# POSTGRESQL + PGVECTOR SETUP
+# EMBEDDINGS
 # ============================================
 
-def initialize_database():
-    """Initialize PostgreSQL with pgvector extension"""
-    global PG_CONNECTION
+def generate_embedding(text: str) -> List[float]:
+    """Generate embeddings using Ollama nomic-embed-text
     
-    try:
-        PG_CONNECTION = psycopg2.connect(**DB_CONFIG)
-        register_vector(PG_CONNECTION)
-        
-        cursor = PG_CONNECTION.cursor()
-        
-        
-        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-        
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS documents (
-                id SERIAL PRIMARY KEY,
-                file_id VARCHAR(255) UNIQUE NOT NULL,
-                filename VARCHAR(500) NOT NULL,
-                content TEXT,
-                embedding vector(768),
-                metadata JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        
+    Args:
+        text: Text to embed
+    """
+    return generate_embeddings([text])[0].tolist()
+
+
+def generate_embeddings(texts: List[str], batch_size: int = None, concurrency: int = None) -> np.ndarray:
+    """Generate embeddings for many texts with batched Ollama calls
+    
+    Texts already in the persistent cache are not sent to Ollama, and
+    identical texts in one call are embedded once. Rows of a failed batch
+    stay zero, like generate_embedding's fallback, and are not cached.
+    
+    Args:
+        texts: Texts to embed
+        batch_size: Texts per Ollama request (default EMBED_BATCH_SIZE)
+        concurrency: Requests in flight (default EMBED_CONCURRENCY)
+    
+    Returns:
+        Contiguous float32 matrix of shape (len(texts), EMBEDDING_DIM)
+    """
+    matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    if not texts:
+        return matrix
+    
+    cache = _get_persistent_cache()
+    keys = [_content_key(EMBEDDING_MODEL, text[:8000]) for text in texts]
+    cached = cache.get_vectors(list(set(keys))) if cache else {}
+    
+    missing = {}
+    for idx, key in enumerate(keys):
+        if key in cached:
+            matrix[idx] = cached[key]
+        elif key not in missing:
+            missing[key] = idx
+    
+    if missing:
+        fresh = _embed_with_ollama([texts[idx] for idx in missing.values()], batch_size, concurrency)
+        computed = dict(zip(missing, fresh))
+        for idx, key in enumerate(keys):
+            if key in computed:
+                matrix[idx] = computed[key]
+        if cache:
+            cache.put_vectors({key: vector for key, vector in computed.items() if vector.any()})
+    
+    return matrix
+
+
+def _embed_with_ollama(texts: List[str], batch_size: int = None, concurrency: int = None) -> np.ndarray:
+    """Embed texts with EMBED_BATCH_SIZE inputs per ollama.embed request"""
+    batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+    concurrency = concurrency or EMBED_CONCURRENCY
+    
+    matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    batches = [
+        range(start, min(start + batch_size, len(texts)))
+        for start in range(0, len(texts), batch_size)
+    ]
+    
+    def embed_batch(rows: range):
+        try:
+            response = ollama.embed(
+                model=EMBEDDING_MODEL,
+                input=[texts[i][:8000] for i in rows]
+            )
+            matrix[rows.start:rows.stop] = response['embeddings']
+        except Exception as e:
+            print(f"Embedding error: {e}")
+    
+    if len(batches) > 1 and concurrency > 1:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            list(pool.map(embed_batch, batches))
+    else:
+        for rows in batches:
+            embed_batch(rows)
+    
+    return matrix
+
+
+class _EmbeddingPool:
+    """Running length-weighted mean of a document's chunk embeddings
+    
+    Chunks are unit-normalized and weighted by the characters they add past
+    the end of the previous chunk, so overlapping text counts once and every
+    part of the file counts by its length. Add chunks in document order.
+    """
+    
+    def __init__(self):
+        self.total = np.zeros(EMBEDDING_DIM, dtype=np.float64)
+        self.covered = 0
+    
+    def add(self, embeddings, starts, ends) -> "_EmbeddingPool":
+        """Fold in a block of chunk embeddings with their start_pos and end_pos"""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        if not len(embeddings):
+            return self
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        covered = np.maximum.accumulate(np.concatenate(([self.covered], ends[:-1])))
+        weights = np.clip(ends - np.maximum(starts, covered), 0, None).astype(np.float64)
+        norms = np.linalg.norm(embeddings, axis=1)
+        # Chunks whose embedding failed (zero rows) carry no weight
+        np.divide(weights, norms, out=weights, where=norms > 0)
+        weights[norms == 0] = 0
+        self.total += weights @ embeddings
+        self.covered = max(self.covered, int(ends.max()))
+        return self
+    
+    def add_chunks(self, chunks: List[Dict]) -> "_EmbeddingPool":
+        if chunks:
+            self.add(np.stack([np.asarray(chunk["embedding"], dtype=np.float32) for chunk in chunks]),
+                     [chunk["start_pos"] for chunk in chunks], [chunk["end_pos"] for chunk in chunks])
+        return self
+    
+    def finish(self):
+        """The unit-length document embedding, or None if no chunk had one"""
+        norm = np.linalg.norm(self.total)
+        return (self.total / norm).astype(np.float32) if norm > 0 else None
+
+
+def _stored_chunk_pool(file_id: str) -> _EmbeddingPool:
+    """Pool the chunk embeddings stored in document_chunks for a file
+    
+    Rows stream through a server-side cursor and each block is parsed by
+    NumPy in one call, so memory stays flat however many chunks there are.
+    """
+    pool = _EmbeddingPool()
+    with _db_cursor(name="pool_chunks") as cursor:
+        cursor.itersize = DEDUPE_BLOCK_ROWS
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS document_chunks (
-                id SERIAL PRIMARY KEY,
-                file_id VARCHAR(255) NOT NULL,
-                chunk_id INTEGER NOT NULL,
-                chunk_text TEXT,
-                summary TEXT,
-                embedding vector(768),
-                metadata JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(file_id, chunk_id)
-            );
-        """)
+            SELECT embedding::text, (metadata->>'start_pos')::int, (metadata->>'end_pos')::int
+            FROM document_chunks
+            WHERE file_id = %s AND embedding IS NOT NULL
+            ORDER BY chunk_id;
+        """, (file_id,))
+        while True:
+            rows = cursor.fetchmany(DEDUPE_BLOCK_ROWS)
+            if not rows:
+                break
+            pool.add(np.fromstring(",".join(row[0][1:-1] for row in rows), dtype=np.float32, sep=","),
+                     [row[1] for row in rows], [row[2] for row in rows])
+    return pool
+
+
+def _document_embedding(file_id: str, content: str) -> np.ndarray:
+    """Embedding for a whole document, pooled from its chunks when it was chunked
+    
+    Chunks come from the ROM cache, which only holds the file's current
+    version. Documents too small to be chunked are embedded directly, which
+    costs one model call and covers all of their text; rows left in
+    document_chunks by an older, longer version are never pooled.
+    """
+    chunks = CHUNK_CACHE.get(file_id) if len(content) > 5000 else None
+    pooled = _EmbeddingPool().add_chunks(chunks).finish() if chunks else None
+    return pooled if pooled is not None else generate_embeddings([content])[0]
+
+
+# ============================================
+# GEMINI SUMMARIZATION ENGINE
+# ============================================
+
+class _TokenBucket:
+    """Async token bucket refilled at per_minute / 60 tokens a second, with one second of burst
+    
+    Used only from the summarizer's event loop, so it needs no lock.
+    pause() holds every caller back after the API reports a rate limit.
+    """
+    
+    def __init__(self, per_minute: float):
+        self.rate = max(per_minute, 1) / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+    
+    async def acquire(self, cost: float = 1.0):
+        cost = min(cost, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.paused_until and self.tokens >= cost:
+                self.tokens -= cost
+                return
+            await asyncio.sleep(max(self.paused_until - now, (cost - self.tokens) / self.rate))
+    
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _summary_prompt(chunks: Dict[int, str]) -> str:
+    """One structured prompt asking for a summary of every chunk, keyed by id"""
+    parts = "\n\n".join(f'<chunk id="{chunk_id}">\n{text}\n</chunk>' for chunk_id, text in chunks.items())
+    return f"""Summarize each document chunk below in 2-3 sentences.
+Focus on key entities, dates, numbers, and important information.
+Reply with a JSON array holding one {{"id": <chunk id>, "summary": "<summary>"}} object per chunk.
+
+{parts}"""
+
+
+def _parse_summaries(text: str, chunk_ids: List[int]) -> Dict[int, str]:
+    """Summaries by chunk id from a JSON reply; ids that are missing or empty are left out
+    
+    A plain-text reply is accepted as the summary when only one chunk was asked for.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        if len(chunk_ids) == 1 and text:
+            return {chunk_ids[0]: text}
+        raise
+    if isinstance(payload, dict):
+        payload = payload.get("summaries", [payload])
+    
+    summaries = {}
+    for item in payload if isinstance(payload, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            chunk_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        summary = str(item.get("summary") or "").strip()
+        if chunk_id in chunk_ids and summary:
+            summaries[chunk_id] = summary
+    return summaries
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    message = str(error).lower()
+    return (getattr(error, "code", None) == 429 or "429" in message or "quota" in message
+            or "resource_exhausted" in message or "resource exhausted" in message)
+
+
+_TRANSIENT_ERROR_MARKERS = ("unavailable", "deadline", "timeout", "timed out", "internal error", "try again")
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a Gemini call may succeed on retry
+    
+    Rate limits, 5xx responses, timeouts and dropped connections are
+    transient; other client errors (invalid API key, bad request, blocked
+    prompt) fail the same way every time.
+    """
+    if _is_rate_limit(error) or isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code >= 500 or code == 408
+    message = str(error).lower()
+    return re.search(r"\b5\d\d\b", message) is not None or any(marker in message for marker in _TRANSIENT_ERROR_MARKERS)
+
+
+class _SummaryEngine:
+    """Batched, concurrent Gemini summarization on a background event loop
+    
+    Chunks are packed batch_size to a structured prompt, and the batches run
+    concurrency at a time through one reused model client, paced by request
+    and token buckets (SUMMARY_RPM / SUMMARY_TPM). Transient failures (see
+    _is_transient), malformed replies and chunks missing from a reply are
+    retried with exponential backoff and jitter; a rate limit also pauses
+    the whole bucket. Chunks still without a summary after max_retries, or
+    after an error that retrying cannot fix, fall back to their first 200
+    characters.
+    One loop serves every calling thread, so the limits hold process-wide.
+    """
+    
+    def __init__(self, model: str = None, batch_size: int = None, concurrency: int = None,
+                 rpm: int = None, tpm: int = None, max_retries: int = None, backoff: float = None):
+        self.model_name = model or SUMMARY_MODEL
+        self.batch_size = max(1, batch_size or SUMMARY_BATCH_SIZE)
+        self.concurrency = max(1, concurrency or SUMMARY_CONCURRENCY)
+        self.rpm = rpm or SUMMARY_RPM
+        self.tpm = tpm or SUMMARY_TPM
+        self.max_retries = SUMMARY_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = SUMMARY_BACKOFF_SECONDS if backoff is None else backoff
+        self.stats = {"chunks": 0, "requests": 0, "retries": 0, "rate_limited": 0, "fallbacks": 0}
+        self._lock = threading.Lock()
+        self._loop = None
+    
+    def _start(self):
+        """Create the model client, buckets and event loop thread on first use"""
+        with self._lock:
+            if self._loop is None:
+                self._model = genai.GenerativeModel(self.model_name)
+                self._requests = _TokenBucket(self.rpm)
+                self._tokens = _TokenBucket(self.tpm)
+                self._slots = asyncio.Semaphore(self.concurrency)
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="summary-engine", daemon=True).start()
+                self._loop = loop
+        return self._loop
+    
+    def summarize(self, texts: List[str], fallback: bool = True) -> List[str]:
+        """Summaries for texts, in order; identical and cached chunks cost no request
         
+        With fallback=False a text that could not be summarized gets None
+        instead of its first 200 characters.
+        """
+        texts = [text[:2000] for text in texts]
+        cache = _get_persistent_cache()
+        summaries = [None] * len(texts)
+        missing = {}
+        for idx, text in enumerate(texts):
+            cached = cache.get_summary(_content_key(self.model_name, text)) if cache else None
+            if cached is not None:
+                summaries[idx] = cached
+            else:
+                missing.setdefault(text, []).append(idx)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS documents_embedding_idx 
-            ON documents USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = 100);
-        """)
+        if missing:
+            unique = list(missing)
+            fresh = asyncio.run_coroutine_threadsafe(self._summarize_all(unique), self._start()).result()
+            for text, summary in zip(unique, fresh):
+                if summary is None:
+                    self.stats["fallbacks"] += 1
+                    summary = text[:200] if fallback else None
+                elif cache:
+                    cache.put_summary(_content_key(self.model_name, text), summary)
+                for idx in missing[text]:
+                    summaries[idx] = summary
+        return summaries
+    
+    async def _summarize_all(self, texts: List[str]) -> List[str]:
+        results = [None] * len(texts)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS chunks_embedding_idx 
-            ON document_chunks USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = 100);
-        """)
+        async def run(rows: range):
+            async with self._slots:
+                found = await self._summarize_batch([texts[i] for i in rows])
+            for offset, summary in found.items():
+                results[rows.start + offset] = summary
         
-        PG_CONNECTION.commit()
-        cursor.close()
+        await asyncio.gather(*(
+            run(range(start, min(start + self.batch_size, len(texts))))
+            for start in range(0, len(texts), self.batch_size)
+        ))
+        return results
+    
+    async def _summarize_batch(self, texts: List[str]) -> Dict[int, str]:
+        found = {}
+        for attempt in range(self.max_retries + 1):
+            pending = [i for i in range(len(texts)) if i not in found]
+            if not pending:
+                break
+            if attempt:
+                self.stats["retries"] += 1
+            
+            prompt = _summary_prompt({i: texts[i] for i in pending})
+            await self._requests.acquire()
+            # ~4 characters a token in, up to ~100 tokens a summary out
+            await self._tokens.acquire(len(prompt) / 4 + 100 * len(pending))
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            try:
+                self.stats["requests"] += 1
+                response = await asyncio.to_thread(
+                    self._model.generate_content, prompt,
+                    generation_config={"response_mime_type": "application/json"}
+                )
+                found.update(_parse_summaries(response.text, pending))
+                if len(found) == len(texts):
+                    break
+            except Exception as e:
+                if not isinstance(e, json.JSONDecodeError) and not _is_transient(e):
+                    print(f"Summarization error: {e}")
+                    break
+                if _is_rate_limit(e):
+                    self.stats["rate_limited"] += 1
+                    self._requests.pause(delay)
+                if attempt == self.max_retries:
+                    print(f"Summarization error: {e}")
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
         
-        return {"status": "success", "message": "PostgreSQL + pgvector initialized with chunking support"}
-    except Exception as e:
-        return {"status": "error", "message": f"Database init failed: {str(e)}"}
+        self.stats["chunks"] += len(found)
+        return found
 
 
-def generate_embedding(text: str) -> List[float]:
-    """Generate embeddings using Ollama nomic-embed-text
-    
-    Args:
-        text: Text to embed
-    """
-    try:
-        response = ollama.embeddings(
-            model='nomic-embed-text',
-            prompt=text[:8000]  
-        )
-        return response['embedding']
-    except Exception as e:
-        print(f"Embedding error: {e}")
-        return [0.0] * 768 
+SUMMARY_ENGINE = _SummaryEngine()
 
 
 # ============================================
 # DOCUMENT CHUNKING & SUMMARIZATION (ROM CACHE)
 # ============================================
 
-def chunk_document(content: str, chunk_size: int = 1000, overlap: int = 200) -> List[Dict]:
-    """Split large documents into overlapping chunks
+def _chunks_nbytes(chunks: List[Dict]) -> int:
+    """Approximate memory held by a list of processed chunks"""
+    total = sys.getsizeof(chunks)
+    for chunk in chunks:
+        total += sys.getsizeof(chunk) + sys.getsizeof(chunk.get("text", ""))
+        total += sys.getsizeof(chunk.get("summary") or "")
+        embedding = chunk.get("embedding")
+        if isinstance(embedding, np.ndarray):
+            total += embedding.nbytes
+        elif embedding is not None:
+            total += sys.getsizeof(embedding) + 24 * len(embedding)
+    return total
+
+
+class _ChunkCache:
+    """Bounded LRU/TTL ROM cache of processed chunks per file
     
-    Args:
-        content: Full document content
-        chunk_size: Characters per chunk
-        overlap: Overlap between chunks for context preservation
+    Entries remember the Drive fingerprint (modifiedTime + md5Checksum) they
+    were built from. Whenever a newer fingerprint is observed for a file, its
+    entry is dropped so an edited file is never served stale chunks.
+    """
+    
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+    
+    def _drop(self, file_id: str):
+        entry = self._entries.pop(file_id, None)
+        if entry is not None:
+            self.bytes_used -= entry["nbytes"]
+    
+    def observe(self, file_id: str, fingerprint: str):
+        """Record the latest Drive fingerprint, invalidating a stale entry"""
+        if not fingerprint:
+            return
+        with self._lock:
+            self._fingerprints[file_id] = fingerprint
+            entry = self._entries.get(file_id)
+            if entry is not None and entry["fingerprint"] != fingerprint:
+                self._drop(file_id)
+                self.invalidations += 1
+    
+    def get(self, file_id: str) -> List[Dict]:
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is not None and time.time() - entry["stored_at"] > self.ttl_seconds:
+                self._drop(file_id)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(file_id)
+            self.hits += 1
+            return entry["chunks"]
+    
+    def put(self, file_id: str, chunks: List[Dict]):
+        nbytes = _chunks_nbytes(chunks)
+        with self._lock:
+            self._drop(file_id)
+            if nbytes > self.max_bytes:
+                return
+            while self._entries and self.bytes_used + nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes_used -= evicted["nbytes"]
+                self.evictions += 1
+            self._entries[file_id] = {
+                "chunks": chunks,
+                "nbytes": nbytes,
+                "fingerprint": self._fingerprints.get(file_id),
+                "stored_at": time.time()
+            }
+            self.bytes_used += nbytes
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+CHUNK_CACHE = _ChunkCache(CHUNK_CACHE_MAX_BYTES, CHUNK_CACHE_TTL_SECONDS)
+
+
+def _drive_fingerprint(file_metadata: Dict) -> str:
+    """Version marker for a Drive file; changes whenever its content does"""
+    modified = file_metadata.get("modifiedTime") or ""
+    checksum = file_metadata.get("md5Checksum") or ""
+    return f"{modified}:{checksum}" if modified or checksum else ""
+
+
+CHUNK_LEVELS = ("heading", "paragraph", "line", "sentence", "word")
+# Pieces end after these separators, except at headings, which start a new piece
+_CHUNK_BOUNDARIES = {
+    "heading": re.compile(
+        r"^(?:#{1,6}[ \t]+\S.*|\d+(?:\.\d+)*\.?[ \t]+[A-Z][^\n.]{0,80}|[A-Z][A-Z0-9 \t&/,:()-]{2,80})[ \t]*$",
+        re.M
+    ),
+    "paragraph": re.compile(r"\n[ \t]*\n\s*"),
+    "line": re.compile(r"\n"),
+    "sentence": re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n[ \t]*\n\s*"),
+    "word": re.compile(r"\s+")
+}
+# WordPiece-like estimate: words count one token per 6 characters, punctuation one each
+_TOKEN_PATTERN = re.compile(r"\w{1,6}|[^\w\s]")
+
+
+def _count_tokens(text: str, start: int = 0, end: int = None) -> int:
+    """Estimated embedding-model tokens in text[start:end]"""
+    return len(_TOKEN_PATTERN.findall(text, start, len(text) if end is None else end))
+
+
+def _make_chunk(chunk_id: int, text: str, start: int) -> Dict:
+    return {
+        "chunk_id": chunk_id,
+        "text": text,
+        "start_pos": start,
+        "end_pos": start + len(text),
+        "length": len(text),
+        "hash": hashlib.md5(text.encode("utf-8")).hexdigest()
+    }
+
+
+def _iter_fixed_chunks(pieces: Iterable[str], chunk_size: int = None, overlap: int = None) -> Iterator[Dict]:
+    """chunk_size-character windows (default 1000) stepping by chunk_size - overlap (default 200)
+    
+    Holds at most one chunk plus one incoming piece in memory.
     """
-    chunks = []
+    chunk_size = chunk_size or 1000
+    overlap = 200 if overlap is None else overlap
+    step = chunk_size - overlap
+    buffer = ""
+    offset = 0
     start = 0
+    chunk_id = 0
     
-    while start < len(content):
-        end = start + chunk_size
-        chunk_text = content[start:end]
-        
-        chunks.append({
-            "chunk_id": len(chunks),
-            "text": chunk_text,
-            "start_pos": start,
-            "end_pos": end,
-            "length": len(chunk_text)
-        })
-        
-        start += chunk_size - overlap
+    for piece in pieces:
+        # Compact once per piece so a single huge piece is still walked linearly
+        buffer = buffer[offset:] + piece
+        offset = 0
+        while len(buffer) - offset >= chunk_size:
+            yield _make_chunk(chunk_id, buffer[offset:offset + chunk_size], start)
+            offset += step
+            start += step
+            chunk_id += 1
     
-    return chunks
+    while offset < len(buffer):
+        yield _make_chunk(chunk_id, buffer[offset:offset + chunk_size], start)
+        offset += step
+        start += step
+        chunk_id += 1
+
+
+def _split_spans(text: str, start: int, end: int, level: str) -> List[tuple]:
+    """Cut text[start:end] into consecutive (start, end) spans at one level's boundaries"""
+    spans, cut = [], start
+    for m in _CHUNK_BOUNDARIES[level].finditer(text, start, end):
+        boundary = m.start() if level == "heading" else m.end()
+        if cut < boundary < end:
+            spans.append((cut, boundary))
+            cut = boundary
+    if cut < end:
+        spans.append((cut, end))
+    return spans
+
+
+def _chunk_units(text: str, start: int, end: int, level: int, budget: int) -> Iterator[tuple]:
+    """(start, end, tokens) units of at most budget tokens, splitting oversize spans one level finer
+    
+    Every character is counted at most once per level, so this is linear in
+    the input. Unbroken runs longer than the budget (e.g. base64) are cut
+    every budget * 4 characters.
+    """
+    tokens = _count_tokens(text, start, end)
+    if tokens <= budget:
+        yield start, end, tokens
+    elif level + 1 < len(CHUNK_LEVELS):
+        for a, b in _split_spans(text, start, end, CHUNK_LEVELS[level + 1]):
+            yield from _chunk_units(text, a, b, level + 1, budget)
+    else:
+        for a in range(start, end, budget * 4):
+            b = min(end, a + budget * 4)
+            yield a, b, _count_tokens(text, a, b)
+
+
+def _pack_units(units: Iterable[tuple], budget: int, overlap: int) -> Iterator[tuple]:
+    """Greedily merge consecutive units into (start, end) spans of at most budget tokens
+    
+    Each new span repeats the trailing units of the previous one that fit in
+    overlap tokens, so overlap only ever copies whole sentences (or lines).
+    """
+    current, tokens = [], 0
+    for unit in units:
+        if current and tokens + unit[2] > budget:
+            yield current[0][0], current[-1][1]
+            carry, carried = [], 0
+            for previous in reversed(current[1:] if overlap > 0 else []):
+                if carried + previous[2] > overlap:
+                    break
+                carry.append(previous)
+                carried += previous[2]
+            current, tokens = (carry[::-1], carried) if carried + unit[2] <= budget else ([], 0)
+        current.append(unit)
+        tokens += unit[2]
+    if current:
+        yield current[0][0], current[-1][1]
+
+
+def _structured_spans(text: str, end: int, level: str, budget: int, overlap: int) -> Iterator[tuple]:
+    """Chunk spans of text[:end] split at level boundaries and packed to budget tokens
+    
+    With "heading", chunks never cross a heading; the finer levels pack
+    their pieces across paragraphs and sentences freely.
+    """
+    index = CHUNK_LEVELS.index(level)
+    sections = _split_spans(text, 0, end, level)
+    if level == "heading":
+        for a, b in sections:
+            yield from _pack_units(_chunk_units(text, a, b, index, budget), budget, overlap)
+    else:
+        yield from _pack_units(
+            (unit for a, b in sections for unit in _chunk_units(text, a, b, index, budget)),
+            budget, overlap
+        )
+
+
+def _stream_cut(buffer: str, floor: int) -> int:
+    """Where to end a streamed window: the last paragraph, line, sentence or word break past floor"""
+    for separator in ("\n\n", "\n", ". ", " "):
+        found = buffer.rfind(separator, floor)
+        if found >= 0:
+            return found + len(separator)
+    return len(buffer)
+
+
+def _iter_structured_chunks(pieces: Iterable[str], chunk_size: int = None, overlap: int = None,
+                            level: str = "paragraph") -> Iterator[Dict]:
+    """Structure-aware chunks of at most chunk_size tokens (default CHUNK_TOKENS)
+    
+    Text is buffered in windows of about DOWNLOAD_CHUNK_BYTES characters,
+    each ended at a natural break and chunked in one linear pass, so memory
+    stays bounded for streamed files. Chunks cover the text contiguously
+    (plus overlap tokens, default CHUNK_OVERLAP_TOKENS, of repeated sentences).
+    """
+    budget = max(1, min(chunk_size or CHUNK_TOKENS, EMBED_CONTEXT_TOKENS))
+    overlap = CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    window = max(DOWNLOAD_CHUNK_BYTES, budget * 64)
+    buffer, base, chunk_id = "", 0, 0
+    
+    def emit(end: int) -> Iterator[Dict]:
+        nonlocal chunk_id
+        for a, b in _structured_spans(buffer, end, level, budget, overlap):
+            yield _make_chunk(chunk_id, buffer[a:b], base + a)
+            chunk_id += 1
+    
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= window:
+            cut = _stream_cut(buffer, window // 2)
+            yield from emit(cut)
+            buffer, base = buffer[cut:], base + cut
+    if buffer:
+        yield from emit(len(buffer))
+
+
+CHUNKERS = {
+    "fixed": _iter_fixed_chunks,
+    "sentence": functools.partial(_iter_structured_chunks, level="sentence"),
+    "paragraph": functools.partial(_iter_structured_chunks, level="paragraph"),
+    "heading": functools.partial(_iter_structured_chunks, level="heading")
+}
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = None, overlap: int = None,
+                strategy: str = None) -> Iterator[Dict]:
+    """Yield chunks from a stream of text pieces
+    
+    Produces exactly what chunk_document would for the concatenated text
+    (up to one extra break per streamed window) without holding the whole
+    text in memory.
+    
+    Args:
+        pieces: Text in arrival order, e.g. decoded download blocks
+        chunk_size: Characters per chunk for "fixed" (default 1000); token
+            budget for the other strategies (default CHUNK_TOKENS)
+        overlap: Characters ("fixed", default 200) or tokens of whole
+            sentences (default CHUNK_OVERLAP_TOKENS) shared with the previous chunk
+        strategy: A CHUNKERS name (default CHUNK_STRATEGY)
+    """
+    strategy = strategy or CHUNK_STRATEGY
+    if strategy not in CHUNKERS:
+        raise ValueError(f"chunk strategy must be one of {', '.join(CHUNKERS)}")
+    return CHUNKERS[strategy](pieces, chunk_size, overlap)
+
+
+def chunk_document(content: str, chunk_size: int = None, overlap: int = None, strategy: str = None) -> List[Dict]:
+    """Split large documents into chunks
+    
+    Args:
+        content: Full document content
+        chunk_size: Characters ("fixed") or tokens per chunk
+        overlap: Overlap between chunks for context preservation
+        strategy: "fixed", "sentence", "paragraph" or "heading" (default CHUNK_STRATEGY)
+    """
+    return list(iter_chunks([content], chunk_size, overlap, strategy))
 
 
 def summarize_chunk(chunk_text: str) -> str:
@@ -161,19 +2108,108 @@ def summarize_chunk(chunk_text: str) -> str:
     Args:
         chunk_text: Chunk content to summarize
     """
-    try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = f"""Summarize this document chunk in 2-3 sentences. 
-        Focus on key entities, dates, numbers, and important information:
-        
-        {chunk_text[:2000]}"""
-        
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Summarization error: {e}")
-        return chunk_text[:200]  
+    return SUMMARY_ENGINE.summarize([chunk_text])[0]
+
+
+def _attach_summaries(chunks: List[Dict]) -> List[Dict]:
+    """Attach a Gemini summary to every chunk, batched through SUMMARY_ENGINE
+    
+    Chunks identical to one already stored reuse its summary and embedding
+    (see _reuse_identical_chunks). In lazy SUMMARY_MODE the summary is left
+    None, to be filled in by _fill_lazy_summaries when the chunk is first
+    returned by a search.
+    """
+    chunks = _reuse_identical_chunks([dict(chunk) for chunk in chunks])
+    fresh = [chunk for chunk in chunks if not chunk.get("reused")]
+    if SUMMARY_MODE == "lazy":
+        for chunk in fresh:
+            chunk["summary"] = None
+        return chunks
+    summaries = SUMMARY_ENGINE.summarize([chunk["text"] for chunk in fresh])
+    for chunk, summary in zip(fresh, summaries):
+        chunk["summary"] = summary
+    return chunks
+
+
+def _reuse_identical_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Copy the summary and embedding of identical chunks already stored for any file
+    
+    Boilerplate (license headers, disclaimers, repeated table rows) is then
+    summarized and embedded once across the corpus. Matches are by chunk
+    hash; a stored chunk still waiting for its lazy summary is only reused
+    in lazy SUMMARY_MODE. Reused chunks are marked "reused".
+    """
+    hashes = list({chunk["hash"] for chunk in chunks if chunk.get("hash")})
+    if not hashes or not DB_POOL:
+        return chunks
+    
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT ON (chunk_hash) chunk_hash, summary, embedding::text
+            FROM document_chunks
+            WHERE chunk_hash = ANY(%s) AND embedding IS NOT NULL
+            ORDER BY chunk_hash, summary IS NULL;
+        """, (hashes,))
+        stored = {
+            row[0]: (row[1], np.fromstring(row[2][1:-1], dtype=np.float32, sep=","))
+            for row in cursor.fetchall()
+            if row[1] is not None or SUMMARY_MODE == "lazy"
+        }
+    
+    for chunk in chunks:
+        if chunk.get("hash") in stored:
+            chunk["summary"], chunk["embedding"] = stored[chunk["hash"]]
+            chunk["reused"] = True
+    return chunks
+
+
+def _summarize_chunks(content: str) -> List[Dict]:
+    """Chunk a document and attach a Gemini summary to every chunk"""
+    return _attach_summaries(chunk_document(content))
+
+
+def _embedding_text(chunk: Dict) -> str:
+    """What a chunk is embedded from: its summary, or the raw text when summarization is lazy"""
+    return chunk.get("summary") or chunk["text"]
+
+
+def _embed_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Attach an embedding of each chunk's summary (raw text in lazy mode)
+    
+    Chunks reused from an identical stored chunk keep their embedding.
+    """
+    pending = [chunk for chunk in chunks if chunk.get("embedding") is None]
+    embeddings = generate_embeddings([_embedding_text(chunk) for chunk in pending])
+    for chunk, embedding in zip(pending, embeddings):
+        chunk["embedding"] = embedding
+    return chunks
+
+
+def _store_chunks(file_id: str, filename: str, chunks: List[Dict], total_chars: int) -> Dict:
+    """Persist processed chunks to PostgreSQL and the ROM cache
+    
+    All chunks of the file are written in one transaction.
+    """
+    rows_per_sec = None
+    if DB_POOL:
+        started = time.perf_counter()
+        with _db_cursor() as cursor:
+            _bulk_upsert_chunks(cursor, file_id, filename, chunks)
+        elapsed = time.perf_counter() - started
+        rows_per_sec = round(len(chunks) / elapsed, 1) if elapsed else None
+    
+    CHUNK_CACHE.put(file_id, chunks)
+    
+    return {
+        "status": "success",
+        "chunks_created": len(chunks),
+        "chunks_reused": sum(1 for chunk in chunks if chunk.get("reused")),
+        "total_chars": total_chars,
+        "cache_status": "stored in ROM",
+        "rows_per_sec": rows_per_sec,
+        "message": f"Processed and cached {len(chunks)} chunks with "
+                   + ("summaries deferred to first search" if SUMMARY_MODE == "lazy" else "Gemini summaries")
+    }
 
 
 def process_large_file(file_id: str, content: str, filename: str) -> Dict:
@@ -185,110 +2221,168 @@ def process_large_file(file_id: str, content: str, filename: str) -> Dict:
         filename: Name of the file
     """
     
-    if file_id in CHUNK_CACHE:
+    cached_chunks = CHUNK_CACHE.get(file_id)
+    if cached_chunks is not None:
         return {
             "status": "cached",
-            "chunks": len(CHUNK_CACHE[file_id]),
-            "message": f"Retrieved {len(CHUNK_CACHE[file_id])} chunks from ROM cache"
+            "chunks": len(cached_chunks),
+            "message": f"Retrieved {len(cached_chunks)} chunks from ROM cache"
         }
     
     try:
-      
-        chunks = chunk_document(content)
-        
-       
-        processed_chunks = []
-        
-        for chunk in chunks:
-            summary = summarize_chunk(chunk["text"])
-            embedding = generate_embedding(summary)  
-            
-            processed_chunks.append({
-                **chunk,
-                "summary": summary,
-                "embedding": embedding
-            })
-            
-            # Store chunk in PostgreSQL
-            if PG_CONNECTION:
-                cursor = PG_CONNECTION.cursor()
-                cursor.execute("""
-                    INSERT INTO document_chunks 
-                    (file_id, chunk_id, chunk_text, summary, embedding, metadata)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (file_id, chunk_id) DO UPDATE
-                    SET chunk_text = EXCLUDED.chunk_text,
-                        summary = EXCLUDED.summary,
-                        embedding = EXCLUDED.embedding;
-                """, (
-                    file_id,
-                    chunk["chunk_id"],
-                    chunk["text"],
-                    summary,
-                    embedding,
-                    {"start_pos": chunk["start_pos"], "end_pos": chunk["end_pos"], "filename": filename}
-                ))
-                PG_CONNECTION.commit()
-                cursor.close()
-        
-        
-        CHUNK_CACHE[file_id] = processed_chunks
-        
-        return {
-            "status": "success",
-            "chunks_created": len(processed_chunks),
-            "total_chars": len(content),
-            "cache_status": "stored in ROM",
-            "message": f"Processed and cached {len(processed_chunks)} chunks with Gemini summaries"
-        }
+        processed_chunks = _embed_chunks(_summarize_chunks(content))
+        return _store_chunks(file_id, filename, processed_chunks, len(content))
     except Exception as e:
         return {"status": "error", "message": f"Chunking failed: {str(e)}"}
 
 
-def search_chunks(query: str, limit: int = 10) -> Dict:
+def get_cache_stats() -> Dict:
+    """Report ROM chunk cache, persistent embedding cache and search cache usage"""
+    cache = _get_persistent_cache()
+    return {
+        "status": "success",
+        "chunk_cache": CHUNK_CACHE.stats(),
+        "embedding_cache": cache.stats() if cache else "disabled",
+        "search_cache": SEARCH_CACHE.stats()
+    }
+
+
+def _fill_lazy_summaries(results: List[Dict]):
+    """Summarize search hits stored without a summary, and persist the summaries
+    
+    Only the hits' own chunk_text is read, and all of them go to
+    SUMMARY_ENGINE in one batch. Only real summaries are stored: a chunk
+    Gemini could not summarize shows its first 200 characters but stays
+    NULL, to be tried again by a later fill. The write skips the corpus version
+    bump: adding a summary changes no ranking, so cached searches stay
+    valid. A failure here leaves the hits without summaries rather than
+    failing the search.
+    """
+    pending = {(r["file_id"], r["chunk_id"]): r for r in results if r["summary"] is None}
+    if not pending:
+        return
+    
+    try:
+        with _db_cursor() as cursor:
+            cursor.execute("""
+                SELECT file_id, chunk_id, chunk_text
+                FROM document_chunks
+                WHERE (file_id, chunk_id) IN (SELECT * FROM unnest(%s::text[], %s::int[]));
+            """, ([key[0] for key in pending], [key[1] for key in pending]))
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        
+        summaries = SUMMARY_ENGINE.summarize([row[2] for row in rows], fallback=False)
+        summarized = [(*row, summary) for row, summary in zip(rows, summaries) if summary is not None]
+        if summarized:
+            with _db_cursor() as cursor:
+                cursor.execute("SELECT set_config('dam.corpus_bumped', txid_current()::text, true);")
+                execute_values(cursor, """
+                    UPDATE document_chunks c
+                    SET summary = v.summary
+                    FROM (VALUES %s) AS v (file_id, chunk_id, chunk_text, summary)
+                    WHERE c.file_id = v.file_id AND c.chunk_id = v.chunk_id
+                      AND c.chunk_text = v.chunk_text AND c.summary IS NULL;
+                """, summarized, page_size=DB_WRITE_PAGE_SIZE)
+    except Exception as e:
+        print(f"   ⚠️ Lazy summaries skipped: {e}")
+        return
+    
+    for (file_id, chunk_id, text), summary in zip(rows, summaries):
+        pending[(file_id, chunk_id)]["summary"] = summary if summary is not None else text[:200]
+
+
+def search_chunks(query: str, limit: int = 10, recall: str = "balanced",
+                  mode: str = "vector", lexical_weight: float = 0.5,
+                  filename: str = "", mime_type: str = "", owner: str = "",
+                  modified_after: str = "", modified_before: str = "") -> Dict:
     """Search across document chunks for precise results
     
     Args:
         query: Search query
         limit: Maximum results
+        recall: "fast", "balanced", "high" or "exact" (slower, full scan)
+        mode: "vector", or "hybrid" to also match exact terms such as
+            invoice numbers, SKUs and names through the full-text index
+        lexical_weight: Hybrid only; share of the fused score given to
+            full-text matches (0 = vector only, 1 = full-text only)
+        filename: Only files whose name contains this text
+        mime_type: Only files of this exact MIME type (e.g. application/pdf)
+        owner: Only files owned by this email address
+        modified_after: Only files modified on/after this ISO date (e.g. 2024-01-31)
+        modified_before: Only files modified before this ISO date
     """
-    if not PG_CONNECTION:
+    return _cached_search("chunk", _search_chunks, query, limit,
+                          recall=recall, mode=mode, lexical_weight=lexical_weight,
+                          filename=filename, mime_type=mime_type, owner=owner,
+                          modified_after=modified_after, modified_before=modified_before)
+
+
+def _search_chunks(query: str, limit: int, recall: str, mode: str, lexical_weight: float, **filters) -> Dict:
+    if not DB_POOL:
         return {"status": "error", "message": "Database not initialized"}
     
     try:
-        query_embedding = generate_embedding(query)
-        
-        cursor = PG_CONNECTION.cursor()
-        cursor.execute("""
-            SELECT c.file_id, c.metadata->>'filename' as filename, 
-                   c.chunk_id, c.chunk_text, c.summary,
-                   1 - (c.embedding <=> %s::vector) as similarity
-            FROM document_chunks c
-            ORDER BY c.embedding <=> %s::vector
-            LIMIT %s;
-        """, (query_embedding, query_embedding, limit))
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {', '.join(SEARCH_MODES)}")
+        filters = {key: value for key, value in filters.items() if value}
+        condition, filter_params = _metadata_filter(filters, "d")
+        query_embedding = generate_embeddings([query])[0]
         
-        results = cursor.fetchall()
-        cursor.close()
+        with _db_cursor() as cursor:
+            if mode == "hybrid":
+                params = {**_hybrid_params(query, query_embedding, limit, lexical_weight), **filter_params}
+                results, index_used = _hybrid_search(cursor, "document_chunks", condition, params, recall, """
+                    SELECT c.file_id, c.metadata->>'filename' as filename, 
+                           c.chunk_id, c.preview, c.summary,
+                           1 - (c.embedding <=> %(embedding)s::vector) as similarity,
+                           f.score
+                    FROM fused f
+                    JOIN document_chunks c ON c.id = f.id
+                    ORDER BY f.score DESC, similarity DESC
+                    LIMIT %(limit)s;
+                """)
+            else:
+                join = "JOIN documents d ON d.file_id = t.file_id" if condition else ""
+                results, index_used = _vector_search(cursor, "document_chunks", lambda source: f"""
+                    SELECT t.file_id, t.metadata->>'filename' as filename, 
+                           t.chunk_id, t.preview, t.summary,
+                           1 - (t.embedding <=> %(embedding)s::vector) as similarity
+                    FROM {source} t
+                    {join}
+                    WHERE {condition or "TRUE"}
+                    ORDER BY t.embedding <=> %(embedding)s::vector
+                    LIMIT %(limit)s;
+                """, {"embedding": query_embedding, "limit": limit, **filter_params}, limit, recall,
+                    filtered=bool(condition))
         
         search_results = [
             {
                 "file_id": row[0],
                 "filename": row[1],
                 "chunk_id": row[2],
-                "content_preview": row[3][:300] + "..." if len(row[3]) > 300 else row[3],
+                "content_preview": row[3],
                 "summary": row[4],
                 "relevance_score": round(row[5] * 100, 2)
             }
             for row in results
         ]
+        if mode == "hybrid":
+            for result, row in zip(search_results, results):
+                result["fusion_score"] = round(row[6], 5)
+        _fill_lazy_summaries(search_results)
         
         return {
             "status": "success",
             "query": query,
             "results": search_results,
             "count": len(search_results),
-            "search_type": "chunk-level (precise)"
+            "search_type": "chunk-level (precise)",
+            "mode": mode,
+            "filters": filters,
+            "recall": recall,
+            "index": index_used
         }
     except Exception as e:
         return {"status": "error", "message": f"Chunk search failed: {str(e)}"}
@@ -312,36 +2406,73 @@ def authenticate_google_drive():
         return {"status": "error", "message": f"Authentication failed: {str(e)}. Ensure credentials.json exists."}
 
 
+DRIVE_FILE_FIELDS = "id, name, mimeType, size, createdTime, modifiedTime, md5Checksum, owners(emailAddress)"
+
+
+def _format_drive_file(f: Dict) -> Dict:
+    return {
+        "id": f["id"],
+        "name": f["name"],
+        "type": f["mimeType"],
+        "size_bytes": f.get("size", "0"),
+        "created": f.get("createdTime", "Unknown"),
+        "modified": f.get("modifiedTime", "Unknown"),
+        "md5_checksum": f.get("md5Checksum"),
+        "owner": (f.get("owners") or [{}])[0].get("emailAddress")
+    }
+
+
+def _document_metadata(file_info: Dict = None) -> Dict:
+    """documents.metadata for a Drive file, the fields metadata-filtered search matches on"""
+    info = file_info or {}
+    metadata = {
+        "source": "google_drive",
+        "mime_type": info.get("type"),
+        "owner": info.get("owner"),
+        "modified": info.get("modified"),
+        "created": info.get("created")
+    }
+    return {key: value for key, value in metadata.items() if value and value != "Unknown"}
+
+
+def _list_all_drive_files(max_files: int = 0) -> List[Dict]:
+    """Page through files().list until max_files (0 = no limit) are collected"""
+    files = []
+    page_token = None
+    
+    while True:
+        page_size = 1000 if max_files <= 0 else min(1000, max_files - len(files))
+        results = DRIVE_SERVICE.files().list(
+            pageSize=page_size,
+            pageToken=page_token,
+            fields=f"nextPageToken, files({DRIVE_FILE_FIELDS})"
+        ).execute()
+        
+        for f in results.get('files', []):
+            CHUNK_CACHE.observe(f["id"], _drive_fingerprint(f))
+            files.append(f)
+        
+        page_token = results.get('nextPageToken')
+        if not page_token or (max_files > 0 and len(files) >= max_files):
+            return files[:max_files] if max_files > 0 else files
+
+
 def list_drive_files(max_files: int = 20) -> Dict:
     """List files from Google Drive
     
     Args:
-        max_files: Maximum number of files to retrieve
+        max_files: Maximum number of files to retrieve (0 for all files)
     """
     if not DRIVE_SERVICE:
         return {"status": "error", "message": "Drive not authenticated. Run authenticate_google_drive first."}
     
     try:
-        results = DRIVE_SERVICE.files().list(
-            pageSize=max_files,
-            fields="files(id, name, mimeType, size, createdTime)"
-        ).execute()
-        
-        files = results.get('files', [])
+        files = _list_all_drive_files(max_files)
         
         return {
             "status": "success",
             "count": len(files),
-            "files": [
-                {
-                    "id": f["id"],
-                    "name": f["name"],
-                    "type": f["mimeType"],
-                    "size_bytes": f.get("size", "0"),
-                    "created": f.get("createdTime", "Unknown")
-                }
-                for f in files
-            ]
+            "files": [_format_drive_file(f) for f in files]
         }
     except Exception as e:
         return {"status": "error", "message": f"Failed to list files: {str(e)}"}
@@ -358,7 +2489,11 @@ def download_file_content(file_id: str) -> Dict:
     
     try:
         
-        file_metadata = DRIVE_SERVICE.files().get(fileId=file_id).execute()
+        file_metadata = DRIVE_SERVICE.files().get(
+            fileId=file_id,
+            fields="id, name, mimeType, modifiedTime, md5Checksum"
+        ).execute()
+        CHUNK_CACHE.observe(file_id, _drive_fingerprint(file_metadata))
         
         
         if 'application/vnd.google-apps' in file_metadata['mimeType']:
@@ -379,18 +2514,581 @@ def download_file_content(file_id: str) -> Dict:
             "content": text_content[:5000],  
             "full_content": text_content,
             "size": len(text_content),
-            "mime_type": file_metadata['mimeType']
+            "mime_type": file_metadata['mimeType'],
+            "modified": file_metadata.get('modifiedTime'),
+            "md5_checksum": file_metadata.get('md5Checksum')
         }
     except Exception as e:
         return {"status": "error", "message": f"Failed to download: {str(e)}"}
 
 
+def _stream_file_text(file_id: str, mime_type: str) -> Iterator[str]:
+    """Download a Drive file in DOWNLOAD_CHUNK_BYTES blocks, yielding decoded text
+    
+    An incremental UTF-8 decoder carries multi-byte sequences split across
+    block boundaries, so only one block is ever held in memory.
+    """
+    if 'application/vnd.google-apps' in mime_type:
+        request = DRIVE_SERVICE.files().export_media(fileId=file_id, mimeType='text/plain')
+    else:
+        request = DRIVE_SERVICE.files().get_media(fileId=file_id)
+    
+    buffer = io.BytesIO()
+    downloader = MediaIoBaseDownload(buffer, request, chunksize=DOWNLOAD_CHUNK_BYTES)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    done = False
+    
+    while not done:
+        _, done = downloader.next_chunk()
+        block = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        text = decoder.decode(block, final=done)
+        if text:
+            yield text
+
+
+def _process_file_streaming(file_info: Dict) -> Dict:
+    """Chunk, summarize, embed and scan a large Drive file as it downloads
+    
+    Chunks are written in windows of STREAM_WINDOW_CHUNKS, PII and corruption
+    are scanned per chunk, and only the first 10,000 characters are kept for
+    the document row, so memory does not grow with file size. The MinHash
+    signature and the pooled document embedding used for duplicate detection
+    still cover the whole file.
+    """
+    file_id = file_info["id"]
+    filename = file_info["name"]
+    size = int(file_info.get("size_bytes") or 0)
+    
+    head = []
+    head_chars = 0
+    content_scan = _scan_content("")
+    minhasher = _MinHasher()
+    digest = hashlib.md5()
+    non_blank = 0
+    chunk_count = 0
+    window = []
+    pool = _EmbeddingPool()
+    
+    def flush(chunks: List[Dict]):
+        processed = _embed_chunks(_attach_summaries(chunks))
+        pool.add_chunks(processed)
+        if DB_POOL:
+            with _db_cursor() as cursor:
+                _bulk_upsert_chunks(cursor, file_id, filename, processed, prune=False)
+    
+    def scan(chunk: Dict, previous: Dict, following: Dict):
+        nonlocal non_blank, head_chars
+        owned = _scan_chunk(content_scan, chunk, previous, following)
+        non_blank += len(owned.strip())
+        minhasher.update(owned)
+        digest.update(owned.encode("utf-8"))
+        if head_chars < 10000:
+            head.append(owned)
+            head_chars += len(owned)
+    
+    before = previous = None
+    for chunk in iter_chunks(_stream_file_text(file_id, file_info["type"])):
+        if previous is not None:
+            scan(previous, before, chunk)
+        before, previous = previous, chunk
+        window.append(chunk)
+        chunk_count += 1
+        if len(window) >= STREAM_WINDOW_CHUNKS:
+            flush(window)
+            window = []
+    
+    if previous is not None:
+        scan(previous, before, None)
+    if window:
+        flush(window)
+    if DB_POOL:
+        with _db_cursor() as cursor:
+            _prune_chunks(cursor, file_id, chunk_count)
+    
+    # The owned spans concatenate to the whole text, so this is _content_hash of it
+    content_hash = digest.hexdigest() if non_blank >= EXACT_DUPLICATE_MIN_CHARS else None
+    return {
+        "chunks_created": chunk_count,
+        "duplicate_result": _detect_duplicates(file_id, "".join(head)[:10000], filename,
+                                               embedding=pool.finish(), signature=minhasher.finish(),
+                                               content_hash=content_hash, file_info=file_info),
+        "pii_result": _report_pii(content_scan, file_id, filename),
+        "quality_result": _report_quality(_quality_issues(content_scan, non_blank), file_id, filename, size)
+    }
+
+
+# ============================================
+# INCREMENTAL DRIVE SYNC
+# ============================================
+
+def _load_sync_state() -> tuple:
+    """(changes page token, ids of files to retry) saved by the last incremental run"""
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            SELECT name, value FROM drive_sync_state
+            WHERE name IN ('changes_page_token', 'retry_file_ids');
+        """)
+        state = dict(cursor.fetchall())
+    return state.get("changes_page_token"), json.loads(state.get("retry_file_ids") or "[]")
+
+
+def _save_sync_state(token: str, files: List[Dict]):
+    """Save the changes page token once a run's files have been processed
+    
+    The change log past the token no longer mentions the run's files, so
+    those not recorded in file_fingerprints (download or processing
+    failures) are saved to be listed again by the next run.
+    """
+    retry = [f["id"] for f in _filter_unchanged(files)]
+    with _db_cursor() as cursor:
+        execute_values(cursor, """
+            INSERT INTO drive_sync_state (name, value) VALUES %s
+            ON CONFLICT (name) DO UPDATE
+            SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP;
+        """, [("changes_page_token", token), ("retry_file_ids", json.dumps(retry))])
+    if retry:
+        print(f"🔁 {len(retry)} file(s) will be retried by the next incremental run")
+
+
+def _file_fingerprint_row(file_info: Dict) -> tuple:
+    modified = file_info.get("modified")
+    return (
+        file_info["id"],
+        file_info.get("md5_checksum"),
+        None if modified == "Unknown" else modified,
+        int(file_info.get("size_bytes") or 0)
+    )
+
+
+def _record_fingerprints(files: List[Dict]):
+    """Remember the Drive version of files that were fully processed"""
+    if not DB_POOL or not files:
+        return
+    with _db_cursor() as cursor:
+        execute_values(cursor, """
+            INSERT INTO file_fingerprints (file_id, md5_checksum, modified_time, size)
+            VALUES %s
+            ON CONFLICT (file_id) DO UPDATE
+            SET md5_checksum = EXCLUDED.md5_checksum,
+                modified_time = EXCLUDED.modified_time,
+                size = EXCLUDED.size,
+                synced_at = CURRENT_TIMESTAMP;
+        """, [_file_fingerprint_row(f) for f in files], page_size=DB_WRITE_PAGE_SIZE)
+
+
+def _record_if_processed(file_info: Dict, *results: Dict):
+    """Record file_info's fingerprint unless one of its steps reported an error
+    
+    A file left unrecorded is processed again by the next incremental sync.
+    """
+    failed = [result for result in results if result and result.get("status") == "error"]
+    if failed:
+        print(f"   ⚠️ Will retry next sync: {failed[0].get('message')}")
+        return
+    _record_fingerprints([file_info])
+
+
+def _filter_unchanged(files: List[Dict]) -> List[Dict]:
+    """Drop files whose md5Checksum, modifiedTime and size match the last sync"""
+    if not files:
+        return files
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            SELECT file_id, md5_checksum, modified_time, size
+            FROM file_fingerprints
+            WHERE file_id = ANY(%s);
+        """, ([f["id"] for f in files],))
+        known = {row[0]: row for row in cursor.fetchall()}
+    return [f for f in files if known.get(f["id"]) != _file_fingerprint_row(f)]
+
+
+def _forget_removed_files(file_ids: List[str]):
+    """Drop index rows for files deleted or trashed in Drive"""
+    if not file_ids:
+        return
+    with _db_cursor() as cursor:
+        _drop_index_rows(cursor, file_ids)
+        cursor.execute("DELETE FROM file_fingerprints WHERE file_id = ANY(%s);", (file_ids,))
+
+
+def _list_changed_files() -> Dict:
+    """List only files that are new or changed since the last sync
+    
+    The first run pages through the whole Drive and records a Changes API
+    start page token; later runs read just the change log from that token,
+    plus the files the previous run failed to process. Either way files
+    whose fingerprint matches file_fingerprints are dropped before anything
+    is downloaded. The caller saves next_page_token with _save_sync_state
+    once the returned files have been processed.
+    """
+    if not DRIVE_SERVICE:
+        return {"status": "error", "message": "Drive not authenticated. Run authenticate_google_drive first."}
+    if not DB_POOL:
+        return {"status": "error", "message": "Database not initialized"}
+    
+    try:
+        page_token, retry = _load_sync_state()
+        removed = []
+        
+        if page_token is None:
+            mode = "full"
+            # Take the token first so edits made during the scan are picked up next run
+            next_page_token = DRIVE_SERVICE.changes().getStartPageToken().execute()["startPageToken"]
+            candidates = _list_all_drive_files()
+        else:
+            mode = "changes"
+            changed = {}
+            next_page_token = None
+            while page_token:
+                response = DRIVE_SERVICE.changes().list(
+                    pageToken=page_token,
+                    pageSize=1000,
+                    spaces="drive",
+                    fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file(trashed, {DRIVE_FILE_FIELDS}))"
+                ).execute()
+                for change in response.get("changes", []):
+                    f = change.get("file")
+                    if change.get("removed") or not f or f.get("trashed"):
+                        changed.pop(change["fileId"], None)
+                        removed.append(change["fileId"])
+                    else:
+                        CHUNK_CACHE.observe(f["id"], _drive_fingerprint(f))
+                        changed[f["id"]] = f
+                page_token = response.get("nextPageToken")
+                next_page_token = response.get("newStartPageToken", next_page_token)
+            for file_id in retry:
+                if file_id in changed or file_id in removed:
+                    continue
+                try:
+                    f = DRIVE_SERVICE.files().get(fileId=file_id, fields=f"trashed, {DRIVE_FILE_FIELDS}").execute()
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    f = None
+                if not f or f.get("trashed"):
+                    removed.append(file_id)
+                else:
+                    changed[file_id] = f
+            candidates = list(changed.values())
+            removed = [file_id for file_id in removed if file_id not in changed]
+        
+        files = [_format_drive_file(f) for f in candidates]
+        changed_files = _filter_unchanged(files)
+        _forget_removed_files(removed)
+        
+        return {
+            "status": "success",
+            "mode": mode,
+            "count": len(changed_files),
+            "files": changed_files,
+            "skipped_unchanged": len(files) - len(changed_files),
+            "removed": len(removed),
+            "next_page_token": next_page_token
+        }
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to sync changes: {str(e)}"}
+
+
+# ============================================
+# EXACT DUPLICATES (CONTENT HASH)
+# ============================================
+
+# Texts with fewer non-blank characters (the quality check's "minimal content") are
+# never matched as exact duplicates: every empty file would be a copy of every other
+EXACT_DUPLICATE_MIN_CHARS = 10
+
+
+def _content_hash(content: str):
+    """MD5 of the extracted text; None for empty or near-empty text"""
+    if content is None or len(content.strip()) < EXACT_DUPLICATE_MIN_CHARS:
+        return None
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+def _exact_duplicate_clusters(files: List[Dict]) -> Dict[str, Dict]:
+    """Cluster listed files and indexed documents by Drive md5Checksum in one SQL pass
+    
+    Identical bytes extract to identical text, so this finds copies before
+    any download. Indexed documents are matched through the checksum in
+    file_fingerprints; documents.content_hash hashes text and is never
+    compared with Drive checksums. Returns each duplicate file_id mapped to
+    its canonical copy: the indexed document if there is one, else the
+    first listed file of the cluster. Everything else is checked by text
+    hash after download.
+    """
+    hashed = [
+        f for f in files
+        if f.get("md5_checksum") and int(f.get("size_bytes") or 0) >= EXACT_DUPLICATE_MIN_CHARS
+    ]
+    if not DB_POOL or not hashed:
+        return {}
+    
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            WITH listed AS (
+                SELECT *
+                FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::int[])
+                    AS l(file_id, filename, checksum, position)
+            ),
+            indexed AS (
+                SELECT d.file_id, d.filename, fp.md5_checksum AS checksum
+                FROM documents d
+                JOIN file_fingerprints fp ON fp.file_id = d.file_id
+                WHERE fp.md5_checksum IN (SELECT checksum FROM listed)
+            ),
+            members AS (
+                SELECT file_id, filename, checksum, -1 AS position
+                FROM indexed
+                UNION ALL
+                SELECT l.file_id, l.filename, l.checksum, l.position
+                FROM listed l
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM indexed i
+                    WHERE i.file_id = l.file_id AND i.checksum = l.checksum
+                )
+            )
+            SELECT array_agg(file_id ORDER BY position, file_id),
+                   array_agg(filename ORDER BY position, file_id)
+            FROM members
+            GROUP BY checksum
+            HAVING count(*) > 1;
+        """, (
+            [f["id"] for f in hashed],
+            [f["name"] for f in hashed],
+            [f["md5_checksum"] for f in hashed],
+            list(range(len(hashed)))
+        ))
+        clusters = cursor.fetchall()
+    
+    duplicates = {}
+    for file_ids, filenames in clusters:
+        canonical = {"file_id": file_ids[0], "filename": filenames[0]}
+        for file_id in file_ids[1:]:
+            duplicates[file_id] = canonical
+    return duplicates
+
+
+def _exact_duplicate_of(file_id: str, content_hash: str):
+    """Indexed document with the same content hash as file_id, if any"""
+    if not DB_POOL or not content_hash:
+        return None
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            SELECT file_id, filename FROM documents
+            WHERE content_hash = %s AND file_id != %s;
+        """, (content_hash, file_id))
+        row = cursor.fetchone()
+    return {"file_id": row[0], "filename": row[1]} if row else None
+
+
+def _drop_index_rows(cursor, file_ids: List[str]):
+    """Remove documents, chunks and near-duplicate index rows. The caller owns the transaction."""
+    cursor.execute("DELETE FROM document_chunks WHERE file_id = ANY(%s);", (file_ids,))
+    cursor.execute("DELETE FROM documents WHERE file_id = ANY(%s);", (file_ids,))
+    cursor.execute("DELETE FROM document_lsh_bands WHERE file_id = ANY(%s);", (file_ids,))
+    cursor.execute("DELETE FROM document_minhash WHERE file_id = ANY(%s);", (file_ids,))
+
+
+def _report_exact_duplicate(file_id: str, filename: str, canonical: Dict) -> Dict:
+    """Flag an identical copy without embedding it
+    
+    Only the canonical copy stays indexed, so rows left from an earlier
+    version of this file are dropped.
+    """
+    if DB_POOL:
+        with _db_cursor() as cursor:
+            _drop_index_rows(cursor, [file_id])
+    
+    duplicates = [{
+        "duplicate_file_id": canonical["file_id"],
+        "duplicate_filename": canonical["filename"],
+        "similarity_score": 100.0,
+        "match": "EXACT",
+        "confidence": "HIGH"
+    }]
+    issue = {
+        "type": "DUPLICATE",
+        "file_id": file_id,
+        "filename": filename,
+        "duplicates": duplicates,
+        "action": "REMOVE_DUPLICATE",
+        "confidence": "HIGH",
+        "recommendation": f"Identical copy of {canonical['filename']}; remove it to save storage"
+    }
+    DETECTED_ISSUES.append(issue)
+    PENDING_APPROVALS.append(issue)
+    
+    return {
+        "status": "success",
+        "duplicates_found": 1,
+        "exact_match": True,
+        "details": duplicates,
+        "threshold_used": "exact"
+    }
+
+
+def _exact_duplicate_result(file_info: Dict, exact: Dict[str, Dict], content: str = None):
+    """Report file_info as an identical copy if the cluster pass or its text hash says so
+    
+    Returns the duplicate result, or None when the file needs the full pipeline.
+    """
+    canonical = exact.get(file_info["id"])
+    if canonical is None and content is not None:
+        canonical = _exact_duplicate_of(file_info["id"], _content_hash(content))
+    if canonical is None:
+        return None
+    return _report_exact_duplicate(file_info["id"], file_info["name"], canonical)
+
+
+# ============================================
+# NEAR-DUPLICATE INDEX (MINHASH + LSH)
+# ============================================
+
+# Universal hashing (a*x + b) mod p over 32-bit shingle hashes. The seed is
+# fixed because signatures are persisted and compared across runs.
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_MINHASH_RNG = np.random.default_rng(20240611)
+_MINHASH_A = _MINHASH_RNG.integers(1, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MINHASH_B = _MINHASH_RNG.integers(0, 1 << 32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MINHASH_BLOCK = 4096
+
+
+class _MinHasher:
+    """Incremental MinHash signature over lowercase word shingles
+    
+    Text may arrive in pieces (streamed chunk spans); a word split across
+    pieces and the last few words of each piece carry over, so the signature
+    equals the one computed over the concatenated text.
+    """
+    
+    def __init__(self, shingle_words: int = None):
+        self.k = shingle_words or MINHASH_SHINGLE_WORDS
+        self.signature = np.full(MINHASH_PERMUTATIONS, _MAX_HASH, dtype=np.uint64)
+        self.shingles = 0
+        self._words = []
+        self._partial = ""
+    
+    def update(self, text: str) -> "_MinHasher":
+        text = self._partial + text
+        words = text.lower().split()
+        self._partial = words.pop() if words and not text[-1].isspace() else ""
+        self._consume(words)
+        return self
+    
+    def finish(self):
+        """Signature as uint32 array, or None for text without any words"""
+        if self._partial:
+            self._consume([self._partial.lower()])
+            self._partial = ""
+        if not self.shingles and self._words:
+            # Shorter than one shingle: the whole text is the only shingle
+            self._hash([" ".join(self._words)])
+        if not self.shingles:
+            return None
+        return self.signature.astype("<u4")
+    
+    def _consume(self, words: List[str]):
+        words = self._words + words
+        k = self.k
+        if len(words) >= k:
+            self._hash([" ".join(words[i:i + k]) for i in range(len(words) - k + 1)])
+        self._words = words[-(k - 1):] if k > 1 else []
+    
+    def _hash(self, shingles: List[str]):
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        for start in range(0, len(hashes), _MINHASH_BLOCK):
+            block = hashes[start:start + _MINHASH_BLOCK]
+            permuted = (np.outer(_MINHASH_A, block) + _MINHASH_B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+            np.minimum(self.signature, permuted.min(axis=1), out=self.signature)
+        self.shingles += len(shingles)
+
+
+def _minhash_signature(content: str):
+    return _MinHasher().update(content).finish()
+
+
+def _lsh_buckets(signature: np.ndarray) -> List[tuple]:
+    """(band, bucket) pairs: each band of rows hashed to a signed 64-bit bucket"""
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+            "little", signed=True))
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def _store_minhash(cursor, file_id: str, signature):
+    """Replace a document's signature and LSH buckets. The caller owns the transaction."""
+    cursor.execute("DELETE FROM document_lsh_bands WHERE file_id = %s;", (file_id,))
+    if signature is None:
+        cursor.execute("DELETE FROM document_minhash WHERE file_id = %s;", (file_id,))
+        return
+    
+    cursor.execute("""
+        INSERT INTO document_minhash (file_id, signature)
+        VALUES (%s, %s)
+        ON CONFLICT (file_id) DO UPDATE
+        SET signature = EXCLUDED.signature,
+            updated_at = CURRENT_TIMESTAMP;
+    """, (file_id, psycopg2.Binary(signature.tobytes())))
+    execute_values(cursor, """
+        INSERT INTO document_lsh_bands (band, bucket, file_id)
+        VALUES %s
+        ON CONFLICT DO NOTHING;
+    """, [(band, bucket, file_id) for band, bucket in _lsh_buckets(signature)])
+
+
+def _near_duplicate_candidates(cursor, file_id: str, signature) -> Dict[str, float]:
+    """Documents sharing an LSH bucket with the signature, mapped to estimated Jaccard
+    
+    Only pairs whose estimate reaches MINHASH_THRESHOLD are returned.
+    """
+    if signature is None:
+        return {}
+    
+    bands, buckets = zip(*_lsh_buckets(signature))
+    cursor.execute("""
+        SELECT m.file_id, m.signature
+        FROM document_minhash m
+        WHERE m.file_id IN (
+            SELECT b.file_id
+            FROM document_lsh_bands b
+            JOIN unnest(%s::smallint[], %s::bigint[]) AS q(band, bucket)
+              ON b.band = q.band AND b.bucket = q.bucket
+            WHERE b.file_id != %s
+        );
+    """, (list(bands), list(buckets), file_id))
+    
+    # Signatures from a different MINHASH_PERMUTATIONS setting are not comparable
+    rows = [(other_id, bytes(stored)) for other_id, stored in cursor.fetchall()
+            if len(stored) == signature.nbytes]
+    if not rows:
+        return {}
+    
+    others = np.frombuffer(b"".join(stored for _, stored in rows), dtype="<u4").reshape(len(rows), -1)
+    estimates = (others == signature).mean(axis=1)
+    return {
+        other_id: float(estimate)
+        for (other_id, _), estimate in zip(rows, estimates)
+        if estimate >= MINHASH_THRESHOLD
+    }
+
+
 # ============================================
 # DUPLICATE DETECTION WITH PGVECTOR
 # ============================================
 
 def detect_duplicates(file_id: str, content: str, filename: str, threshold: float = 0.85) -> Dict:
-    """Detect duplicate documents using pgvector similarity search
+    """Detect exact and near-duplicate documents
+    
+    Identical content is matched by hash without embedding. Otherwise
+    candidates come from the MinHash/LSH index over the whole document and
+    pgvector cosine similarity confirms each candidate.
     
     Args:
         file_id: File identifier
@@ -398,50 +3096,74 @@ def detect_duplicates(file_id: str, content: str, filename: str, threshold: floa
         filename: Name of the file
         threshold: Similarity threshold (default 0.85 = 85%)
     """
-    if not PG_CONNECTION:
+    return _detect_duplicates(file_id, content, filename, threshold)
+
+
+def _detect_duplicates(file_id: str, content: str, filename: str, threshold: float = 0.85,
+                       embedding: np.ndarray = None, signature: np.ndarray = None,
+                       content_hash: str = None, file_info: Dict = None) -> Dict:
+    """detect_duplicates with an optional precomputed embedding, MinHash signature and content hash
+    
+    The streaming path passes an embedding, signature and hash built over
+    the whole file while only a prefix of the content is stored. Without an
+    embedding, a chunked file's chunk embeddings are pooled. file_info
+    supplies the Drive metadata stored with the document for filtered search.
+    """
+    if not DB_POOL:
         return {"status": "error", "message": "Database not initialized"}
     
     try:
-       
-        embedding = generate_embedding(content[:8000])  
-        
-        cursor = PG_CONNECTION.cursor()
+        content_hash = content_hash or _content_hash(content)
+        canonical = _exact_duplicate_of(file_id, content_hash)
+        if canonical:
+            return _report_exact_duplicate(file_id, filename, canonical)
         
-       
-        cursor.execute("""
-            SELECT file_id, filename, 
-                   1 - (embedding <=> %s::vector) as similarity
-            FROM documents
-            WHERE file_id != %s
-            ORDER BY embedding <=> %s::vector
-            LIMIT 5;
-        """, (embedding, file_id, embedding))
+        if embedding is None:
+            embedding = _document_embedding(file_id, content)
+        if signature is None:
+            signature = _minhash_signature(content)
         
-        results = cursor.fetchall()
         duplicates = []
-        
-        for row in results:
-            similar_file_id, similar_filename, similarity = row
-            if similarity >= threshold:
-                duplicates.append({
-                    "duplicate_file_id": similar_file_id,
-                    "duplicate_filename": similar_filename,
-                    "similarity_score": round(similarity * 100, 2),
-                    "confidence": "HIGH" if similarity >= 0.9 else "MEDIUM"
-                })
-        
-       
-        cursor.execute("""
-            INSERT INTO documents (file_id, filename, content, embedding, metadata)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (file_id) DO UPDATE 
-            SET filename = EXCLUDED.filename,
-                content = EXCLUDED.content,
-                embedding = EXCLUDED.embedding;
-        """, (file_id, filename, content[:10000], embedding, {'source': 'google_drive'}))
-        
-        PG_CONNECTION.commit()
-        cursor.close()
+        try:
+            with _db_cursor() as cursor:
+                candidates = _near_duplicate_candidates(cursor, file_id, signature)
+                
+                if candidates:
+                    cursor.execute("""
+                        SELECT file_id, filename, 
+                               1 - (embedding <=> %s::vector) as similarity
+                        FROM documents
+                        WHERE file_id = ANY(%s);
+                    """, (embedding, list(candidates)))
+                
+                    for similar_file_id, similar_filename, similarity in cursor.fetchall():
+                        if similarity >= threshold:
+                            jaccard = candidates[similar_file_id]
+                            duplicates.append({
+                                "duplicate_file_id": similar_file_id,
+                                "duplicate_filename": similar_filename,
+                                "similarity_score": round(similarity * 100, 2),
+                                "jaccard_estimate": round(jaccard * 100, 2),
+                                "match": "NEAR",
+                                "confidence": "HIGH" if similarity >= 0.9 else "MEDIUM"
+                            })
+                    duplicates.sort(key=lambda d: (d["jaccard_estimate"], d["similarity_score"]), reverse=True)
+                
+                _bulk_upsert_documents(cursor, [{
+                    "file_id": file_id,
+                    "filename": filename,
+                    "content": content[:10000],
+                    "content_hash": content_hash,
+                    "embedding": embedding,
+                    "metadata": _document_metadata(file_info)
+                }])
+                _store_minhash(cursor, file_id, signature)
+        except psycopg2.errors.UniqueViolation:
+            # A concurrent worker indexed identical content after the check above
+            canonical = _exact_duplicate_of(file_id, content_hash)
+            if canonical is None:
+                raise
+            return _report_exact_duplicate(file_id, filename, canonical)
         
         if duplicates:
             issue = {
@@ -459,6 +3181,7 @@ def detect_duplicates(file_id: str, content: str, filename: str, threshold: floa
         return {
             "status": "success",
             "duplicates_found": len(duplicates),
+            "candidates_checked": len(candidates),
             "details": duplicates,
             "threshold_used": f"{threshold * 100}%"
         }
@@ -466,34 +3189,389 @@ def detect_duplicates(file_id: str, content: str, filename: str, threshold: floa
         return {"status": "error", "message": f"Duplicate detection failed: {str(e)}"}
 
 
+# ============================================
+# CORPUS-WIDE DUPLICATE CLUSTERING
+# ============================================
+
+def _load_document_embeddings():
+    """All document embeddings as a row-normalized float32 matrix, oldest first
+    
+    Rows are streamed through a server-side cursor straight into one
+    preallocated matrix. Vectors travel as text and are parsed by NumPy,
+    which is fast and independent of the pgvector client version.
+    Documents without an embedding are skipped.
+    """
+    with _db_cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM documents WHERE embedding IS NOT NULL;")
+        total = cursor.fetchone()[0]
+    
+    matrix = np.empty((total, EMBEDDING_DIM), dtype=np.float32)
+    file_ids, filenames = [], []
+    with _db_cursor(name="dedupe_embeddings") as cursor:
+        cursor.itersize = DEDUPE_BLOCK_ROWS
+        cursor.execute("""
+            SELECT file_id, filename, embedding::text
+            FROM documents
+            WHERE embedding IS NOT NULL
+            ORDER BY created_at, id;
+        """)
+        for file_id, filename, embedding in cursor:
+            # Rows inserted after the count are left for the next run
+            if len(file_ids) == total:
+                break
+            matrix[len(file_ids)] = np.fromstring(embedding[1:-1], dtype=np.float32, sep=",")
+            file_ids.append(file_id)
+            filenames.append(filename)
+    
+    matrix = matrix[:len(file_ids)]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix, file_ids, filenames
+
+
+def _find_roots(parent: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Vectorized union-find lookup with path compression"""
+    roots = parent[nodes]
+    while True:
+        above = parent[roots]
+        if np.array_equal(above, roots):
+            break
+        roots = above
+    parent[nodes] = roots
+    return roots
+
+
+def _union_pairs(parent: np.ndarray, left: np.ndarray, right: np.ndarray):
+    """Merge the components of every (left, right) pair
+    
+    Roots always link to the smaller root, so the oldest document ends up as
+    the root of its cluster. When several pairs write the same root, one write
+    wins and the others are retried on the next round.
+    """
+    while left.size:
+        left_roots = _find_roots(parent, left)
+        right_roots = _find_roots(parent, right)
+        apart = left_roots != right_roots
+        if not apart.any():
+            return
+        left_roots, right_roots = left_roots[apart], right_roots[apart]
+        parent[np.maximum(left_roots, right_roots)] = np.minimum(left_roots, right_roots)
+        left, right = left[apart], right[apart]
+
+
+def _cluster_similar(matrix: np.ndarray, threshold: float, block_rows: int):
+    """All-pairs cosine similarity in blocks, merged into connected components
+    
+    Only tiles on or above the diagonal are multiplied, and each tile is at most
+    block_rows × block_rows, so memory stays flat while the work stays in BLAS.
+    Returns the parent array, each document's best match similarity and the
+    number of pairs above the threshold.
+    """
+    count = len(matrix)
+    parent = np.arange(count)
+    best = np.zeros(count, dtype=np.float32)
+    pairs = 0
+    
+    for row_start in range(0, count, block_rows):
+        rows = matrix[row_start:row_start + block_rows]
+        for col_start in range(row_start, count, block_rows):
+            similarity = rows @ matrix[col_start:col_start + block_rows].T
+            above = similarity >= threshold
+            if col_start == row_start:
+                # Diagonal tile: each pair once, never a document with itself
+                above = np.triu(above, k=1)
+            left, right = np.nonzero(above)
+            if not left.size:
+                continue
+            
+            scores = similarity[left, right]
+            left += row_start
+            right += col_start
+            np.maximum.at(best, left, scores)
+            np.maximum.at(best, right, scores)
+            _union_pairs(parent, left, right)
+            pairs += len(left)
+    
+    return _find_roots(parent, np.arange(count)), best, pairs
+
+
+def dedupe_corpus(threshold: float = 0.85) -> Dict:
+    """Cluster near-duplicate documents across the whole corpus
+    
+    Compares every pair of document embeddings and raises one approval issue
+    per cluster (keep the oldest document, remove the rest), replacing any
+    per-file duplicate issues for the same documents.
+    
+    Args:
+        threshold: Cosine similarity threshold (default 0.85 = 85%)
+    """
+    if not DB_POOL:
+        return {"status": "error", "message": "Database not initialized"}
+    
+    try:
+        started = time.perf_counter()
+        matrix, file_ids, filenames = _load_document_embeddings()
+        loaded = time.perf_counter()
+        roots, best, pairs = _cluster_similar(matrix, threshold, DEDUPE_BLOCK_ROWS)
+        clustered = time.perf_counter()
+        
+        members = {}
+        for idx in np.flatnonzero(roots != np.arange(len(roots))):
+            members.setdefault(int(roots[idx]), []).append(int(idx))
+        
+        clustered_ids = set()
+        issues = []
+        for keep, duplicates in sorted(members.items(), key=lambda item: -len(item[1])):
+            clustered_ids.add(file_ids[keep])
+            clustered_ids.update(file_ids[idx] for idx in duplicates)
+            weakest = float(best[duplicates].min())
+            issues.append({
+                "type": "DUPLICATE_CLUSTER",
+                "file_id": file_ids[keep],
+                "filename": filenames[keep],
+                "cluster_size": len(duplicates) + 1,
+                "duplicates": [
+                    {
+                        "duplicate_file_id": file_ids[idx],
+                        "duplicate_filename": filenames[idx],
+                        "similarity_score": round(float(best[idx]) * 100, 2)
+                    }
+                    for idx in duplicates
+                ],
+                "action": "REMOVE_DUPLICATES",
+                "confidence": "HIGH" if weakest >= 0.9 else "MEDIUM",
+                "recommendation": f"Keep {filenames[keep]} and remove {len(duplicates)} duplicate(s) to save storage"
+            })
+        
+        # One issue per cluster: drop earlier cluster issues and per-file ones they cover
+        PENDING_APPROVALS[:] = [
+            issue for issue in PENDING_APPROVALS
+            if issue["type"] != "DUPLICATE_CLUSTER"
+            and not (issue["type"] == "DUPLICATE" and issue["file_id"] in clustered_ids)
+        ]
+        DETECTED_ISSUES.extend(issues)
+        PENDING_APPROVALS.extend(issues)
+        
+        return {
+            "status": "success",
+            "documents_compared": len(file_ids),
+            "pairs_above_threshold": pairs,
+            "clusters_found": len(issues),
+            "duplicate_files": len(clustered_ids) - len(issues),
+            "largest_cluster": issues[0]["cluster_size"] if issues else 0,
+            "threshold_used": f"{threshold * 100}%",
+            "load_seconds": round(loaded - started, 2),
+            "cluster_seconds": round(clustered - loaded, 2)
+        }
+    except Exception as e:
+        return {"status": "error", "message": f"Corpus dedupe failed: {str(e)}"}
+
+
+# ============================================
+# CONTENT SCANNING
+# ============================================
+
+PII_PATTERNS = {
+    "email": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    "phone": r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b',
+    "ssn": r'\b\d{3}-\d{2}-\d{4}\b',
+    "credit_card": r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'
+}
+
+CORRUPTION_PATTERNS = [
+    (r'[\x00-\x08\x0B\x0C\x0E-\x1F]', "Control characters detected"),
+    (r'�{3,}', "Multiple replacement characters (corruption)")
+]
+
+PII_MAX_OFFSETS = int(os.getenv("PII_MAX_OFFSETS", "100"))
+
+def _without_word_boundary(pattern: str) -> str:
+    return pattern[2:] if pattern.startswith(r'\b') else pattern
+
+
+# One alternation over every detector. The shared leading \b is factored out
+# and the digit-only types sit behind a (?=\d) guard, which keeps the combined
+# pass faster than running each pattern separately. More specific types come
+# first so a match is attributed to exactly one type.
+_SCANNER = re.compile(
+    r'\b(?:(?=\d)(?:' +
+    "|".join(f"(?P<{name}>{_without_word_boundary(PII_PATTERNS[name])})" for name in ("ssn", "credit_card", "phone")) +
+    f')|(?P<email>{_without_word_boundary(PII_PATTERNS["email"])}))|' +
+    "|".join(f"(?P<corruption{idx}>{pattern})" for idx, (pattern, _) in enumerate(CORRUPTION_PATTERNS))
+)
+_CORRUPTION_SCANNER = re.compile("|".join(
+    f"(?P<corruption{idx}>{pattern})" for idx, (pattern, _) in enumerate(CORRUPTION_PATTERNS)
+))
+
+
+def _luhn_valid(number: str) -> bool:
+    """Luhn checksum, which every real payment card number satisfies"""
+    digits = [int(c) for c in number if c.isdigit()]
+    checksum = sum(digits[-1::-2]) + sum(sum(divmod(2 * d, 10)) for d in digits[-2::-2])
+    return checksum % 10 == 0
+
+
+def _scan_content(content: str, scan: Dict = None, start: int = 0, end: int = None, base_offset: int = 0, scanner=None) -> Dict:
+    """Run every PII and corruption detector over content in a single pass
+    
+    Results accumulate into scan, so a file can be scanned chunk by chunk.
+    Only matches starting in [start, end) are counted; text outside that
+    range still serves as context for word boundaries. base_offset shifts
+    reported offsets to positions in the whole file. Card-like numbers that
+    fail the Luhn check are counted as rejected rather than flagged.
+    
+    Returns:
+        {"pii": {type: {"count", "samples", "offsets"}},
+         "corruption": set of CORRUPTION_PATTERNS indexes,
+         "luhn_rejected": int,
+         "resume_at": file offset where the last match ended}
+    """
+    if scan is None:
+        scan = {"pii": {}, "corruption": set(), "luhn_rejected": 0, "resume_at": 0}
+    
+    pattern = scanner or _SCANNER
+    position = start
+    while True:
+        m = pattern.search(content, position)
+        if m is None or (end is not None and m.start() >= end):
+            break
+        if base_offset + m.start() < scan["resume_at"]:
+            # Overlaps a match the previous chunk already counted: search again
+            # from where that match ended, as a whole-text scan would
+            position = scan["resume_at"] - base_offset
+            continue
+        position = m.end() if m.end() > m.start() else m.end() + 1
+        scan["resume_at"] = base_offset + m.end()
+        kind = m.lastgroup
+        if kind.startswith("corruption"):
+            scan["corruption"].add(int(kind[len("corruption"):]))
+            continue
+        value = m.group()
+        if kind == "credit_card" and not _luhn_valid(value):
+            scan["luhn_rejected"] += 1
+            continue
+        found = scan["pii"].setdefault(kind, {"count": 0, "samples": [], "offsets": []})
+        found["count"] += 1
+        if len(found["samples"]) < 3:
+            found["samples"].append(value)
+        if len(found["offsets"]) < PII_MAX_OFFSETS:
+            found["offsets"].append(base_offset + m.start())
+    
+    return scan
+
+
+def _owned_span(chunk: Dict, previous: Dict = None, following: Dict = None) -> tuple:
+    """The part of a chunk that it alone is responsible for scanning
+    
+    Where neighbouring chunks overlap, ownership switches halfway through the
+    overlap, so every match has at least half the overlap as context on each
+    side. Chunks that only touch own all of their text.
+    """
+    start = max(0, previous["end_pos"] - chunk["start_pos"]) // 2 if previous else 0
+    if following is None:
+        return start, None
+    shared = max(0, chunk["end_pos"] - following["start_pos"])
+    return start, following["start_pos"] - chunk["start_pos"] + shared // 2
+
+
+def _scan_chunk(scan: Dict, chunk: Dict, previous: Dict = None, following: Dict = None) -> str:
+    """Scan the span a chunk owns (see _owned_span) into scan; returns that text
+    
+    The following chunk's text past this one's end is appended as context,
+    so a match starting here can run on across a boundary where the chunks
+    only touch, as it would in a whole-text scan.
+    """
+    start, end = _owned_span(chunk, previous, following)
+    text = chunk["text"]
+    if following is not None:
+        text += following["text"][max(0, chunk["end_pos"] - following["start_pos"]):]
+    _scan_content(text, scan, start, end, chunk["start_pos"])
+    return chunk["text"][start:end]
+
+
+def _quality_issues(scan: Dict, non_blank_chars: int) -> List[str]:
+    """Content-level quality issues from a scan (size is checked separately)"""
+    quality_issues = []
+    
+    if non_blank_chars < 10:
+        quality_issues.append("Empty or minimal content (less than 10 characters)")
+    
+    if scan["corruption"]:
+        quality_issues.append(CORRUPTION_PATTERNS[min(scan["corruption"])][1])
+    
+    return quality_issues
+
+
+_SCAN_POOL_LOCK = threading.Lock()
+
+
+def _get_scan_pool():
+    """Start the scanning process pool on first use; None when disabled"""
+    global SCAN_POOL
+    
+    with _SCAN_POOL_LOCK:
+        if SCAN_POOL is None and SCAN_WORKERS > 0:
+            SCAN_POOL = ProcessPoolExecutor(
+                max_workers=SCAN_WORKERS,
+                mp_context=multiprocessing.get_context(SCAN_START_METHOD)
+            )
+    return SCAN_POOL
+
+
+def _scan_shared_buffer(name: str, size: int, corruption_only: bool):
+    """Process-pool entry point: scan UTF-8 text held in a shared memory block"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        content = bytes(shm.buf[:size]).decode("utf-8")
+    finally:
+        shm.close()
+    scan = _scan_content(content, scanner=_CORRUPTION_SCANNER if corruption_only else None)
+    return scan, len(content.strip())
+
+
+def _scan_text(content: str, corruption_only: bool = False):
+    """Scan content, in the process pool when it is large enough to pay off
+    
+    Only the name of a shared memory block crosses the process boundary, never
+    a pickled copy of the text, and the calling thread releases the GIL while
+    it waits. Returns (scan, non-blank character count).
+    """
+    pool = _get_scan_pool() if len(content) >= SCAN_POOL_MIN_CHARS else None
+    if pool is None:
+        scan = _scan_content(content, scanner=_CORRUPTION_SCANNER if corruption_only else None)
+        return scan, len(content.strip())
+    
+    data = content.encode("utf-8")
+    size = len(data)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+    try:
+        shm.buf[:size] = data
+        del data
+        return pool.submit(_scan_shared_buffer, shm.name, size, corruption_only).result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _scan_and_report(content: str, file_id: str, filename: str, file_size: int):
+    """detect_pii and validate_quality sharing one pass over the content"""
+    scan, non_blank = _scan_text(content)
+    return _report_scan(scan, non_blank, file_id, filename, file_size)
+
+
+def _report_scan(scan: Dict, non_blank: int, file_id: str, filename: str, file_size: int):
+    pii_result = _report_pii(scan, file_id, filename)
+    quality_result = _report_quality(_quality_issues(scan, non_blank), file_id, filename, file_size)
+    return pii_result, quality_result
+
+
 # ============================================
 # PII DETECTION
 # ============================================
 
-def detect_pii(content: str, file_id: str, filename: str) -> Dict:
-    """Detect PII using pattern matching
-    
-    Args:
-        content: Document content
-        file_id: File identifier
-        filename: Name of the file
-    """
-    pii_patterns = {
-        "email": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-        "phone": r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b',
-        "ssn": r'\b\d{3}-\d{2}-\d{4}\b',
-        "credit_card": r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'
-    }
-    
-    detected_pii = {}
-    
-    for pii_type, pattern in pii_patterns.items():
-        matches = re.findall(pattern, content)
-        if matches:
-            detected_pii[pii_type] = {
-                "count": len(matches),
-                "samples": matches[:3] 
-            }
+def _report_pii(scan: Dict, file_id: str, filename: str) -> Dict:
+    """Raise a PII approval issue for the findings and build the tool result"""
+    detected_pii = scan["pii"]
     
     if detected_pii:
         issue = {
@@ -513,40 +3591,29 @@ def detect_pii(content: str, file_id: str, filename: str) -> Dict:
         "status": "success",
         "pii_found": len(detected_pii) > 0,
         "details": detected_pii,
-        "patterns_checked": list(pii_patterns.keys())
+        "luhn_rejected": scan["luhn_rejected"],
+        "patterns_checked": list(PII_PATTERNS.keys())
     }
 
 
-# ============================================
-# QUALITY VALIDATION
-# ============================================
-
-def validate_quality(content: str, file_id: str, filename: str, file_size: int) -> Dict:
-    """Validate file quality and integrity
+def detect_pii(content: str, file_id: str, filename: str) -> Dict:
+    """Detect PII using pattern matching
     
     Args:
         content: Document content
         file_id: File identifier
         filename: Name of the file
-        file_size: Size of file in bytes
     """
-    quality_issues = []
-    
-  
-    if len(content.strip()) < 10:
-        quality_issues.append("Empty or minimal content (less than 10 characters)")
-    
-    
-    corruption_patterns = [
-        (r'[\x00-\x08\x0B\x0C\x0E-\x1F]', "Control characters detected"),
-        (r'�{3,}', "Multiple replacement characters (corruption)")
-    ]
-    
-    for pattern, description in corruption_patterns:
-        if re.search(pattern, content):
-            quality_issues.append(description)
-            break
-    
+    scan, _ = _scan_text(content)
+    return _report_pii(scan, file_id, filename)
+
+
+# ============================================
+# QUALITY VALIDATION
+# ============================================
+
+def _report_quality(quality_issues: List[str], file_id: str, filename: str, file_size: int) -> Dict:
+    """Add the size check, raise a quality approval issue and build the tool result"""
    
     if file_size > 500 * 1024 * 1024: 
         quality_issues.append("File exceeds size limit (500MB)")
@@ -572,6 +3639,19 @@ def validate_quality(content: str, file_id: str, filename: str, file_size: int)
     }
 
 
+def validate_quality(content: str, file_id: str, filename: str, file_size: int) -> Dict:
+    """Validate file quality and integrity
+    
+    Args:
+        content: Document content
+        file_id: File identifier
+        filename: Name of the file
+        file_size: Size of file in bytes
+    """
+    scan, non_blank = _scan_text(content, corruption_only=True)
+    return _report_quality(_quality_issues(scan, non_blank), file_id, filename, file_size)
+
+
 # ============================================
 # HITL APPROVAL WORKFLOW
 # ============================================
@@ -633,47 +3713,89 @@ def reject_action(issue_index: int, reason: str = "False positive") -> Dict:
     }
 
 
-def semantic_search(query: str, limit: int = 5) -> Dict:
+def semantic_search(query: str, limit: int = 5, recall: str = "balanced",
+                    mode: str = "vector", lexical_weight: float = 0.5,
+                    filename: str = "", mime_type: str = "", owner: str = "",
+                    modified_after: str = "", modified_before: str = "") -> Dict:
     """Search documents using semantic similarity (document-level)
     
     Args:
         query: Search query
         limit: Maximum results
+        recall: "fast", "balanced", "high" or "exact" (slower, full scan)
+        mode: "vector", or "hybrid" to also match exact terms such as
+            invoice numbers, SKUs and names through the full-text index
+        lexical_weight: Hybrid only; share of the fused score given to
+            full-text matches (0 = vector only, 1 = full-text only)
+        filename: Only files whose name contains this text
+        mime_type: Only files of this exact MIME type (e.g. application/pdf)
+        owner: Only files owned by this email address
+        modified_after: Only files modified on/after this ISO date (e.g. 2024-01-31)
+        modified_before: Only files modified before this ISO date
     """
-    if not PG_CONNECTION:
+    return _cached_search("document", _semantic_search, query, limit,
+                          recall=recall, mode=mode, lexical_weight=lexical_weight,
+                          filename=filename, mime_type=mime_type, owner=owner,
+                          modified_after=modified_after, modified_before=modified_before)
+
+
+def _semantic_search(query: str, limit: int, recall: str, mode: str, lexical_weight: float, **filters) -> Dict:
+    if not DB_POOL:
         return {"status": "error", "message": "Database not initialized"}
     
     try:
-        query_embedding = generate_embedding(query)
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {', '.join(SEARCH_MODES)}")
+        filters = {key: value for key, value in filters.items() if value}
+        condition, filter_params = _metadata_filter(filters, "t")
+        query_embedding = generate_embeddings([query])[0]
         
-        cursor = PG_CONNECTION.cursor()
-        cursor.execute("""
-            SELECT file_id, filename, content,
-                   1 - (embedding <=> %s::vector) as similarity
-            FROM documents
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s;
-        """, (query_embedding, query_embedding, limit))
-        
-        results = cursor.fetchall()
-        cursor.close()
+        with _db_cursor() as cursor:
+            if mode == "hybrid":
+                params = {**_hybrid_params(query, query_embedding, limit, lexical_weight), **filter_params}
+                results, index_used = _hybrid_search(cursor, "documents", condition, params, recall, """
+                    SELECT d.file_id, d.filename, d.preview,
+                           1 - (d.embedding <=> %(embedding)s::vector) as similarity,
+                           f.score
+                    FROM fused f
+                    JOIN documents d ON d.id = f.id
+                    ORDER BY f.score DESC, similarity DESC
+                    LIMIT %(limit)s;
+                """)
+            else:
+                results, index_used = _vector_search(cursor, "documents", lambda source: f"""
+                    SELECT t.file_id, t.filename, t.preview,
+                           1 - (t.embedding <=> %(embedding)s::vector) as similarity
+                    FROM {source} t
+                    WHERE {condition or "TRUE"}
+                    ORDER BY t.embedding <=> %(embedding)s::vector
+                    LIMIT %(limit)s;
+                """, {"embedding": query_embedding, "limit": limit, **filter_params}, limit, recall,
+                    filtered=bool(condition))
         
         search_results = [
             {
                 "file_id": row[0],
                 "filename": row[1],
-                "preview": row[2][:200] + "..." if row[2] and len(row[2]) > 200 else row[2],
+                "preview": row[2],
                 "relevance_score": round(row[3] * 100, 2)
             }
             for row in results
         ]
+        if mode == "hybrid":
+            for result, row in zip(search_results, results):
+                result["fusion_score"] = round(row[4], 5)
         
         return {
             "status": "success",
             "query": query,
             "results": search_results,
             "count": len(search_results),
-            "search_type": "document-level"
+            "search_type": "document-level",
+            "mode": mode,
+            "filters": filters,
+            "recall": recall,
+            "index": index_used
         }
     except Exception as e:
         return {"status": "error", "message": f"Search failed: {str(e)}"}
@@ -683,26 +3805,58 @@ def semantic_search(query: str, limit: int = 5) -> Dict:
 # BATCH PROCESSING
 # ============================================
 
-def process_all_files() -> Dict:
-    """Process all Drive files in batch with HITL checkpoints"""
+def _report_file_scan(filename: str, duplicate_result: Dict, pii_result: Dict, quality_result: Dict) -> Dict:
+    """Build the per-file batch summary and print its findings"""
+    file_summary = {
+        "file": filename,
+        "duplicates": duplicate_result.get("duplicates_found", 0),
+        "pii": pii_result.get("pii_found", False),
+        "quality_issues": quality_result.get("quality_issues_found", False)
+    }
     
-  
-    files_result = list_drive_files(max_files=20)
-    if files_result["status"] != "success":
-        return files_result
+    if file_summary["duplicates"] > 0:
+        print(f"   🔄 Found {file_summary['duplicates']} duplicate(s)")
+    if file_summary["pii"]:
+        print(f"   🔒 PII detected")
+    if file_summary["quality_issues"]:
+        print(f"   ⚠️ Quality issues found")
+    if not any([file_summary["duplicates"], file_summary["pii"], file_summary["quality_issues"]]):
+        print(f"   ✅ No issues")
     
-    files = files_result["files"]
+    return file_summary
+
+
+def _process_files_sequentially(files: List[Dict]) -> List[Dict]:
+    """Scan files one after another"""
     results = []
+    exact = _exact_duplicate_clusters(files)
     
-    print("\n🔍 Starting batch processing of files...\n")
-    
-  
     for idx, file_info in enumerate(files, 1):
         file_id = file_info["id"]
         filename = file_info["name"]
         
         print(f"📄 [{idx}/{len(files)}] Scanning: {filename}")
         
+        duplicate_result = _exact_duplicate_result(file_info, exact)
+        if duplicate_result:
+            results.append(_report_file_scan(filename, duplicate_result, {}, {}))
+            _record_fingerprints([file_info])
+            continue
+        
+        if int(file_info.get("size_bytes") or 0) > STREAM_THRESHOLD_BYTES:
+            try:
+                streamed = _process_file_streaming(file_info)
+            except Exception as e:
+                print(f"   ⚠️ Skipped (streaming failed: {e})")
+                continue
+            print(f"   📦 Streamed into {streamed['chunks_created']} pieces")
+            results.append(_report_file_scan(
+                filename, streamed["duplicate_result"], streamed["pii_result"], streamed["quality_result"]
+            ))
+            _record_if_processed(file_info, streamed["duplicate_result"], streamed["pii_result"],
+                                 streamed["quality_result"])
+            continue
+        
       
         download_result = download_file_content(file_id)
         if download_result["status"] != "success":
@@ -712,34 +3866,68 @@ def process_all_files() -> Dict:
         content = download_result["full_content"]
         size = int(file_info.get("size_bytes", 0))
         
+        duplicate_result = _exact_duplicate_result(file_info, exact, content)
+        if duplicate_result:
+            results.append(_report_file_scan(filename, duplicate_result, {}, {}))
+            _record_fingerprints([file_info])
+            continue
+        
        
+        chunk_result = None
         if len(content) > 5000:
             chunk_result = process_large_file(file_id, content, filename)
-            print(f"   📦 Chunked into {chunk_result.get('chunks_created', 0)} pieces")
+            print(f"   📦 Chunked into {chunk_result.get('chunks_created', 0)} pieces "
+                  f"({chunk_result.get('rows_per_sec') or 0} rows/s)")
+        else:
+            _drop_chunks(file_id)
         
        
-        duplicate_result = detect_duplicates(file_id, content, filename)
-        pii_result = detect_pii(content, file_id, filename)
-        quality_result = validate_quality(content, file_id, filename, size)
-        
-        file_summary = {
-            "file": filename,
-            "duplicates": duplicate_result.get("duplicates_found", 0),
-            "pii": pii_result.get("pii_found", False),
-            "quality_issues": quality_result.get("quality_issues_found", False)
-        }
+        duplicate_result = _detect_duplicates(file_id, content, filename,
+                                              content_hash=_content_hash(content),
+                                              file_info=file_info)
+        pii_result, quality_result = _scan_and_report(content, file_id, filename, size)
         
-        results.append(file_summary)
-        
-       
-        if file_summary["duplicates"] > 0:
-            print(f"   🔄 Found {file_summary['duplicates']} duplicate(s)")
-        if file_summary["pii"]:
-            print(f"   🔒 PII detected")
-        if file_summary["quality_issues"]:
-            print(f"   ⚠️ Quality issues found")
-        if not any([file_summary["duplicates"], file_summary["pii"], file_summary["quality_issues"]]):
-            print(f"   ✅ No issues")
+        results.append(_report_file_scan(filename, duplicate_result, pii_result, quality_result))
+        _record_if_processed(file_info, chunk_result, duplicate_result, pii_result, quality_result)
+    
+    return results
+
+
+def process_all_files(concurrent: bool = False, incremental: bool = False,
+                      resumable: bool = False, run_id: str = "") -> Dict:
+    """Process all Drive files in batch with HITL checkpoints
+    
+    Args:
+        concurrent: Run download, summarization, embedding and DB writes as
+            a pipeline of bounded worker pools instead of one file at a time
+        incremental: Scan the whole Drive but only process files that are new
+            or changed since the last incremental run
+        resumable: Queue the run in Postgres, checkpointing every file's
+            stages, so an interrupted run resumes where it stopped and
+            workers on other nodes (python agent.py --worker) can share it.
+            An unfinished queued run is resumed instead of starting a new one.
+        run_id: Resume this queued run
+    """
+    
+    if resumable or run_id:
+        return _process_files_queued(concurrent, incremental, run_id)
+  
+    if incremental:
+        files_result = _list_changed_files()
+    else:
+        files_result = list_drive_files(max_files=20)
+    if files_result["status"] != "success":
+        return files_result
+    
+    files = files_result["files"]
+    stage_stats = None
+    
+    print("\n🔍 Starting batch processing of files...\n")
+    
+    if concurrent:
+        results, stage_stats = _process_files_concurrently(files)
+    else:
+        results = _process_files_sequentially(files)
     
    
     approvals = get_pending_approvals()
@@ -748,33 +3936,729 @@ def process_all_files() -> Dict:
     print(f"📊 Files processed: {len(results)}")
     print(f"🚨 Issues awaiting approval: {approvals['pending_count']}\n")
     
-    return {
+    summary = {
         "status": "success",
         "files_processed": len(results),
         "total_issues": approvals["pending_count"],
         "details": results,
         "awaiting_approval": approvals["issues"]
     }
+    if stage_stats is not None:
+        summary["stage_stats"] = stage_stats
+    if incremental:
+        _save_sync_state(files_result["next_page_token"], files)
+        summary["sync_mode"] = files_result["mode"]
+        summary["skipped_unchanged"] = files_result["skipped_unchanged"]
+        summary["removed"] = files_result["removed"]
+    return summary
+
+
+# ============================================
+# CONCURRENT INGESTION PIPELINE
+# ============================================
+
+_STAGE_DONE = object()
+_STAGE_CONSUMED = object()
+
+
+class _StageStats:
+    """Thread-safe counters for one pipeline stage"""
+    
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self.busy_seconds += seconds
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+    
+    def as_dict(self, wall_seconds: float) -> Dict:
+        """Throughput figures used to size each stage's worker pool"""
+        handled = self.processed + self.failed
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "items_per_sec": round(self.processed / wall_seconds, 2) if wall_seconds else 0.0,
+            "avg_seconds_per_item": round(self.busy_seconds / handled, 3) if handled else 0.0,
+            "utilization": round(self.busy_seconds / (wall_seconds * self.workers), 2) if wall_seconds else 0.0
+        }
+
+
+def _start_stage(name: str, func, inbox: queue.Queue, outbox: queue.Queue, stats: _StageStats) -> List[threading.Thread]:
+    """Start a pool of workers moving items from inbox through func to outbox
+    
+    func returns the item to hand downstream, None to drop it as failed, or
+    _STAGE_CONSUMED when it finished the item itself. A full outbox blocks
+    the worker, which is what propagates backpressure upstream.
+    """
+    def worker():
+        while True:
+            item = inbox.get()
+            if item is _STAGE_DONE:
+                return
+            started = time.perf_counter()
+            try:
+                result = func(item)
+            except Exception as e:
+                print(f"   ⚠️ {name} failed for {item['file_info']['name']}: {e}")
+                result = None
+            stats.record(time.perf_counter() - started, result is not None)
+            if result is not None and result is not _STAGE_CONSUMED and outbox is not None:
+                outbox.put(result)
+    
+    threads = [
+        threading.Thread(target=worker, name=f"ingest-{name}-{i}", daemon=True)
+        for i in range(stats.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _download_stage(item: Dict, results: List[Dict], exact: Dict[str, Dict]) -> Dict:
+    file_info = item["file_info"]
+    if _consume_exact_duplicate(file_info, exact, results):
+        return _STAGE_CONSUMED
+    if int(file_info.get("size_bytes") or 0) > STREAM_THRESHOLD_BYTES:
+        # Too big to pass whole through the queues; handled end-to-end while streaming
+        streamed = _process_file_streaming(file_info)
+        print(f"📄 Streamed: {file_info['name']} ({streamed['chunks_created']} pieces)")
+        results.append(_report_file_scan(
+            file_info["name"], streamed["duplicate_result"], streamed["pii_result"], streamed["quality_result"]
+        ))
+        _record_if_processed(file_info, streamed["duplicate_result"], streamed["pii_result"],
+                             streamed["quality_result"])
+        return _STAGE_CONSUMED
+    
+    download_result = download_file_content(item["file_info"]["id"])
+    if download_result["status"] != "success":
+        print(f"   ⚠️ Skipped {item['file_info']['name']} (download failed)")
+        return None
+    item["content"] = download_result["full_content"]
+    if _consume_exact_duplicate(file_info, exact, results, item["content"]):
+        return _STAGE_CONSUMED
+    return item
+
+
+def _consume_exact_duplicate(file_info: Dict, exact: Dict[str, Dict], results: List[Dict], content: str = None) -> bool:
+    """Finish an identical copy in the download stage, before any embedding"""
+    duplicate_result = _exact_duplicate_result(file_info, exact, content)
+    if not duplicate_result:
+        return False
+    print(f"📄 Scanned: {file_info['name']}")
+    results.append(_report_file_scan(file_info["name"], duplicate_result, {}, {}))
+    _record_fingerprints([file_info])
+    return True
+
+
+def _summarize_stage(item: Dict) -> Dict:
+    file_id = item["file_info"]["id"]
+    if len(item["content"]) > 5000 and CHUNK_CACHE.get(file_id) is None:
+        item["chunks"] = _summarize_chunks(item["content"])
+    return item
+
+
+def _embed_stage(item: Dict) -> Dict:
+    # Chunk summaries, or an unchunked document's text, go in one batched embedding
+    # call; chunks reused from identical stored chunks already have theirs
+    chunks = item.get("chunks") or []
+    # A document skipped by the summarize stage may still have its chunks cached
+    pooled = chunks or (len(item["content"]) > 5000 and CHUNK_CACHE.get(item["file_info"]["id"])) or []
+    pending = [chunk for chunk in chunks if chunk.get("embedding") is None]
+    whole = [] if pooled else [item["content"]]
+    embeddings = generate_embeddings([_embedding_text(chunk) for chunk in pending] + whole)
+    for chunk, embedding in zip(pending, embeddings):
+        chunk["embedding"] = embedding
+    # A chunked document's embedding pools its chunks, covering the whole file
+    item["embedding"] = embeddings[-1] if whole else _EmbeddingPool().add_chunks(pooled).finish()
+    return item
+
+
+def _scan_stage(item: Dict) -> Dict:
+    item["scan"], item["non_blank"] = _scan_text(item["content"])
+    return item
+
+
+def _write_stage(item: Dict, results: List[Dict]) -> Dict:
+    file_id = item["file_info"]["id"]
+    filename = item["file_info"]["name"]
+    content = item["content"]
+    size = int(item["file_info"].get("size_bytes", 0))
+    
+    print(f"📄 Scanned: {filename}")
+    chunk_result = None
+    if item.get("chunks"):
+        chunk_result = _store_chunks(file_id, filename, item["chunks"], len(content))
+        print(f"   📦 Chunked into {chunk_result.get('chunks_created', 0)} pieces "
+              f"({chunk_result.get('rows_per_sec') or 0} rows/s)")
+    elif len(content) <= 5000:
+        _drop_chunks(file_id)
+    
+    duplicate_result = _detect_duplicates(file_id, content, filename, embedding=item["embedding"],
+                                          content_hash=_content_hash(content),
+                                          file_info=item["file_info"])
+    pii_result, quality_result = _report_scan(item["scan"], item["non_blank"], file_id, filename, size)
+    
+    results.append(_report_file_scan(filename, duplicate_result, pii_result, quality_result))
+    _record_if_processed(item["file_info"], chunk_result, duplicate_result, pii_result, quality_result)
+    return item
+
+
+def _process_files_concurrently(files: List[Dict]):
+    """Run files through download → summarize → embed → scan → write worker pools
+    
+    Stages are joined by bounded queues of INGEST_QUEUE_SIZE, so a slow
+    stage throttles the ones feeding it instead of buffering whole files.
+    Returns the per-file summaries and per-stage throughput stats.
+    """
+    results = []
+    exact = _exact_duplicate_clusters(files)
+    stages = [
+        ("download", lambda item: _download_stage(item, results, exact)),
+        ("summarize", _summarize_stage),
+        ("embed", _embed_stage),
+        ("scan", _scan_stage),
+        ("write", lambda item: _write_stage(item, results))
+    ]
+    queues = [queue.Queue(maxsize=INGEST_QUEUE_SIZE) for _ in stages]
+    stats = [_StageStats(name, max(1, INGEST_WORKERS[name])) for name, _ in stages]
+    
+    started = time.perf_counter()
+    pools = []
+    for idx, (name, func) in enumerate(stages):
+        outbox = queues[idx + 1] if idx + 1 < len(stages) else None
+        pools.append(_start_stage(name, func, queues[idx], outbox, stats[idx]))
+    
+    for file_info in files:
+        queues[0].put({"file_info": file_info})
+    
+    # Drain stage by stage: once a pool has exited, nothing more can reach the next one
+    for inbox, pool in zip(queues, pools):
+        for _ in pool:
+            inbox.put(_STAGE_DONE)
+        for thread in pool:
+            thread.join()
+    
+    wall_seconds = time.perf_counter() - started
+    stage_stats = {stat.name: stat.as_dict(wall_seconds) for stat in stats}
+    stage_stats["wall_seconds"] = round(wall_seconds, 2)
+    
+    for name, stat in stage_stats.items():
+        if name != "wall_seconds":
+            print(f"   ⏱️ {name}: {stat['items_per_sec']} files/s "
+                  f"({stat['workers']} workers, {int(stat['utilization'] * 100)}% busy)")
+    
+    return results, stage_stats
+
+
+# ============================================
+# RESUMABLE BATCH RUNS (POSTGRES JOB QUEUE)
+# ============================================
+
+# Each file gets one ingest_jobs row per stage; a stage's writes are its checkpoint
+JOB_STAGES = ("summarize", "embed", "scan")
+
+
+def _find_run(run_id: str = ""):
+    """The given queued run, else the latest unfinished one, as (run_id, finished)"""
+    with _db_cursor() as cursor:
+        if run_id:
+            cursor.execute("SELECT run_id, finished_at IS NOT NULL FROM ingest_runs WHERE run_id = %s;", (run_id,))
+        else:
+            cursor.execute("""
+                SELECT run_id, false FROM ingest_runs
+                WHERE finished_at IS NULL
+                ORDER BY created_at DESC
+                LIMIT 1;
+            """)
+        return cursor.fetchone()
+
+
+def _enqueue_run(files_result: Dict) -> str:
+    """Create a run with one pending job per listed file and stage, in listing order"""
+    files = files_result["files"]
+    exact = _exact_duplicate_clusters(files)
+    run_id = f"run-{datetime.now():%Y%m%d-%H%M%S}-{os.urandom(3).hex()}"
+    listing = {key: value for key, value in files_result.items() if key not in ("status", "files")}
+    
+    with _db_cursor() as cursor:
+        cursor.execute("INSERT INTO ingest_runs (run_id, listing) VALUES (%s, %s);", (run_id, Json(listing)))
+        execute_values(cursor, """
+            INSERT INTO ingest_jobs (run_id, file_id, step, stage, position, file_info, duplicate_of)
+            VALUES %s
+            ON CONFLICT DO NOTHING;
+        """, [
+            (run_id, file_info["id"], step, stage, position, Json(file_info), Json(exact.get(file_info["id"])))
+            for position, file_info in enumerate(files)
+            for step, stage in enumerate(JOB_STAGES)
+        ], page_size=DB_WRITE_PAGE_SIZE)
+    return run_id
+
+
+def _claim_job(run_id: str, worker: str, file_id: str = None, step: int = None):
+    """Lock and take the next runnable job of a run, or None
+    
+    A job is runnable once the file's previous stage is done, when it is
+    pending or its worker's lease has expired. SKIP LOCKED lets any number
+    of workers on any number of nodes claim concurrently without blocking
+    or double-claiming. Earlier files go first, so a run advances in
+    listing order. file_id and step ask for one job in particular.
+    """
+    only = "AND c.file_id = %(file_id)s AND c.step = %(step)s" if file_id is not None else ""
+    with _db_cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE ingest_jobs j
+            SET status = 'running', worker = %(worker)s, attempts = j.attempts + 1,
+                heartbeat = now(), updated_at = now()
+            FROM (
+                SELECT c.run_id, c.file_id, c.step
+                FROM ingest_jobs c
+                WHERE c.run_id = %(run_id)s {only}
+                  AND (c.status = 'pending'
+                       OR (c.status = 'running' AND c.heartbeat < now() - %(lease)s * interval '1 second'))
+                  AND c.attempts < %(max_attempts)s
+                  AND (c.step = 0 OR EXISTS (
+                      SELECT 1 FROM ingest_jobs p
+                      WHERE p.run_id = c.run_id AND p.file_id = c.file_id
+                        AND p.step = c.step - 1 AND p.status = 'done'
+                  ))
+                ORDER BY c.position, c.step
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            ) claimed
+            WHERE j.run_id = claimed.run_id AND j.file_id = claimed.file_id AND j.step = claimed.step
+            RETURNING j.file_id, j.step, j.stage, j.file_info, j.duplicate_of, j.attempts;
+        """, {"run_id": run_id, "worker": worker, "file_id": file_id, "step": step,
+              "lease": JOB_LEASE_SECONDS, "max_attempts": JOB_MAX_ATTEMPTS})
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(("file_id", "step", "stage", "file_info", "duplicate_of", "attempts"), row))
+
+
+def _block_later_steps(cursor, run_id: str):
+    """Fail the pending stages after every failed job of a run. The caller owns the transaction."""
+    cursor.execute("""
+        UPDATE ingest_jobs j
+        SET status = 'failed', error = 'blocked by an earlier failed stage', updated_at = now()
+        FROM ingest_jobs f
+        WHERE f.run_id = %s AND f.status = 'failed'
+          AND j.run_id = f.run_id AND j.file_id = f.file_id
+          AND j.step > f.step AND j.status = 'pending';
+    """, (run_id,))
+
+
+def _complete_job(run_id: str, job: Dict, worker: str, result: Dict, finished: bool) -> bool:
+    """Checkpoint a stage as done; finished skips the file's remaining stages
+    
+    Returns False if the lease was lost to another worker meanwhile, in
+    which case that worker's outcome stands.
+    """
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET status = 'done', result = %s, error = NULL, heartbeat = NULL, updated_at = now()
+            WHERE run_id = %s AND file_id = %s AND step = %s AND worker = %s AND status = 'running';
+        """, (Json(result, dumps=lambda obj: json.dumps(obj, default=str)), run_id, job["file_id"], job["step"], worker))
+        if not cursor.rowcount:
+            return False
+        if finished:
+            cursor.execute("""
+                UPDATE ingest_jobs SET status = 'skipped', updated_at = now()
+                WHERE run_id = %s AND file_id = %s AND step > %s AND status = 'pending';
+            """, (run_id, job["file_id"], job["step"]))
+    return True
+
+
+def _fail_job(run_id: str, job: Dict, worker: str, error: str):
+    """Put a failed stage back in the queue, or fail it for good after JOB_MAX_ATTEMPTS"""
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                error = %s, heartbeat = NULL, updated_at = now()
+            WHERE run_id = %s AND file_id = %s AND step = %s AND worker = %s AND status = 'running';
+        """, (JOB_MAX_ATTEMPTS, error, run_id, job["file_id"], job["step"], worker))
+        _block_later_steps(cursor, run_id)
+
+
+def _expire_jobs(run_id: str) -> int:
+    """Fail running jobs whose lease expired on their last attempt; returns jobs left to run"""
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET status = 'failed', error = 'lease expired after ' || attempts || ' attempts', updated_at = now()
+            WHERE run_id = %s AND status = 'running' AND attempts >= %s
+              AND heartbeat < now() - %s * interval '1 second';
+        """, (run_id, JOB_MAX_ATTEMPTS, JOB_LEASE_SECONDS))
+        _block_later_steps(cursor, run_id)
+        cursor.execute("""
+            SELECT count(*) FROM ingest_jobs
+            WHERE run_id = %s AND status IN ('pending', 'running');
+        """, (run_id,))
+        return cursor.fetchone()[0]
+
+
+def _finish_file(file_info: Dict, duplicate_result: Dict, pii_result: Dict, quality_result: Dict) -> Dict:
+    print(f"📄 Scanned: {file_info['name']}")
+    summary = _report_file_scan(file_info["name"], duplicate_result, pii_result, quality_result)
+    _record_if_processed(file_info, duplicate_result, pii_result, quality_result)
+    return {"summary": summary}
+
+
+def _job_summarize(state: Dict) -> Dict:
+    """Download, chunk and summarize; checkpoint: chunks stored, new ones without embeddings
+    
+    Exact duplicates and streamed files are finished here outright.
+    """
+    file_info = state["file_info"]
+    file_id, filename = file_info["id"], file_info["name"]
+    if state["duplicate_of"]:
+        return _finish_file(file_info, _report_exact_duplicate(file_id, filename, state["duplicate_of"]), {}, {})
+    if int(file_info.get("size_bytes") or 0) > STREAM_THRESHOLD_BYTES:
+        streamed = _process_file_streaming(file_info)
+        print(f"   📦 Streamed into {streamed['chunks_created']} pieces")
+        return _finish_file(file_info, streamed["duplicate_result"], streamed["pii_result"], streamed["quality_result"])
+    
+    download_result = download_file_content(file_id)
+    if download_result["status"] != "success":
+        raise RuntimeError(download_result["message"])
+    state["content"] = download_result["full_content"]
+    duplicate_result = _exact_duplicate_result(file_info, {}, state["content"])
+    if duplicate_result:
+        return _finish_file(file_info, duplicate_result, {}, {})
+    
+    state["chunks"] = []
+    if len(state["content"]) > 5000 and CHUNK_CACHE.get(file_id) is None:
+        state["chunks"] = _summarize_chunks(state["content"])
+        with _db_cursor() as cursor:
+            _bulk_upsert_chunks(cursor, file_id, filename, state["chunks"])
+    elif len(state["content"]) <= 5000:
+        _drop_chunks(file_id)
+    return {
+        "chunks_created": len(state["chunks"]),
+        "chunks_reused": sum(1 for chunk in state["chunks"] if chunk.get("reused"))
+    }
+
+
+def _load_unembedded_chunks(file_id: str) -> List[Dict]:
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            SELECT chunk_id, chunk_text, summary
+            FROM document_chunks
+            WHERE file_id = %s AND embedding IS NULL
+            ORDER BY chunk_id;
+        """, (file_id,))
+        return [{"chunk_id": row[0], "text": row[1], "summary": row[2]} for row in cursor.fetchall()]
+
+
+def _job_embed(state: Dict) -> Dict:
+    """Embed the file's chunks still lacking an embedding; checkpoint: embeddings stored
+    
+    A worker resuming another's file reads those chunks back from
+    document_chunks instead of summarizing again.
+    """
+    file_id = state["file_info"]["id"]
+    chunks = state.get("chunks")
+    pending = _load_unembedded_chunks(file_id) if chunks is None else [
+        chunk for chunk in chunks if chunk.get("embedding") is None
+    ]
+    if pending:
+        _embed_chunks(pending)
+        with _db_cursor() as cursor:
+            execute_values(cursor, """
+                UPDATE document_chunks AS c SET embedding = v.embedding
+                FROM (VALUES %s) AS v (file_id, chunk_id, embedding)
+                WHERE c.file_id = v.file_id AND c.chunk_id = v.chunk_id;
+            """, [(file_id, chunk["chunk_id"], chunk["embedding"]) for chunk in pending],
+                template="(%s, %s, %s::vector)", page_size=DB_WRITE_PAGE_SIZE)
+    if chunks:
+        # The whole file is in memory: pool its document embedding now
+        state["embedding"] = _EmbeddingPool().add_chunks(chunks).finish()
+        CHUNK_CACHE.put(file_id, chunks)
+    return {"chunks_embedded": len(pending)}
+
+
+def _job_scan(state: Dict) -> Dict:
+    """Duplicate, PII and quality checks and the documents row; finishes the file"""
+    file_info = state["file_info"]
+    file_id, filename = file_info["id"], file_info["name"]
+    content = state.get("content")
+    if content is None:
+        download_result = download_file_content(file_id)
+        if download_result["status"] != "success":
+            raise RuntimeError(download_result["message"])
+        content = download_result["full_content"]
+    
+    embedding = state.get("embedding")
+    if embedding is None and len(content) > 5000 and CHUNK_CACHE.get(file_id) is None:
+        # Resumed from the checkpoint: this run's summarize and embed jobs stored the chunks
+        embedding = _stored_chunk_pool(file_id).finish()
+    duplicate_result = _detect_duplicates(file_id, content, filename, embedding=embedding,
+                                          content_hash=_content_hash(content),
+                                          file_info=file_info)
+    pii_result, quality_result = _scan_and_report(content, file_id, filename, int(file_info.get("size_bytes", 0)))
+    return _finish_file(file_info, duplicate_result, pii_result, quality_result)
+
+
+JOB_STAGE_FUNCS = {
+    "summarize": _job_summarize,
+    "embed": _job_embed,
+    "scan": _job_scan
+}
+
+
+def _job_worker(run_id: str, worker: str, completed: List[int]):
+    """Claim and run jobs until the run has none left
+    
+    After a stage, the worker asks for the same file's next stage first,
+    so downloaded text and chunks pass along in memory; any other worker
+    that picks the file up instead resumes from the stored checkpoint.
+    Issues raised by a stage are stored with its result.
+    """
+    state = None
+    while True:
+        job = None
+        if state is not None:
+            job = _claim_job(run_id, worker, state["file_info"]["id"], state["step"] + 1)
+        if job is None:
+            state = None
+            job = _claim_job(run_id, worker)
+        if job is None:
+            if not _expire_jobs(run_id):
+                return
+            time.sleep(JOB_POLL_SECONDS)
+            continue
+        
+        if state is None:
+            state = {"file_info": job["file_info"], "duplicate_of": job["duplicate_of"]}
+        state["step"] = job["step"]
+        before = len(PENDING_APPROVALS)
+        try:
+            result = JOB_STAGE_FUNCS[job["stage"]](state)
+        except Exception as e:
+            print(f"   ⚠️ {job['stage']} failed for {job['file_info']['name']} "
+                  f"(attempt {job['attempts']} of {JOB_MAX_ATTEMPTS}): {e}")
+            _fail_job(run_id, job, worker, str(e))
+            state = None
+            continue
+        
+        result["issues"] = [issue for issue in PENDING_APPROVALS[before:] if issue.get("file_id") == job["file_id"]]
+        finished = "summary" in result or job["step"] + 1 == len(JOB_STAGES)
+        if _complete_job(run_id, job, worker, result, finished):
+            completed.append(job["stage"])
+        else:
+            finished = True
+        if finished:
+            state = None
+
+
+def _run_job_workers(run_id: str, workers: int) -> List[str]:
+    """Run a pool of queue workers in this process until the run is drained
+    
+    A heartbeat thread renews the leases of this pool's running jobs every
+    JOB_LEASE_SECONDS / 3, so only a process that died loses its jobs.
+    Returns the worker ids.
+    """
+    prefix = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    names = [f"{prefix}:{i}" for i in range(max(1, workers))]
+    completed = []
+    stop = threading.Event()
+    
+    def heartbeat():
+        while not stop.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                with _db_cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE ingest_jobs SET heartbeat = now()
+                        WHERE run_id = %s AND status = 'running' AND worker = ANY(%s);
+                    """, (run_id, names))
+            except Exception as e:
+                print(f"   ⚠️ Job heartbeat failed: {e}")
+    
+    threads = [threading.Thread(target=heartbeat, name="ingest-heartbeat", daemon=True)] + [
+        threading.Thread(target=_job_worker, args=(run_id, name, completed), name=f"ingest-job-{i}", daemon=True)
+        for i, name in enumerate(names)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads[1:]:
+        thread.join()
+    stop.set()
+    print(f"   ⏱️ {len(completed)} stage jobs completed by {len(names)} workers on this node")
+    return names
+
+
+def _run_job_stats(cursor, run_id: str) -> Dict:
+    cursor.execute("""
+        SELECT stage, status, count(*) FROM ingest_jobs
+        WHERE run_id = %s
+        GROUP BY stage, status;
+    """, (run_id,))
+    stats = {stage: {} for stage in JOB_STAGES}
+    for stage, status, count in cursor.fetchall():
+        stats[stage][status] = count
+    return stats
+
+
+def _process_files_queued(concurrent: bool, incremental: bool, run_id: str = "") -> Dict:
+    """process_all_files through the ingest_jobs queue
+    
+    Resumes the given or latest unfinished run, or lists files and queues
+    a new one, then works it with JOB_WORKERS threads (one unless
+    concurrent) alongside any other nodes' workers. Issues found by other
+    workers or by an earlier, interrupted process are added to the
+    pending approvals when the run finishes.
+    """
+    if not DB_POOL:
+        return {"status": "error", "message": "Database not initialized"}
+    
+    run = _find_run(run_id)
+    if run_id and run is None:
+        return {"status": "error", "message": f"No queued run {run_id}"}
+    if run and run[1]:
+        return {"status": "error", "message": f"Run {run_id} already finished"}
+    
+    resumed = run is not None
+    if resumed:
+        run_id = run[0]
+    else:
+        files_result = _list_changed_files() if incremental else list_drive_files(max_files=20)
+        if files_result["status"] != "success":
+            return files_result
+        if incremental:
+            files_result["incremental"] = True
+        run_id = _enqueue_run(files_result)
+    
+    print(f"\n🔍 {'Resuming' if resumed else 'Starting'} queued batch run {run_id}...\n")
+    local_workers = _run_job_workers(run_id, JOB_WORKERS if concurrent else 1)
+    
+    with _db_cursor() as cursor:
+        cursor.execute("""
+            SELECT result, worker = ANY(%s), status, error, file_info->>'name'
+            FROM ingest_jobs
+            WHERE run_id = %s AND (result ? 'summary' OR jsonb_array_length(result->'issues') > 0
+                                   OR status = 'failed')
+            ORDER BY position, step;
+        """, (local_workers, run_id))
+        rows = cursor.fetchall()
+        job_stats = _run_job_stats(cursor, run_id)
+        cursor.execute("""
+            UPDATE ingest_runs SET finished_at = now()
+            WHERE run_id = %s AND finished_at IS NULL
+            RETURNING listing;
+        """, (run_id,))
+        finished = cursor.fetchone()
+    
+    results, failed = [], []
+    for result, local, status, error, filename in rows:
+        if status == "failed":
+            if not error.startswith("blocked by an earlier"):
+                failed.append({"file": filename, "error": error})
+            continue
+        if "summary" in result:
+            results.append(result["summary"])
+        if not local:
+            PENDING_APPROVALS.extend(result["issues"])
+            DETECTED_ISSUES.extend(result["issues"])
+    
+    listing = finished[0] if finished else {}
+    if listing.get("incremental"):
+        with _db_cursor() as cursor:
+            cursor.execute("SELECT file_info FROM ingest_jobs WHERE run_id = %s AND step = 0;", (run_id,))
+            listed = [row[0] for row in cursor.fetchall()]
+        _save_sync_state(listing["next_page_token"], listed)
+    
+    approvals = get_pending_approvals()
+    print(f"\n✅ Batch run {run_id} complete!")
+    print(f"📊 Files processed: {len(results)} ({len(failed)} failed)")
+    print(f"🚨 Issues awaiting approval: {approvals['pending_count']}\n")
+    
+    summary = {
+        "status": "success",
+        "run_id": run_id,
+        "resumed": resumed,
+        "files_processed": len(results),
+        "files_failed": failed,
+        "total_issues": approvals["pending_count"],
+        "details": results,
+        "awaiting_approval": approvals["issues"],
+        "job_stats": job_stats
+    }
+    if listing.get("incremental"):
+        summary["sync_mode"] = listing["mode"]
+        summary["skipped_unchanged"] = listing["skipped_unchanged"]
+        summary["removed"] = listing["removed"]
+    return summary
+
+
+def run_ingest_worker(run_id: str = "") -> Dict:
+    """Work a queued batch run from another node until it is drained
+    
+    Args:
+        run_id: Queued run to join (default: the latest unfinished one)
+    """
+    if not DB_POOL:
+        return {"status": "error", "message": "Database not initialized"}
+    run = _find_run(run_id)
+    if run is None or run[1]:
+        return {"status": "error", "message": "No unfinished queued run to join"}
+    
+    _run_job_workers(run[0], JOB_WORKERS)
+    with _db_cursor() as cursor:
+        job_stats = _run_job_stats(cursor, run[0])
+    return {"status": "success", "run_id": run[0], "job_stats": job_stats}
+
+
+def get_run_progress(run_id: str = "") -> Dict:
+    """Report per-stage job counts of a queued batch run
+    
+    Args:
+        run_id: Queued run (default: the latest unfinished one)
+    """
+    if not DB_POOL:
+        return {"status": "error", "message": "Database not initialized"}
+    run = _find_run(run_id)
+    if run is None:
+        return {"status": "error", "message": "No such queued run"}
+    with _db_cursor() as cursor:
+        job_stats = _run_job_stats(cursor, run[0])
+    return {"status": "success", "run_id": run[0], "finished": run[1], "job_stats": job_stats}
 
 
 # ============================================
 # WRAP FUNCTIONS AS TOOLS
 # ============================================
 
-db_init_tool = FunctionTool(func=initialize_database)
+db_init_tool = FunctionTool(func=_offload(initialize_database))
 drive_auth_tool = FunctionTool(func=authenticate_google_drive)
 list_files_tool = FunctionTool(func=list_drive_files)
 download_tool = FunctionTool(func=download_file_content)
-chunk_tool = FunctionTool(func=process_large_file)
-chunk_search_tool = FunctionTool(func=search_chunks)
-duplicate_tool = FunctionTool(func=detect_duplicates)
+chunk_tool = FunctionTool(func=_offload(process_large_file))
+chunk_search_tool = FunctionTool(func=_offload(search_chunks))
+duplicate_tool = FunctionTool(func=_offload(detect_duplicates))
 pii_tool = FunctionTool(func=detect_pii)
 quality_tool = FunctionTool(func=validate_quality)
 approvals_tool = FunctionTool(func=get_pending_approvals)
 approve_tool = FunctionTool(func=approve_action)
 reject_tool = FunctionTool(func=reject_action)
-search_tool = FunctionTool(func=semantic_search)
-batch_tool = FunctionTool(func=process_all_files)
+search_tool = FunctionTool(func=_offload(semantic_search))
+batch_tool = FunctionTool(func=_offload(process_all_files))
+run_progress_tool = FunctionTool(func=_offload(get_run_progress))
+cache_stats_tool = FunctionTool(func=get_cache_stats)
+dedupe_tool = FunctionTool(func=_offload(dedupe_corpus))
+index_tool = FunctionTool(func=_offload(build_vector_indexes))
+full_text_tool = FunctionTool(func=_offload(get_full_text))
 
 
 # ============================================
@@ -820,16 +4704,34 @@ A. Single File Processing:
 
 B. Batch Processing:
    - Use process_all_files to scan all 20 files automatically
+   - For large Drives use process_all_files(concurrent=True) to run a pipelined scan
+   - Use process_all_files(incremental=True) to scan the whole Drive but only
+     re-process files that are new or changed since the last incremental run
+   - Use process_all_files(resumable=True) for long runs: progress is checkpointed
+     in Postgres, so calling it again after an interruption resumes the unfinished
+     run, and get_run_progress reports how far it has got
+   - Use dedupe_corpus to cluster duplicates across every indexed document;
+     it raises one approval issue per cluster instead of one per file
    - All issues require human approval
 
 SEARCH CAPABILITIES:
 - Document-level search: semantic_search (full documents)
 - Chunk-level search: search_chunks (precise, for large docs)
+- Both take recall="fast" | "balanced" | "high" | "exact" to trade latency for recall
+- Use mode="hybrid" when the query contains exact identifiers (invoice numbers,
+  SKUs, names); lexical_weight (0-1) sets how much full-text matches count
+- Results carry short previews; call get_full_text(file_id, chunk_id) only for
+  the results you need to read in full
+- Narrow either search with filename, mime_type, owner, modified_after and
+  modified_before (ISO dates) instead of filtering results yourself
+- After a bulk load, run build_vector_indexes to (re)build and size the vector indexes;
+  storage="halfvec" or "binary" shrinks them 2x / 32x at some recall cost
 
 CHUNKING STRATEGY:
 - Files >5KB: Automatically chunk with process_large_file
 - Creates overlapping segments with Gemini summaries
-- Stores in ROM cache for instant retrieval
+- Stores in ROM cache for instant retrieval (bounded; edited files are re-processed)
+- Report cache usage and hit rates (chunk, embedding and search caches) with get_cache_stats
 - Enables precise chunk-level search
 
 HITL PRINCIPLES:
@@ -845,7 +4747,7 @@ Communication Style:
 - Always confirm next steps
 
 Be helpful and ensure users understand the workflow!""",
-    tools=[db_init_tool, drive_auth_tool, list_files_tool, batch_tool, chunk_search_tool, search_tool],
+    tools=[db_init_tool, drive_auth_tool, list_files_tool, batch_tool, run_progress_tool, dedupe_tool, index_tool, chunk_search_tool, search_tool, full_text_tool, cache_stats_tool],
     sub_agents=[data_quality_agent]
 )
 
@@ -931,4 +4833,10 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.argv[1:2] == ["--worker"]:
+        # Extra ingest node for a queued run: python agent.py --worker [run_id]
+        print(initialize_database()["message"])
+        print(authenticate_google_drive()["message"])
+        print(run_ingest_worker(sys.argv[2] if len(sys.argv) > 2 else ""))
+    else:
+        asyncio.run(main())
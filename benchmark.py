@@ -0,0 +1,639 @@
+"""Throughput benchmarks for the DAM agent's hot paths
+
+Usage:
+    python benchmark.py pii [--size-mb 20] [--seed 7]
+    python benchmark.py vectors [--documents 20000] [--queries 200] [--k 10]
+                                [--index hnsw --index hnsw:storage=binary --index none]
+    python benchmark.py summaries [--chunks 200] [--latency 0.2] [--rate-limited 0.05]
+    python benchmark.py chunking [--documents 50] [--size-kb 40] [--k 1 --k 5]
+
+The vectors benchmark loads a synthetic corpus into its own database
+(--database, created if missing) through a deterministic embedding stub,
+so it runs offline and never touches the agent's real tables. The
+summaries benchmark points Gemini at a local stub server with simulated
+latency and 429 responses, so it needs no API key either.
+"""
+
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import psycopg2
+
+import agent
+
+
+# ============================================
+# SYNTHETIC CORPUS
+# ============================================
+
+WORDS = (
+    "invoice payment customer account report quarterly revenue meeting memo "
+    "shipment order contract renewal policy budget forecast project review "
+    "the of and to in for with on by from at as is was be this that"
+).split()
+
+
+def _card_number(rng: random.Random, valid: bool) -> str:
+    digits = [rng.randint(0, 9) for _ in range(15)]
+    checksum = sum(sum(divmod(2 * d, 10)) for d in digits[-1::-2]) + sum(digits[-2::-2])
+    check = (10 - checksum % 10) % 10
+    digits.append(check if valid else (check + 1) % 10)
+    number = "".join(map(str, digits))
+    return " ".join(number[i:i + 4] for i in range(0, 16, 4))
+
+
+def synthetic_corpus(size_mb: float, seed: int = 7) -> str:
+    """Office-document-like text with PII and corruption sprinkled in"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    parts = []
+    length = 0
+
+    while length < target:
+        roll = rng.random()
+        if roll < 0.004:
+            token = f"{rng.choice(WORDS)}.{rng.choice(WORDS)}@example.com"
+        elif roll < 0.007:
+            token = f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}"
+        elif roll < 0.008:
+            token = f"{rng.randint(100, 899)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}"
+        elif roll < 0.009:
+            token = _card_number(rng, valid=rng.random() < 0.5)
+        elif roll < 0.0092:
+            token = "\x07"
+        else:
+            token = rng.choice(WORDS)
+        parts.append(token)
+        length += len(token) + 1
+        if rng.random() < 0.08:
+            parts.append("\n")
+
+    return " ".join(parts)[:target]
+
+
+# ============================================
+# PII / QUALITY SCAN
+# ============================================
+
+def _per_pattern_scan(content: str) -> int:
+    """Baseline: one findall per PII pattern plus one search per corruption pattern"""
+    found = 0
+    for pattern in agent.PII_PATTERNS.values():
+        found += len(re.findall(pattern, content))
+    for pattern, _ in agent.CORRUPTION_PATTERNS:
+        if re.search(pattern, content):
+            break
+    return found
+
+
+def _streamed_scan(content: str) -> dict:
+    """Single-pass engine fed chunk by chunk, as the streaming ingest path does"""
+    scan = agent._scan_content("")
+    before = previous = None
+    for chunk in agent.iter_chunks([content]):
+        if previous is not None:
+            agent._scan_chunk(scan, previous, before, chunk)
+        before, previous = previous, chunk
+    if previous is not None:
+        agent._scan_chunk(scan, previous, before)
+    return scan
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def bench_pii(args):
+    corpus = synthetic_corpus(args.size_mb, args.seed)
+    megabytes = len(corpus.encode("utf-8")) / (1024 * 1024)
+    print(f"Corpus: {megabytes:.1f} MB (seed {args.seed})\n")
+
+    baseline, baseline_seconds = _timed(_per_pattern_scan, corpus)
+    single, single_seconds = _timed(agent._scan_content, corpus)
+    streamed, streamed_seconds = _timed(_streamed_scan, corpus)
+
+    def flagged(scan):
+        return sum(found["count"] for found in scan["pii"].values())
+
+    print(f"{'mode':<22}{'MB/s':>10}{'matches':>10}{'luhn rejected':>16}")
+    print(f"{'per-pattern baseline':<22}{megabytes / baseline_seconds:>10.1f}{baseline:>10}{'-':>16}")
+    print(f"{'single pass':<22}{megabytes / single_seconds:>10.1f}{flagged(single):>10}{single['luhn_rejected']:>16}")
+    print(f"{'single pass, streamed':<22}{megabytes / streamed_seconds:>10.1f}{flagged(streamed):>10}{streamed['luhn_rejected']:>16}")
+
+
+# ============================================
+# VECTOR SEARCH
+# ============================================
+
+class StubEmbedder:
+    """Deterministic offline stand-in for agent.generate_embeddings
+    
+    Texts registered up front map to their planted vectors; any other text
+    gets a unit vector seeded from its SHA-256, so runs are reproducible.
+    """
+    
+    def __init__(self):
+        self.vectors = {}
+    
+    def __call__(self, texts, batch_size=None, concurrency=None):
+        out = np.empty((len(texts), agent.EMBEDDING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vector = self.vectors.get(text)
+            if vector is None:
+                seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+                vector = _unit(np.random.default_rng(seed).standard_normal(agent.EMBEDDING_DIM))
+            out[row] = vector
+        return out
+
+
+def _unit(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+def synthetic_vectors(documents: int, chunks_per_doc: int, queries: int, seed: int):
+    """Topic-clustered document, chunk and query embeddings
+    
+    Documents scatter around one of documents/100 topic centres, chunks
+    around their document, and queries around a random topic, which gives
+    ANN indexes the kind of structure real embeddings have.
+    """
+    rng = np.random.default_rng(seed)
+    dim = agent.EMBEDDING_DIM
+    centres = rng.standard_normal((max(1, documents // 100), dim)).astype(np.float32)
+    topics = rng.integers(0, len(centres), documents)
+    docs = _unit(centres[topics] + 0.8 * rng.standard_normal((documents, dim)).astype(np.float32))
+    chunks = _unit(np.repeat(docs, chunks_per_doc, axis=0)
+                   + 0.5 / np.sqrt(dim) * rng.standard_normal((documents * chunks_per_doc, dim)).astype(np.float32))
+    probes = _unit(centres[rng.integers(0, len(centres), queries)]
+                   + 0.8 * rng.standard_normal((queries, dim)).astype(np.float32))
+    return docs, chunks, probes
+
+
+def _document_text(rng: random.Random, words: int = 200) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + f" ref-{rng.getrandbits(48):x}"
+
+
+def _near_copy(rng: random.Random, text: str) -> str:
+    """Same text with one word in 25 replaced"""
+    return " ".join("edited" if rng.random() < 0.04 else word for word in text.split())
+
+
+def _ensure_database(name: str):
+    admin = psycopg2.connect(**{**agent.DB_CONFIG, "dbname": "postgres"})
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (name,))
+            if not cursor.fetchone():
+                cursor.execute(f'CREATE DATABASE "{name}";')
+    finally:
+        admin.close()
+
+
+def load_corpus(docs, chunks, chunks_per_doc: int, seed: int) -> dict:
+    """Replace the benchmark database's contents with the synthetic corpus"""
+    rng = random.Random(seed)
+    texts = [_document_text(rng) for _ in range(len(docs))]
+    started = time.perf_counter()
+    
+    with agent._db_cursor() as cursor:
+        cursor.execute("TRUNCATE documents, document_chunks, document_minhash, document_lsh_bands;")
+        for table in agent.VECTOR_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {agent.VECTOR_INDEXES[table]};")
+    
+    for start in range(0, len(docs), 1000):
+        with agent._db_cursor() as cursor:
+            rows = range(start, min(start + 1000, len(docs)))
+            agent._bulk_upsert_documents(cursor, [
+                {"file_id": f"doc-{i}", "filename": f"doc-{i}.txt", "content": texts[i],
+                 "embedding": docs[i], "metadata": {"source": "benchmark"}}
+                for i in rows
+            ])
+            for i in rows:
+                agent._bulk_upsert_chunks(cursor, f"doc-{i}", f"doc-{i}.txt", [
+                    {"chunk_id": c, "text": f"chunk {c} of doc-{i}", "summary": f"summary {c} of doc-{i}",
+                     "embedding": chunks[i * chunks_per_doc + c], "start_pos": c * 1000, "end_pos": (c + 1) * 1000}
+                    for c in range(chunks_per_doc)
+                ], prune=False)
+                agent._store_minhash(cursor, f"doc-{i}", agent._minhash_signature(texts[i]))
+    
+    seconds = time.perf_counter() - started
+    return {"texts": texts, "seconds": seconds, "rows": len(docs) * (1 + chunks_per_doc)}
+
+
+def _parse_index(spec: str):
+    """'hnsw', 'hnsw:m=32,ef_construction=128', 'ivfflat:lists=50,storage=halfvec' or 'none'"""
+    index_type, _, options = spec.partition(":")
+    params, storage = {}, "full"
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key.strip() == "storage":
+            storage = value.strip()
+        else:
+            params[key.strip()] = int(value)
+    return index_type, params, storage
+
+
+def build_index(spec: str) -> dict:
+    """Build the spec's indexes; returns build seconds and their total on-disk size"""
+    index_type, params, storage = _parse_index(spec)
+    started = time.perf_counter()
+    size = 0
+    for table, index_name in agent.VECTOR_INDEXES.items():
+        with agent._db_cursor() as cursor:
+            if index_type == "none":
+                cursor.execute(f"DROP INDEX IF EXISTS {index_name};")
+                agent._read_vector_index(cursor, table)
+            else:
+                agent._build_vector_index(cursor, table, index_type, rebuild=True, params=params, storage=storage)
+                cursor.execute("SELECT pg_relation_size(%s::regclass);", (index_name,))
+                size += cursor.fetchone()[0]
+    return {"seconds": time.perf_counter() - started, "megabytes": size / 2**20}
+
+
+def _ground_truth(corpus, probes, k: int):
+    """Exact top-k by cosine similarity, by brute force in NumPy"""
+    scores = probes @ corpus.T
+    top = np.argpartition(-scores, min(k, corpus.shape[0] - 1), axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def _percentile(latencies, q: float) -> float:
+    return float(np.percentile(latencies, q) * 1000)
+
+
+def run_searches(search, key, stub, probes, truth, k: int, recall: str) -> dict:
+    latencies, hits, index_used = [], 0, None
+    started = time.perf_counter()
+    for qid, vector in enumerate(probes):
+        text = f"benchmark query {qid}"
+        stub.vectors[text] = vector
+        began = time.perf_counter()
+        result = search(text, limit=k, recall=recall)
+        latencies.append(time.perf_counter() - began)
+        if result["status"] != "success":
+            raise RuntimeError(result["message"])
+        index_used = result["index"]
+        hits += len({key(row) for row in result["results"]} & truth[qid])
+    wall = time.perf_counter() - started
+    return {
+        "index": index_used,
+        "p50": _percentile(latencies, 50),
+        "p99": _percentile(latencies, 99),
+        "qps": len(probes) / wall,
+        "recall": hits / (k * len(probes))
+    }
+
+
+def run_duplicate_probes(texts, docs, probes: int, seed: int) -> dict:
+    """detect_duplicates latency and how often a near copy finds its source"""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    latencies, found = [], 0
+    for probe in range(probes):
+        source = rng.randrange(len(texts))
+        file_id = f"probe-{probe}"
+        noise = 0.2 / np.sqrt(agent.EMBEDDING_DIM) * np_rng.standard_normal(agent.EMBEDDING_DIM)
+        embedding = _unit(docs[source] + noise.astype(np.float32))
+        began = time.perf_counter()
+        result = agent._detect_duplicates(file_id, _near_copy(rng, texts[source]), f"{file_id}.txt", embedding=embedding)
+        latencies.append(time.perf_counter() - began)
+        if result["status"] != "success":
+            raise RuntimeError(result["message"])
+        found += any(d["duplicate_file_id"] == f"doc-{source}" for d in result["details"])
+        with agent._db_cursor() as cursor:
+            agent._drop_index_rows(cursor, [file_id])
+    agent.PENDING_APPROVALS.clear()
+    agent.DETECTED_ISSUES.clear()
+    return {"p50": _percentile(latencies, 50), "p99": _percentile(latencies, 99),
+            "found": found / probes if probes else 0.0}
+
+
+def bench_vectors(args):
+    _ensure_database(args.database)
+    agent.DB_CONFIG["dbname"] = args.database
+    init = agent.initialize_database()
+    if init["status"] != "success":
+        raise SystemExit(init["message"])
+    stub = StubEmbedder()
+    agent.generate_embeddings = stub
+    # Every query must reach Postgres, or repeats across index specs would time the cache
+    agent.SEARCH_CACHE.max_entries = 0
+    
+    docs, chunks, probes = synthetic_vectors(args.documents, args.chunks_per_doc, args.queries, args.seed)
+    loaded = load_corpus(docs, chunks, args.chunks_per_doc, args.seed)
+    print(f"Corpus: {args.documents} documents, {len(chunks)} chunks in '{args.database}' "
+          f"({loaded['rows'] / loaded['seconds']:.0f} rows/s load)")
+    
+    doc_truth = [{f"doc-{i}" for i in row} for row in _ground_truth(docs, probes, args.k)]
+    chunk_truth = [{(f"doc-{i // args.chunks_per_doc}", i % args.chunks_per_doc) for i in row}
+                   for row in _ground_truth(chunks, probes, args.k)]
+    searches = [
+        ("semantic_search", agent.semantic_search, lambda row: row["file_id"], doc_truth),
+        ("search_chunks", agent.search_chunks, lambda row: (row["file_id"], row["chunk_id"]), chunk_truth)
+    ]
+    
+    header = f"{'recall level':<14}{'search':<19}{'p50 ms':>8}{'p99 ms':>8}{'QPS':>8}{f'recall@{args.k}':>11}  setting"
+    for spec in args.index or ["hnsw", "ivfflat"]:
+        built = build_index(spec)
+        print(f"\n{spec}: built in {built['seconds']:.1f}s, {built['megabytes']:.1f} MB on disk\n{header}")
+        for recall in agent.SEARCH_RECALL_LEVELS:
+            for name, search, key, truth in searches:
+                stats = run_searches(search, key, stub, probes, truth, args.k, recall)
+                print(f"{recall:<14}{name:<19}{stats['p50']:>8.2f}{stats['p99']:>8.2f}"
+                      f"{stats['qps']:>8.0f}{stats['recall']:>11.3f}  {stats['index']}")
+        
+        if args.duplicate_probes:
+            dup = run_duplicate_probes(loaded["texts"], docs, args.duplicate_probes, args.seed)
+            print(f"{'-':<14}{'detect_duplicates':<19}{dup['p50']:>8.2f}{dup['p99']:>8.2f}"
+                  f"{'-':>8}{dup['found']:>11.3f}  near copies matched to their source")
+
+
+# ============================================
+# CHUNK SUMMARIZATION
+# ============================================
+
+def _stub_summary(text: str) -> str:
+    return "Summary of: " + " ".join(text.split()[:6])
+
+
+class StubGemini(ThreadingHTTPServer):
+    """Local stand-in for the Gemini REST generateContent endpoint
+    
+    Each request takes latency seconds plus per_chunk seconds for every
+    chunk in its prompt, and a rate_limited share of requests is answered
+    with 429. Packed prompts get the JSON array the summarizer asks for.
+    """
+    daemon_threads = True
+    
+    def __init__(self, latency: float, per_chunk: float, rate_limited: float, seed: int):
+        super().__init__(("127.0.0.1", 0), _StubGeminiHandler)
+        self.latency, self.per_chunk, self.rate_limited = latency, per_chunk, rate_limited
+        self.rng = random.Random(seed)
+        self.requests = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class _StubGeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        stub = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["contents"][0]["parts"][0]["text"]
+        chunks = re.findall(r'<chunk id="(\d+)">\n(.*?)\n</chunk>', prompt, re.S)
+        stub.requests += 1
+        time.sleep(stub.latency + stub.per_chunk * max(1, len(chunks)))
+        
+        if stub.rng.random() < stub.rate_limited:
+            status, payload = 429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                                              "status": "RESOURCE_EXHAUSTED"}}
+        else:
+            if chunks:
+                text = json.dumps([{"id": int(chunk_id), "summary": _stub_summary(chunk)} for chunk_id, chunk in chunks])
+            else:
+                text = _stub_summary(prompt.split("important information:", 1)[-1])
+            status, payload = 200, {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]},
+                                                    "finishReason": "STOP"}]}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, *args):
+        pass
+
+
+def _per_chunk_summaries(texts):
+    """Baseline: a new model and one blocking request per chunk, as summarize_chunk used to do"""
+    summaries = []
+    for text in texts:
+        prompt = f"""Summarize this document chunk in 2-3 sentences. 
+        Focus on key entities, dates, numbers, and important information:
+        
+        {text[:2000]}"""
+        try:
+            summaries.append(agent.genai.GenerativeModel(agent.SUMMARY_MODEL).generate_content(prompt).text.strip())
+        except Exception:
+            summaries.append(text[:200])
+    return summaries
+
+
+def bench_summaries(args):
+    stub = StubGemini(args.latency, args.per_chunk, args.rate_limited, args.seed)
+    agent.genai.configure(api_key="stub", transport="rest", client_options={"api_endpoint": stub.url})
+    # Every chunk must reach the stub, or the second run would time the summary cache
+    agent.EMBEDDING_CACHE_DIR = ""
+    
+    rng = random.Random(args.seed)
+    content = " ".join(_document_text(rng) for _ in range(args.chunks))
+    texts = [chunk["text"] for chunk in agent.chunk_document(content)][:args.chunks]
+    expected = [_stub_summary(text[:2000]) for text in texts]
+    print(f"{len(texts)} chunks, stub latency {args.latency * 1000:.0f} ms + {args.per_chunk * 1000:.0f} ms/chunk, "
+          f"{args.rate_limited:.0%} of requests rate limited")
+    print(f"{'summarizer':<34}{'seconds':>9}{'chunks/s':>10}{'requests':>10}{'correct':>9}  notes")
+    
+    if args.baseline:
+        before = stub.requests
+        summaries, seconds = _timed(_per_chunk_summaries, texts)
+        correct = sum(got == want for got, want in zip(summaries, expected))
+        print(f"{'per-chunk (sequential)':<34}{seconds:>9.2f}{len(texts) / seconds:>10.1f}"
+              f"{stub.requests - before:>10}{correct:>9}  rate-limited chunks fall back to raw text")
+    
+    engine = agent._SummaryEngine(batch_size=args.batch_size, concurrency=args.concurrency,
+                                  rpm=args.rpm, backoff=args.backoff)
+    before = stub.requests
+    summaries, seconds = _timed(engine.summarize, texts)
+    correct = sum(got == want for got, want in zip(summaries, expected))
+    name = f"engine (batch {engine.batch_size}, {engine.concurrency} in flight)"
+    print(f"{name:<34}{seconds:>9.2f}{len(texts) / seconds:>10.1f}{stub.requests - before:>10}{correct:>9}  "
+          f"{engine.stats['retries']} retries, {engine.stats['rate_limited']} rate limited, "
+          f"{engine.stats['fallbacks']} fallbacks")
+
+
+# ============================================
+# CHUNKING
+# ============================================
+
+BOILERPLATE = (
+    "CONFIDENTIALITY NOTICE\n\nThis document is intended only for the named recipient. "
+    "If you received it in error, notify the sender and delete every copy.\n\n"
+)
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 24))]
+    return " ".join(words).capitalize() + "."
+
+
+def structured_corpus(documents: int, size_kb: float, seed: int = 7):
+    """Documents of headings, paragraphs and table rows, each planting facts
+    
+    Every fact is one sentence naming a unique vendor, placed mid-paragraph,
+    and every document opens with the same boilerplate notice section.
+    
+    Returns:
+        (texts, facts) where facts are (vendor, fact sentence) pairs
+    """
+    rng = random.Random(seed)
+    texts, facts = [], []
+    for doc in range(documents):
+        parts, length, section = [BOILERPLATE], 0, 0
+        while length < size_kb * 1024:
+            section += 1
+            block = [f"## {section}. {rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}"]
+            for _ in range(rng.randint(1, 4)):
+                sentences = [_sentence(rng) for _ in range(rng.randint(2, 8))]
+                if rng.random() < 0.5:
+                    vendor = f"vendor{len(facts):05d}"
+                    fact = (f"The {vendor} contract number is C-{rng.randint(10000, 99999)}, "
+                            f"renewed for {rng.randint(2, 9)} years at {rng.randint(10, 990)}k.")
+                    sentences.insert(rng.randint(1, len(sentences)), fact)
+                    facts.append((vendor, fact))
+                block.append(" ".join(sentences))
+            if rng.random() < 0.3:
+                block.append("\n".join(
+                    f"| {rng.choice(WORDS)} | {rng.randint(1, 9999)} | {rng.choice(WORDS)} {rng.choice(WORDS)} |"
+                    for _ in range(rng.randint(3, 12))
+                ))
+            text = "\n\n".join(block) + "\n\n"
+            parts.append(text)
+            length += len(text)
+        texts.append("".join(parts))
+    return texts, facts
+
+
+def _terms(text: str):
+    return re.findall(r"\w+", text.lower())
+
+
+def _tfidf_recall(chunks, facts, ks) -> dict:
+    """Share of fact queries whose top-k TF-IDF chunks include one holding the whole fact"""
+    postings, norms = {}, []
+    for idx, text in enumerate(chunks):
+        counts = {}
+        for term in _terms(text):
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((idx, count))
+        norms.append(counts)
+    idf = {term: np.log(len(chunks) / len(hits)) for term, hits in postings.items()}
+    norms = [np.sqrt(sum((count * idf[term]) ** 2 for term, count in counts.items())) or 1.0 for counts in norms]
+    
+    found = dict.fromkeys(ks, 0)
+    for vendor, fact in facts:
+        scores = {}
+        for term in set(_terms(f"{vendor} contract number renewed")):
+            for idx, count in postings.get(term, ()):
+                scores[idx] = scores.get(idx, 0.0) + count * idf[term] ** 2 / norms[idx]
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        for k in ks:
+            found[k] += any(fact in chunks[idx] for idx in ranked[:k])
+    return {k: found[k] / len(facts) for k in ks}
+
+
+def bench_chunking(args):
+    texts, facts = structured_corpus(args.documents, args.size_kb, args.seed)
+    characters = sum(len(text) for text in texts)
+    print(f"{len(texts)} documents, {characters / 1024 / 1024:.1f} MB, {len(facts)} planted facts; "
+          f"token budget {agent.CHUNK_TOKENS}, overlap {agent.CHUNK_OVERLAP_TOKENS}")
+    header = "".join(f"{f'{size:g} MB/s':>10}" for size in args.throughput_mb)
+    recall = "".join(f"{f'recall@{k}':>10}" for k in args.k)
+    print(f"{'strategy':<11}{'chunks':>8}{'redundant':>11}{'tokens':>9}{'max tok':>9}{'shared':>8}{recall}{header}")
+    
+    for strategy in agent.CHUNKERS:
+        chunks, seen, shared = [], set(), 0
+        for text in texts:
+            own = agent.chunk_document(text, strategy=strategy)
+            # Chunks identical to one in another file are summarized and embedded once
+            shared += sum(1 for chunk in own if chunk["hash"] in seen)
+            seen.update(chunk["hash"] for chunk in own)
+            chunks.extend(chunk["text"] for chunk in own)
+        tokens = [agent._count_tokens(chunk) for chunk in chunks]
+        redundant = sum(len(chunk) for chunk in chunks) / characters - 1
+        recalls = _tfidf_recall(chunks, facts, args.k)
+        
+        rates = []
+        for size in args.throughput_mb:
+            sample = ("".join(texts) * int(size * 1024 * 1024 // characters + 1))[:int(size * 1024 * 1024)]
+            _, seconds = _timed(agent.chunk_document, sample, None, None, strategy)
+            rates.append(size / seconds)
+        print(f"{strategy:<11}{len(chunks):>8}{redundant:>11.1%}{sum(tokens):>9}{max(tokens):>9}{shared:>8}"
+              + "".join(f"{recalls[k]:>10.3f}" for k in args.k) + "".join(f"{rate:>10.1f}" for rate in rates))
+    print("\nredundant: overlap text repeated across chunks; shared: chunks reused from another file; "
+          "recall@k: a top-k TF-IDF chunk holds the whole fact")
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="DAM agent benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pii = commands.add_parser("pii", help="PII and corruption scan throughput")
+    pii.add_argument("--size-mb", type=float, default=20.0)
+    pii.add_argument("--seed", type=int, default=7)
+    pii.set_defaults(func=bench_pii)
+    
+    vectors = commands.add_parser("vectors", help="Vector search latency, QPS and recall@k per index")
+    vectors.add_argument("--documents", type=int, default=20000)
+    vectors.add_argument("--chunks-per-doc", type=int, default=4)
+    vectors.add_argument("--queries", type=int, default=200)
+    vectors.add_argument("--k", type=int, default=10)
+    vectors.add_argument("--index", action="append",
+                         help="hnsw[:m=16,ef_construction=64], ivfflat[:lists=N] or none, "
+                              "plus storage=full|halfvec|binary; repeatable")
+    vectors.add_argument("--duplicate-probes", type=int, default=50,
+                         help="near copies run through detect_duplicates per index")
+    vectors.add_argument("--database", default="dam_benchmark")
+    vectors.add_argument("--seed", type=int, default=7)
+    vectors.set_defaults(func=bench_vectors)
+    
+    summaries = commands.add_parser("summaries", help="Chunk summarization throughput against a stub Gemini server")
+    summaries.add_argument("--chunks", type=int, default=200)
+    summaries.add_argument("--latency", type=float, default=0.2, help="stub seconds per request")
+    summaries.add_argument("--per-chunk", type=float, default=0.02, help="stub seconds per chunk in a request")
+    summaries.add_argument("--rate-limited", type=float, default=0.05, help="share of requests answered with 429")
+    summaries.add_argument("--batch-size", type=int, default=agent.SUMMARY_BATCH_SIZE)
+    summaries.add_argument("--concurrency", type=int, default=agent.SUMMARY_CONCURRENCY)
+    summaries.add_argument("--rpm", type=int, default=agent.SUMMARY_RPM)
+    summaries.add_argument("--backoff", type=float, default=0.1, help="retry base delay in seconds")
+    summaries.add_argument("--no-baseline", dest="baseline", action="store_false",
+                           help="skip the one-request-per-chunk baseline")
+    summaries.add_argument("--seed", type=int, default=7)
+    summaries.set_defaults(func=bench_summaries)
+
+    chunking = commands.add_parser("chunking", help="Chunk counts, redundancy, recall and throughput per strategy")
+    chunking.add_argument("--documents", type=int, default=50)
+    chunking.add_argument("--size-kb", type=float, default=40.0, help="approximate size of each document")
+    chunking.add_argument("--k", type=int, action="append", help="recall cut-offs; repeatable (default 1 and 5)")
+    chunking.add_argument("--throughput-mb", type=float, action="append",
+                          help="input sizes timed for MB/s; repeatable (default 1, 4 and 16)")
+    chunking.add_argument("--seed", type=int, default=7)
+    chunking.set_defaults(func=bench_chunking)
+
+    args = parser.parse_args()
+    if args.command == "chunking":
+        args.k = args.k or [1, 5]
+        args.throughput_mb = args.throughput_mb or [1.0, 4.0, 16.0]
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def agent():
+    """The agent module; tests are skipped where its dependencies are not installed"""
+    return pytest.importorskip("agent")
+
+
+@pytest.fixture(scope="session")
+def db(agent):
+    """The agent with its database initialized; skipped when PostgreSQL (PG_* settings) is not reachable"""
+    result = agent.initialize_database()
+    if result["status"] != "success":
+        pytest.skip(f"PostgreSQL not available: {result['message']}")
+    return agent
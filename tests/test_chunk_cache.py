@@ -0,0 +1,52 @@
+import time
+
+
+def _chunks(label, count=3):
+    return [{"chunk_id": number, "text": f"{label} chunk {number} " * 20, "summary": None} for number in range(count)]
+
+
+def test_changed_fingerprint_invalidates(agent):
+    cache = agent._ChunkCache(10 ** 6, 3600)
+    cache.observe("file-a", "2024-01-01|md5-1")
+    cache.put("file-a", _chunks("a"))
+
+    cache.observe("file-a", "2024-01-01|md5-1")
+    assert cache.get("file-a") == _chunks("a")
+    cache.observe("file-a", "2024-02-01|md5-2")
+    assert cache.get("file-a") is None
+    assert cache.stats()["invalidations"] == 1 and cache.bytes_used == 0
+
+
+def test_evicts_least_recently_used_within_byte_budget(agent):
+    size = agent._chunks_nbytes(_chunks("a"))
+    cache = agent._ChunkCache(size * 2 + size // 2, 3600)
+    cache.put("file-a", _chunks("a"))
+    cache.put("file-b", _chunks("b"))
+    cache.get("file-a")
+    cache.put("file-c", _chunks("c"))
+
+    assert cache.get("file-b") is None
+    assert cache.get("file-a") is not None and cache.get("file-c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.bytes_used == sum(agent._chunks_nbytes(_chunks(label)) for label in "ac") <= cache.max_bytes
+
+
+def test_oversized_entry_is_not_cached(agent):
+    cache = agent._ChunkCache(100, 3600)
+    cache.put("file-a", _chunks("a"))
+    assert cache.get("file-a") is None and cache.bytes_used == 0
+
+
+def test_replacing_an_entry_frees_its_bytes(agent):
+    cache = agent._ChunkCache(10 ** 6, 3600)
+    cache.put("file-a", _chunks("a", 5))
+    cache.put("file-a", _chunks("a", 1))
+    assert cache.bytes_used == agent._chunks_nbytes(_chunks("a", 1))
+
+
+def test_expired_entry_misses(agent):
+    cache = agent._ChunkCache(10 ** 6, 0)
+    cache.put("file-a", _chunks("a"))
+    time.sleep(0.01)
+    assert cache.get("file-a") is None
+    assert cache.stats()["files"] == 0 and cache.bytes_used == 0
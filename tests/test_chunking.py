@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+STRUCTURED = ["sentence", "paragraph", "heading"]
+
+
+def _document(seed=3, sections=40):
+    rng = random.Random(seed)
+    words = "invoice payment terms the of and account report quarterly revenue".split()
+    parts = []
+    for number in range(sections):
+        parts.append(f"## Section {number}\n\n")
+        for _ in range(rng.randint(1, 4)):
+            sentences = [
+                " ".join(rng.choice(words) for _ in range(rng.randint(4, 30))).capitalize() + "."
+                for _ in range(rng.randint(1, 6))
+            ]
+            parts.append(" ".join(sentences) + "\n\n")
+        if rng.random() < 0.3:
+            parts.append("".join(f"| {rng.choice(words)} | {rng.randint(1, 999)} |\n" for _ in range(5)) + "\n")
+    return "".join(parts)
+
+
+def _pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _check_positions(text, chunks):
+    assert chunks[0]["start_pos"] == 0
+    assert chunks[-1]["end_pos"] == len(text)
+    for number, chunk in enumerate(chunks):
+        assert chunk["chunk_id"] == number
+        assert chunk["text"] == text[chunk["start_pos"]:chunk["end_pos"]]
+        assert chunk["length"] == chunk["end_pos"] - chunk["start_pos"] > 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Contiguous coverage: no gaps, always moving forward
+        assert previous["start_pos"] < chunk["start_pos"] <= previous["end_pos"]
+
+
+@pytest.mark.parametrize("strategy", ["fixed"] + STRUCTURED)
+@pytest.mark.parametrize("piece_size", [None, 997])
+def test_chunks_cover_text_contiguously(agent, monkeypatch, strategy, piece_size):
+    # Small streaming windows so the structured chunkers cut several of them
+    monkeypatch.setattr(agent, "DOWNLOAD_CHUNK_BYTES", 1)
+    text = _document()
+    pieces = _pieces(text, piece_size) if piece_size else [text]
+    chunk_size = 64 if strategy != "fixed" else None
+    _check_positions(text, list(agent.iter_chunks(pieces, chunk_size, strategy=strategy)))
+
+
+def test_fixed_windows(agent):
+    text = _document()
+    chunks = agent.chunk_document(text, strategy="fixed")
+    assert all(chunk["length"] == 1000 for chunk in chunks[:-1])
+    assert all(b["start_pos"] - a["start_pos"] == 800 for a, b in zip(chunks, chunks[1:]))
+
+
+@pytest.mark.parametrize("strategy", STRUCTURED)
+def test_structured_chunks_touch_within_budget(agent, monkeypatch, strategy):
+    monkeypatch.setattr(agent, "DOWNLOAD_CHUNK_BYTES", 1)
+    text = _document()
+    chunks = list(agent.iter_chunks(_pieces(text, 997), 64, 0, strategy=strategy))
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["start_pos"] == previous["end_pos"]
+        # Never cut inside a word
+        assert text[chunk["start_pos"] - 1].isspace()
+    assert all(agent._count_tokens(chunk["text"]) <= 64 for chunk in chunks)
+
+
+@pytest.mark.parametrize("strategy", STRUCTURED)
+def test_structured_overlap_repeats_whole_units(agent, strategy):
+    text = _document()
+    chunks = agent.chunk_document(text, 64, 16, strategy=strategy)
+    _check_positions(text, chunks)
+    assert any(b["start_pos"] < a["end_pos"] for a, b in zip(chunks, chunks[1:]))
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["start_pos"] == 0 or text[chunk["start_pos"] - 1].isspace()
+        assert agent._count_tokens(text, chunk["start_pos"], previous["end_pos"]) <= 16
+    assert all(agent._count_tokens(chunk["text"]) <= 64 for chunk in chunks)
+
+
+def test_heading_chunks_start_at_headings(agent):
+    text = _document()
+    starts = {chunk["start_pos"] for chunk in agent.chunk_document(text, 64, 0, strategy="heading")}
+    headings = [m.start() for m in agent._CHUNK_BOUNDARIES["heading"].finditer(text)]
+    assert headings and all(position in starts for position in headings)
+
+
+def test_unknown_strategy(agent):
+    with pytest.raises(ValueError):
+        agent.chunk_document("text", strategy="semantic")
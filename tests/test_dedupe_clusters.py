@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+THRESHOLD = 0.85
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _corpus(dim=64, seed=7):
+    rng = np.random.default_rng(seed)
+    rows = list(rng.normal(size=(40, dim)))
+    # Near copies of a few documents, placed after their originals
+    for original in (3, 11, 11, 25):
+        rows.append(rows[original] + rng.normal(scale=0.05, size=dim))
+    # A chain at 25° steps: neighbours match (cos 0.906), the ends do not (cos 0.643)
+    for angle in np.radians([0, 25, 50]):
+        row = np.zeros(dim)
+        row[:2] = np.cos(angle), np.sin(angle)
+        rows.append(row)
+    return _unit(rows)
+
+
+def _brute_force(matrix):
+    similarity = matrix @ matrix.T
+    count = len(matrix)
+    pairs = [(i, j) for i in range(count) for j in range(i + 1, count) if similarity[i, j] >= THRESHOLD]
+    roots = list(range(count))
+    for i, j in pairs:
+        a, b = roots[i], roots[j]
+        roots = [min(a, b) if root in (a, b) else root for root in roots]
+    best = np.zeros(count, dtype=np.float32)
+    for i, j in pairs:
+        best[i] = max(best[i], similarity[i, j])
+        best[j] = max(best[j], similarity[i, j])
+    return np.array(roots), best, len(pairs)
+
+
+@pytest.mark.parametrize("block_rows", [1, 5, 16, 1000])
+def test_blocked_clusters_match_brute_force(agent, block_rows):
+    matrix = _corpus()
+    roots, best, pairs = agent._cluster_similar(matrix, THRESHOLD, block_rows)
+    expected_roots, expected_best, expected_pairs = _brute_force(matrix)
+    np.testing.assert_array_equal(roots, expected_roots)
+    np.testing.assert_allclose(best, expected_best, atol=1e-5)
+    assert pairs == expected_pairs
+
+
+def test_clusters_root_at_oldest_document(agent):
+    matrix = _corpus()
+    roots, _, _ = agent._cluster_similar(matrix, THRESHOLD, 8)
+    assert list(roots[:40]) == list(range(40))
+    assert list(roots[40:44]) == [3, 11, 11, 25]
+    # The chain ends are joined through the middle document
+    assert list(roots[44:]) == [44, 44, 44]
+
+
+def test_union_pairs_handles_contended_roots(agent):
+    parent = np.arange(6)
+    # Every pair writes root 5's parent in the same round
+    agent._union_pairs(parent, np.array([0, 1, 2, 3, 4]), np.array([5, 5, 5, 5, 5]))
+    assert set(agent._find_roots(parent, np.arange(6))) == {0}
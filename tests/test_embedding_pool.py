@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+
+def _axis(agent, index, scale=1.0):
+    vector = np.zeros(agent.EMBEDDING_DIM, dtype=np.float32)
+    vector[index] = scale
+    return vector
+
+
+def _expected(agent, weights):
+    total = sum(weight * _axis(agent, index) for index, weight in weights.items())
+    return total / np.linalg.norm(total)
+
+
+def test_chunks_weighted_by_length(agent):
+    pooled = agent._EmbeddingPool().add([_axis(agent, 0), _axis(agent, 1)], [0, 30], [30, 40]).finish()
+    np.testing.assert_allclose(pooled, _expected(agent, {0: 30, 1: 10}), atol=1e-6)
+
+
+def test_overlap_counts_once(agent):
+    # The second chunk repeats 10 characters of the first and adds 10 new ones
+    pooled = agent._EmbeddingPool().add([_axis(agent, 0), _axis(agent, 1)], [0, 20], [30, 40]).finish()
+    np.testing.assert_allclose(pooled, _expected(agent, {0: 30, 1: 10}), atol=1e-6)
+
+
+def test_embeddings_are_normalized_before_weighting(agent):
+    pooled = agent._EmbeddingPool().add([_axis(agent, 0, 50.0), _axis(agent, 1, 0.1)], [0, 10], [10, 20]).finish()
+    np.testing.assert_allclose(pooled, _expected(agent, {0: 1, 1: 1}), atol=1e-6)
+
+
+def test_blocks_pool_like_one_call(agent):
+    rng = np.random.default_rng(5)
+    embeddings = rng.normal(size=(6, agent.EMBEDDING_DIM)).astype(np.float32)
+    starts, ends = [0, 80, 150, 190, 300, 310], [100, 200, 240, 320, 360, 400]
+    whole = agent._EmbeddingPool().add(embeddings, starts, ends).finish()
+    pool = agent._EmbeddingPool()
+    for block in (slice(0, 2), slice(2, 5), slice(5, 6)):
+        pool.add(embeddings[block], starts[block], ends[block])
+    np.testing.assert_allclose(pool.finish(), whole, atol=1e-5)
+
+
+def test_failed_embeddings_carry_no_weight(agent):
+    zero = np.zeros(agent.EMBEDDING_DIM, dtype=np.float32)
+    pooled = agent._EmbeddingPool().add([zero, _axis(agent, 2)], [0, 100], [100, 110]).finish()
+    np.testing.assert_allclose(pooled, _axis(agent, 2), atol=1e-6)
+    assert agent._EmbeddingPool().add([zero], [0], [10]).finish() is None
+    assert agent._EmbeddingPool().add_chunks([]).finish() is None
+
+
+@pytest.mark.parametrize("length, pooled", [(4000, False), (6000, True)])
+def test_only_chunked_documents_pool_cached_chunks(agent, monkeypatch, length, pooled):
+    # Chunks cached for an older, longer version of the file
+    stale = [{"chunk_id": 0, "start_pos": 0, "end_pos": 6000, "embedding": _axis(agent, 0)}]
+    monkeypatch.setattr(agent.CHUNK_CACHE, "get", lambda file_id: stale)
+    monkeypatch.setattr(agent, "generate_embeddings", lambda texts: [_axis(agent, 1) for _ in texts])
+    embedding = agent._document_embedding("pool-test", "x" * length)
+    np.testing.assert_allclose(embedding, _axis(agent, 0 if pooled else 1))
+
+
+def test_file_no_longer_chunked_drops_stored_chunks(db, monkeypatch):
+    file_id = "pool-test-shrunk"
+    chunks = [{"chunk_id": number, "text": f"chunk {number}", "summary": None, "embedding": _axis(db, number),
+               "start_pos": number * 10, "end_pos": number * 10 + 10} for number in range(3)]
+    with db._db_cursor() as cursor:
+        db._bulk_upsert_chunks(cursor, file_id, "shrunk.txt", chunks)
+
+    monkeypatch.setattr(db, "download_file_content",
+                        lambda file_id: {"status": "success", "full_content": "Now a short note. " * 10})
+    state = {"file_info": {"id": file_id, "name": "shrunk.txt", "size_bytes": "180"}, "duplicate_of": None}
+    try:
+        assert db._job_summarize(state)["chunks_created"] == 0
+        with db._db_cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM document_chunks WHERE file_id = %s;", (file_id,))
+            assert cursor.fetchone()[0] == 0
+    finally:
+        db._drop_chunks(file_id)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def documents(db):
+    ids = ["exact-test-a", "exact-test-b"]
+    yield ids
+    with db._db_cursor() as cursor:
+        db._drop_index_rows(cursor, ids)
+
+
+def test_concurrent_identical_copy_reported_as_exact_duplicate(db, documents, monkeypatch):
+    content = "Quarterly revenue report for the finance team. " * 20
+    embedding = np.ones(db.EMBEDDING_DIM, dtype=np.float32)
+    first = db._detect_duplicates(documents[0], content, "a.txt", embedding=embedding)
+    assert first["status"] == "success"
+
+    # The second worker checked for an identical copy before the first one inserted
+    lookup = db._exact_duplicate_of
+    calls = []
+
+    def stale_lookup(file_id, content_hash):
+        calls.append(file_id)
+        return None if len(calls) == 1 else lookup(file_id, content_hash)
+
+    monkeypatch.setattr(db, "_exact_duplicate_of", stale_lookup)
+    second = db._detect_duplicates(documents[1], content, "b.txt", embedding=embedding)
+
+    assert second["status"] == "success" and second["exact_match"]
+    assert second["details"][0]["duplicate_file_id"] == documents[0]
+    with db._db_cursor() as cursor:
+        cursor.execute("SELECT file_id FROM documents WHERE file_id = ANY(%s);", (documents,))
+        assert cursor.fetchall() == [(documents[0],)]
+
+
+def test_near_empty_content_is_never_an_exact_duplicate(agent):
+    assert agent._content_hash("   \n ") is None
+    assert agent._content_hash("tiny") is None
+    assert agent._content_hash("long enough text") == agent._content_hash("long enough text")
@@ -0,0 +1,82 @@
+import pytest
+
+
+class _Request:
+    def __init__(self, value):
+        self.value = value
+
+    def execute(self):
+        return self.value
+
+
+class _FakeDrive:
+    """files().list / files().get and a Changes API with an empty change log"""
+
+    def __init__(self, files):
+        self.by_id = {f["id"]: f for f in files}
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return self
+
+    def list(self, pageSize=None, pageToken=None, fields=None, **kwargs):
+        if fields.startswith("nextPageToken, newStartPageToken"):
+            return _Request({"changes": [], "newStartPageToken": "1"})
+        return _Request({"files": list(self.by_id.values())})
+
+    def get(self, fileId, fields=None):
+        return _Request(self.by_id[fileId])
+
+    def getStartPageToken(self):
+        return _Request({"startPageToken": "1"})
+
+
+def _drive_file(file_id):
+    return {"id": file_id, "name": f"{file_id}.txt", "mimeType": "text/plain", "size": "100",
+            "createdTime": "2024-01-01T00:00:00Z", "modifiedTime": "2024-01-02T00:00:00Z",
+            "md5Checksum": f"md5-{file_id}"}
+
+
+@pytest.fixture
+def sync(db, monkeypatch):
+    """Incremental sync over a fake Drive, with processing stubbed to fail the files in `failing`"""
+    ids = ["sync-test-ok", "sync-test-flaky"]
+    with db._db_cursor() as cursor:
+        cursor.execute("SELECT name, value FROM drive_sync_state;")
+        saved = cursor.fetchall()
+        cursor.execute("DELETE FROM drive_sync_state;")
+
+    processed, failing = [], {"sync-test-flaky"}
+
+    def process(files):
+        processed.append([f["id"] for f in files])
+        db._record_fingerprints([f for f in files if f["id"] not in failing])
+        return [{"file": f["name"]} for f in files]
+
+    monkeypatch.setattr(db, "DRIVE_SERVICE", _FakeDrive([_drive_file(file_id) for file_id in ids]))
+    monkeypatch.setattr(db, "_process_files_sequentially", process)
+    yield processed, failing
+
+    with db._db_cursor() as cursor:
+        cursor.execute("DELETE FROM file_fingerprints WHERE file_id = ANY(%s);", (ids,))
+        cursor.execute("DELETE FROM drive_sync_state;")
+        for name, value in saved:
+            cursor.execute("INSERT INTO drive_sync_state (name, value) VALUES (%s, %s);", (name, value))
+
+
+def test_failed_file_is_retried_by_next_run(db, sync):
+    processed, failing = sync
+    assert db.process_all_files(incremental=True)["sync_mode"] == "full"
+    assert sorted(processed[-1]) == ["sync-test-flaky", "sync-test-ok"]
+
+    # The change log past the saved token is empty, yet the failed file comes back
+    assert db.process_all_files(incremental=True)["sync_mode"] == "changes"
+    assert processed[-1] == ["sync-test-flaky"]
+
+    failing.clear()
+    db.process_all_files(incremental=True)
+    assert processed[-1] == ["sync-test-flaky"]
+    db.process_all_files(incremental=True)
+    assert processed[-1] == []
@@ -0,0 +1,76 @@
+import pytest
+
+
+@pytest.fixture
+def run(db):
+    files = [{"id": f"queue-test-{i}", "name": f"queue-test-{i}.txt", "type": "text/plain"} for i in range(3)]
+    run_id = db._enqueue_run({"status": "success", "files": files})
+    yield run_id
+    with db._db_cursor() as cursor:
+        cursor.execute("DELETE FROM ingest_jobs WHERE run_id = %s;", (run_id,))
+        cursor.execute("DELETE FROM ingest_runs WHERE run_id = %s;", (run_id,))
+
+
+def _expire_lease(agent, run_id, file_id):
+    with agent._db_cursor() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs SET heartbeat = now() - %s * interval '1 second'
+            WHERE run_id = %s AND file_id = %s AND status = 'running';
+        """, (agent.JOB_LEASE_SECONDS + 60, run_id, file_id))
+
+
+def _statuses(agent, run_id, file_id):
+    with agent._db_cursor() as cursor:
+        cursor.execute("""
+            SELECT status FROM ingest_jobs WHERE run_id = %s AND file_id = %s ORDER BY step;
+        """, (run_id, file_id))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_claims_follow_listing_order_without_double_claims(db, run):
+    claimed = [db._claim_job(run, f"worker-{i}") for i in range(4)]
+    assert [job["file_id"] for job in claimed[:3]] == [f"queue-test-{i}" for i in range(3)]
+    assert all(job["step"] == 0 for job in claimed[:3])
+    # Every file's next stage waits for its first
+    assert claimed[3] is None
+
+
+def test_expired_lease_is_reclaimed(db, run):
+    job = db._claim_job(run, "worker-a", "queue-test-0", 0)
+    assert db._claim_job(run, "worker-b", "queue-test-0", 0) is None
+
+    _expire_lease(db, run, "queue-test-0")
+    reclaimed = db._claim_job(run, "worker-b", "queue-test-0", 0)
+    assert reclaimed["attempts"] == job["attempts"] + 1
+
+    # The first worker lost its lease, so only the second one's outcome counts
+    assert not db._complete_job(run, job, "worker-a", {}, finished=False)
+    assert db._complete_job(run, reclaimed, "worker-b", {}, finished=False)
+    assert db._claim_job(run, "worker-a", "queue-test-0", 1)["stage"] == "embed"
+
+
+def test_live_lease_is_not_expired(db, run):
+    db._claim_job(run, "worker-a", "queue-test-0", 0)
+    assert db._expire_jobs(run) == 9
+    assert _statuses(db, run, "queue-test-0") == ["running", "pending", "pending"]
+
+
+def test_lease_expiry_on_last_attempt_fails_file(db, run, monkeypatch):
+    monkeypatch.setattr(db, "JOB_MAX_ATTEMPTS", 1)
+    db._claim_job(run, "worker-a", "queue-test-0", 0)
+    _expire_lease(db, run, "queue-test-0")
+
+    assert db._claim_job(run, "worker-b", "queue-test-0", 0) is None
+    assert db._expire_jobs(run) == 6
+    assert _statuses(db, run, "queue-test-0") == ["failed", "failed", "failed"]
+
+
+def test_failed_attempt_is_retried_then_given_up(db, run, monkeypatch):
+    monkeypatch.setattr(db, "JOB_MAX_ATTEMPTS", 2)
+    for attempt in (1, 2):
+        job = db._claim_job(run, "worker-a", "queue-test-1", 0)
+        assert job["attempts"] == attempt
+        db._fail_job(run, job, "worker-a", "download failed")
+
+    assert db._claim_job(run, "worker-a", "queue-test-1", 0) is None
+    assert _statuses(db, run, "queue-test-1") == ["failed", "failed", "failed"]
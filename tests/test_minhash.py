@@ -0,0 +1,63 @@
+import random
+
+import numpy as np
+import pytest
+
+
+def _words(seed, count):
+    rng = random.Random(seed)
+    vocabulary = [f"word{number}" for number in range(2000)]
+    return [rng.choice(vocabulary) for _ in range(count)]
+
+
+def _shingles(words, k):
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+def _estimate(a, b):
+    return float((a == b).mean())
+
+
+@pytest.mark.parametrize("piece_size", [1, 7, 64, 1000])
+def test_pieces_hash_like_whole_text(agent, piece_size):
+    text = "  Invoice\tpayment terms\n\nfor the Quarterly   report " + " ".join(_words(1, 300)) + " end"
+    hasher = agent._MinHasher()
+    for start in range(0, len(text), piece_size):
+        hasher.update(text[start:start + piece_size])
+    np.testing.assert_array_equal(hasher.finish(), agent._minhash_signature(text))
+
+
+def test_case_and_spacing_do_not_matter(agent):
+    text = " ".join(_words(2, 200))
+    np.testing.assert_array_equal(agent._minhash_signature(text.upper()),
+                                  agent._minhash_signature("\n  ".join(text.split())))
+
+
+def test_text_without_words_has_no_signature(agent):
+    assert agent._minhash_signature("") is None
+    assert agent._minhash_signature(" \n\t ") is None
+    # Shorter than a shingle, but still has one
+    assert agent._minhash_signature("two words") is not None
+
+
+@pytest.mark.parametrize("changed", [0.05, 0.3, 0.7])
+def test_estimate_tracks_shingle_jaccard(agent, changed):
+    original = _words(3, 2000)
+    edited = list(original)
+    rng = random.Random(4)
+    for index in rng.sample(range(len(edited)), int(len(edited) * changed / agent.MINHASH_SHINGLE_WORDS)):
+        edited[index] = "edited"
+    a, b = _shingles(original, agent.MINHASH_SHINGLE_WORDS), _shingles(edited, agent.MINHASH_SHINGLE_WORDS)
+    jaccard = len(a & b) / len(a | b)
+    estimate = _estimate(agent._minhash_signature(" ".join(original)), agent._minhash_signature(" ".join(edited)))
+    assert abs(estimate - jaccard) < 0.15
+
+
+def test_lsh_buckets_pair_near_duplicates_only(agent):
+    original = _words(5, 1000)
+    near = original[:980] + ["appendix"] * 20
+    unrelated = _words(6, 1000)
+    buckets = set(agent._lsh_buckets(agent._minhash_signature(" ".join(original))))
+    assert len(buckets) == agent.MINHASH_BANDS
+    assert buckets & set(agent._lsh_buckets(agent._minhash_signature(" ".join(near))))
+    assert not buckets & set(agent._lsh_buckets(agent._minhash_signature(" ".join(unrelated))))
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+
+def _counts(scan):
+    return {kind: found["count"] for kind, found in scan["pii"].items()}, scan["luhn_rejected"]
+
+
+def _streamed_scan(agent, text, pieces=1, strategy="fixed"):
+    """Scan chunk by chunk over each chunk's owned span, as streaming ingest does"""
+    size = -(-len(text) // pieces)
+    scan = agent._scan_content("")
+    before = previous = None
+    for chunk in agent.iter_chunks([text[i:i + size] for i in range(0, len(text), size)], strategy=strategy):
+        if previous is not None:
+            agent._scan_chunk(scan, previous, before, chunk)
+        before, previous = previous, chunk
+    if previous is not None:
+        agent._scan_chunk(scan, previous, before)
+    return scan
+
+
+def _filler(rng, length):
+    words = "invoice payment the of and account report".split()
+    text = ""
+    while len(text) < length:
+        text += rng.choice(words) + " "
+    return text[:length - 1] + " "
+
+
+def test_match_straddling_ownership_boundary(agent):
+    # Fixed chunks 8 and 9 share [7200, 7400); ownership switches at 7300
+    rng = random.Random(0)
+    for shift in range(-20, 20):
+        start = 7300 + shift
+        text = (_filler(rng, start) + "1234 5678 9012 3456 4111 1111 1111 1111 "
+                + _filler(rng, 3000))
+        whole = _counts(agent._scan_content(text))
+        assert _counts(_streamed_scan(agent, text)) == whole, f"number at {start}"
+        assert whole[0]["credit_card"] >= 1
+
+
+@pytest.mark.parametrize("strategy", ["fixed", "sentence", "paragraph", "heading"])
+def test_streamed_scan_matches_whole_text(agent, strategy):
+    rng = random.Random(7)
+    parts = []
+    for _ in range(3000):
+        roll = rng.random()
+        if roll < 0.03:
+            parts.append(f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}")
+        elif roll < 0.05:
+            parts.append(" ".join(str(rng.randint(1000, 9999)) for _ in range(rng.choice((4, 5, 8)))))
+        elif roll < 0.06:
+            parts.append(f"user{rng.randint(1, 99)}@example.com")
+        elif roll < 0.08:
+            parts.append(".\n\n")
+        else:
+            parts.append(rng.choice(("invoice", "payment", "the", "account")))
+    text = " ".join(parts)
+    assert _counts(_streamed_scan(agent, text, pieces=7, strategy=strategy)) == _counts(agent._scan_content(text))
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+
+def _result(name):
+    return {"status": "success", "results": [name]}
+
+
+def test_hit_only_at_stored_version(agent):
+    cache = agent._SearchCache(4)
+    cache.put(("chunk", "q"), 1, _result("a"))
+    assert cache.get(("chunk", "q"), 1) == _result("a")
+
+    # A newer corpus version drops the entry for good
+    assert cache.get(("chunk", "q"), 2) is None
+    assert cache.get(("chunk", "q"), 1) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stale"], stats["entries"]) == (1, 2, 1, 0)
+
+
+def test_evicts_least_recently_used(agent):
+    cache = agent._SearchCache(2)
+    cache.put("a", 1, _result("a"))
+    cache.put("b", 1, _result("b"))
+    cache.get("a", 1)
+    cache.put("c", 1, _result("c"))
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == _result("a") and cache.get("c", 1) == _result("c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_stores_nothing(agent):
+    cache = agent._SearchCache(0)
+    cache.put("a", 1, _result("a"))
+    assert cache.get("a", 1) is None and cache.stats()["entries"] == 0
+
+
+def test_version_is_reread_after_ttl(agent):
+    cache = agent._SearchCache(4, version_ttl=0.05)
+    versions = iter([1, 2, 3])
+    assert cache.version(lambda: next(versions)) == 1
+    assert cache.version(lambda: next(versions)) == 1
+    time.sleep(0.06)
+    assert cache.version(lambda: next(versions)) == 2
+    cache.clear()
+    assert cache.version(lambda: next(versions)) == 3
+    assert cache.stats()["version_reads"] == 3
+
+
+@pytest.fixture
+def search_cache(agent, monkeypatch):
+    cache = agent._SearchCache(4, version_ttl=60)
+    monkeypatch.setattr(agent, "SEARCH_CACHE", cache)
+    monkeypatch.setattr(agent, "DB_POOL", object())
+    return cache
+
+
+def test_cached_search_hits_make_no_database_call(agent, search_cache, monkeypatch):
+    reads, searches = [], []
+    monkeypatch.setattr(agent, "_read_corpus_version", lambda: reads.append(1) or 7)
+
+    def search(query, limit, **options):
+        searches.append(query)
+        return _result(query)
+
+    first = agent._cached_search("chunk", search, "Quarterly  Report", 5, mode="vector")
+    second = agent._cached_search("chunk", search, "quarterly report", 5, mode="vector")
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["query"] == "quarterly report"
+    assert searches == ["Quarterly  Report"] and len(reads) == 1
+
+
+def test_cached_search_runs_uncached_when_version_unreadable(agent, search_cache, monkeypatch):
+    def unreadable():
+        raise RuntimeError("connection refused")
+
+    monkeypatch.setattr(agent, "_read_corpus_version", unreadable)
+    assert agent._cached_search("chunk", lambda query, limit: _result(query), "q", 5) == _result("q")
+    assert search_cache.stats()["entries"] == 0
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import re
+import time
+
+import pytest
+
+
+class _Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModel:
+    """Fails with the given errors in turn, then summarizes every chunk in the prompt"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.prompts = []
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls += 1
+        self.prompts.append(prompt)
+        if self.errors:
+            raise self.errors.pop(0)
+        ids = re.findall(r'<chunk id="(\d+)">', prompt)
+        return _Reply(json.dumps([{"id": int(i), "summary": f"summary {i}"} for i in ids]))
+
+
+class _ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+@pytest.fixture
+def engine(agent, monkeypatch):
+    monkeypatch.setattr(agent, "EMBEDDING_CACHE_DIR", "")
+    monkeypatch.setattr(agent, "PERSISTENT_CACHE", None)
+
+    def make(model):
+        summarizer = agent._SummaryEngine(batch_size=8, concurrency=2, rpm=60000, tpm=10 ** 9,
+                                          max_retries=5, backoff=0.001)
+        summarizer._start()
+        summarizer._model = model
+        return summarizer
+    return make
+
+
+@pytest.mark.parametrize("error", [
+    Exception("400 API key not valid. Please pass a valid API key."),
+    _ApiError(403, "Permission denied"),
+    _ApiError(400, "Request contains an invalid argument"),
+])
+def test_permanent_errors_fall_back_without_retrying(engine, error):
+    model = _FakeModel(*[error] * 10)
+    summarizer = engine(model)
+    texts = [f"chunk {i} " * 30 for i in range(16)]
+    assert summarizer.summarize(texts) == [text[:200] for text in texts]
+    # One request per batch, no retries
+    assert model.calls == 2
+    assert summarizer.stats["retries"] == 0
+    assert summarizer.stats["fallbacks"] == 16
+
+
+@pytest.mark.parametrize("error", [
+    _ApiError(429, "Resource has been exhausted (e.g. check quota)."),
+    Exception("429 RESOURCE_EXHAUSTED"),
+    _ApiError(503, "The service is currently unavailable"),
+    Exception("500 An internal error has occurred"),
+    TimeoutError("read timed out"),
+    ConnectionError("connection reset by peer"),
+])
+def test_transient_errors_are_retried(engine, error):
+    model = _FakeModel(error)
+    summarizer = engine(model)
+    assert summarizer.summarize(["only chunk"]) == ["summary 0"]
+    assert model.calls == 2
+    assert summarizer.stats["retries"] == 1
+
+
+def test_missing_ids_are_asked_for_again(engine):
+    class Forgetful(_FakeModel):
+        def generate_content(self, prompt, generation_config=None):
+            reply = json.loads(super().generate_content(prompt, generation_config).text)
+            return _Reply(json.dumps(reply[1:] if self.calls == 1 else reply))
+
+    model = Forgetful()
+    summarizer = engine(model)
+    assert summarizer.summarize(["first", "second", "third"]) == ["summary 0", "summary 1", "summary 2"]
+    assert model.calls == 2 and summarizer.stats["retries"] == 1
+    # The retry only asks for the chunk the first reply left out
+    assert re.findall(r'<chunk id="(\d+)">', model.prompts[-1]) == ["0"]
+
+
+def test_failed_summaries_without_fallback(engine):
+    summarizer = engine(_FakeModel(Exception("400 API key not valid")))
+    assert summarizer.summarize(["only chunk"], fallback=False) == [None]
+
+
+def test_error_classification(agent):
+    assert agent._is_transient(_ApiError(504, "Deadline exceeded"))
+    assert agent._is_transient(Exception("503 UNAVAILABLE"))
+    assert not agent._is_transient(_ApiError(404, "models/unknown is not found"))
+    assert not agent._is_transient(ValueError("response was blocked"))
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ('[{"id": 0, "summary": "a"}, {"id": 1, "summary": "b"}]', {0: "a", 1: "b"}),
+    ('```json\n[{"id": "1", "summary": " b "}]\n```', {1: "b"}),
+    ('{"summaries": [{"id": 0, "summary": "a"}]}', {0: "a"}),
+    ('{"id": 1, "summary": "b"}', {1: "b"}),
+    # Unknown, malformed and empty entries are dropped
+    ('[{"id": 7, "summary": "x"}, {"id": "one", "summary": "x"}, {"id": 0, "summary": ""}, "text"]', {}),
+])
+def test_parse_summaries(agent, reply, expected):
+    assert agent._parse_summaries(reply, [0, 1]) == expected
+
+
+def test_parse_plain_text_only_for_a_single_chunk(agent):
+    assert agent._parse_summaries("  A short summary.\n", [4]) == {4: "A short summary."}
+    with pytest.raises(ValueError):
+        agent._parse_summaries("A short summary.", [0, 1])
+
+
+def test_token_bucket_allows_one_second_burst_then_paces(agent):
+    async def timed(bucket, count, cost=1.0):
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire(cost)
+        return time.monotonic() - started
+
+    bucket = agent._TokenBucket(600)
+    assert asyncio.run(timed(bucket, 10)) < 0.05
+    assert 0.25 < asyncio.run(timed(bucket, 3)) < 1.0
+    # A cost above the burst is capped instead of waiting forever
+    assert asyncio.run(timed(agent._TokenBucket(600), 1, cost=10 ** 6)) < 0.05
+
+
+def test_token_bucket_pause_holds_callers(agent):
+    async def acquire_after_pause():
+        bucket = agent._TokenBucket(6000)
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert 0.15 < asyncio.run(acquire_after_pause()) < 1.0
+
+
+@pytest.fixture
+def lazy_chunks(db):
+    file_id = "lazy-test"
+    chunks = [{"chunk_id": number, "text": f"Chunk {number} of the quarterly report. " * 10, "summary": None,
+               "start_pos": number * 400, "end_pos": number * 400 + 400} for number in range(2)]
+    with db._db_cursor() as cursor:
+        db._bulk_upsert_chunks(cursor, file_id, "lazy.txt", chunks)
+    yield [{"file_id": file_id, "chunk_id": chunk["chunk_id"], "summary": None} for chunk in chunks], chunks
+    db._drop_chunks(file_id)
+
+
+def _stored_summaries(agent, file_id):
+    with agent._db_cursor() as cursor:
+        cursor.execute("SELECT summary FROM document_chunks WHERE file_id = %s ORDER BY chunk_id;", (file_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_lazy_fill_stores_only_real_summaries(db, lazy_chunks, monkeypatch):
+    results, chunks = lazy_chunks
+    # The first chunk is summarized, the second falls back
+    monkeypatch.setattr(db.SUMMARY_ENGINE, "summarize",
+                        lambda texts, fallback=True: ["real summary", texts[1][:200] if fallback else None])
+    db._fill_lazy_summaries(results)
+    assert [result["summary"] for result in results] == ["real summary", chunks[1]["text"][:200]]
+    assert _stored_summaries(db, "lazy-test") == ["real summary", None]
+
+
+def test_lazy_fill_failure_keeps_results(db, lazy_chunks, monkeypatch):
+    results, _ = lazy_chunks
+
+    def unavailable(texts, fallback=True):
+        raise RuntimeError("summarizer unavailable")
+
+    monkeypatch.setattr(db.SUMMARY_ENGINE, "summarize", unavailable)
+    db._fill_lazy_summaries(results)
+    assert [result["summary"] for result in results] == [None, None]
+    assert _stored_summaries(db, "lazy-test") == [None, None]